@@ -1,30 +1,152 @@
 import os
+import argparse
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.vectorstores import Chroma
-from langchain_text_splitters import CharacterTextSplitter
+from langchain_core.documents import Document
 from dotenv import load_dotenv
+from index_manifest import (load_manifest, save_manifest, file_hash, chunk_hash, file_unchanged,
+                            diff_chunks, removed_files, record_file, forget_file)
+from embedding_cache import CachedEmbeddings, get_cache
+from pdf_parallel import parallel_extract, iter_file_results, pdf_page_count, DEFAULT_WORKERS
+from pdf_stream import iter_pdf_pages, iter_token_chunks
+from dedup import NearDuplicateFilter
+from sparse_index import SparseIndexStore
+from retrieval_cache import bump_index_version
 load_dotenv()
 
+PERSIST_DIRECTORY = "db1"
+MANIFEST_PATH = "db1_manifest.json"
+SPARSE_PATH = "db1_bm25.json"  # BM25 index fused into retrieval by chat.py (sparse_index.py)
+ADD_BATCH_SIZE = 100  # chunks sent to Chroma per add_documents call
+
+
+# Chunks of pages start..stop-1 as Documents, read one page at a time (pdf_stream.py).
+# Whole sentences are packed into chunks of up to 256 tokens (iter_token_chunks) instead of
+# 225-char windows. Metadata keeps PyPDFLoader's layout: 0-based "page", and "start_index"
+# is the chunk's offset within its page.
+def iter_page_documents(path, start=0, stop=None):
+    total_pages=pdf_page_count(path)
+    for number, text in iter_pdf_pages(path, start, stop):
+        for chunk in iter_token_chunks([(number - 1, text.strip())]):
+            yield Document(
+                page_content=chunk["text"],
+                metadata={"source": path, "page": number - 1, "total_pages": total_pages,
+                          "start_index": chunk["offset"]},
+            )
+
+# Worker for pdf_parallel: one task's pages (at most PAGES_PER_TASK) go back to the parent as a list
+def chunk_page_range(path, start, stop):
+    return list(iter_page_documents(path, start, stop))
 
 def chunking(path):
-    loader=PyPDFLoader(path)
-    text_splitter = CharacterTextSplitter(
-        chunk_size=225,
-        chunk_overlap=50,
-    )
-    pages=loader.load_and_split(text_splitter)
-    print(len(pages))
-    return pages
-    
-
-cwd=os.getcwd()
-doc=os.path.join(cwd,'IQ_TechMax')
-
-data=[]
-for i in os.listdir(doc):
-    page=chunking(os.path.join(doc,i))
-    data.extend(page)
-
-embeddings=GoogleGenerativeAIEmbeddings(model='models/embedding-001')
-vectordb=Chroma.from_documents(data,embeddings,persist_directory="db1")
+    return iter_page_documents(path)
+
+
+# Only new or changed chunks are embedded, chunks that disappeared are deleted.
+# Chunk ids follow trailvector.py: f"{file}-{i}"
+# Parsing is spread over `workers` processes; chunks are still added in file and page order.
+# Near-duplicates of chunks already in the db are skipped (dedup.py, same manifest keys as trailvector.py).
+# `embeddings` replaces the Gemini embeddings (bench_ingest.py points it at fake_servers.py).
+def build_vector_db(doc, incremental=True, manifest_path=MANIFEST_PATH, workers=DEFAULT_WORKERS, dedup=True,
+                    embeddings=None, persist_directory=PERSIST_DIRECTORY, sparse_path=SPARSE_PATH):
+    embeddings=CachedEmbeddings(embeddings or GoogleGenerativeAIEmbeddings(model='models/embedding-001'), 'models/embedding-001')
+    vectordb=Chroma(persist_directory=persist_directory,embedding_function=embeddings)
+    sparse=SparseIndexStore(sparse_path)
+    manifest=load_manifest(manifest_path) if incremental else {"files": {}}
+    pdf_files=sorted(f for f in os.listdir(doc) if f.lower().endswith(".pdf"))
+    duplicate_filter=NearDuplicateFilter(manifest.get("minhash"), manifest.get("duplicates")) if dedup else None
+
+    # Files holding duplicates of deleted or changed chunks are processed again; returns those files
+    def forget_chunks(ids):
+        if duplicate_filter is None:
+            return set()
+        orphans=duplicate_filter.remove(ids) | duplicate_filter.take_orphans()
+        stale_files={vid.rsplit("-", 1)[0] for vid in orphans}
+        for stale_file in stale_files:
+            entry=manifest["files"].get(stale_file)
+            if entry:
+                entry["hash"]=None
+        manifest["minhash"], manifest["duplicates"]=duplicate_filter.to_manifest()
+        return stale_files
+
+    removed=removed_files(manifest, pdf_files)
+    for file, ids in removed.items():
+        print(f"{file} was removed, deleting {len(ids)} chunks")
+        vectordb.delete(ids=ids)
+        sparse.delete(ids)
+        forget_file(manifest, file)
+        forget_chunks(ids)
+    if removed:
+        bump_index_version("chroma", persist_directory)  # drops cached retrievals (retrieval_cache.py)
+
+    changed={}
+    for file in pdf_files:
+        path=os.path.join(doc,file)
+        current_hash=file_hash(path)
+        if file_unchanged(manifest, file, current_hash):
+            print(f"{file} unchanged, skipping")
+            continue
+        changed[path]=(file, current_hash)
+
+    results=parallel_extract(list(changed), workers, task=chunk_page_range, count_pages=pdf_page_count)
+    for path, chunks in iter_file_results(results):
+        file, current_hash=changed[path]
+        known=manifest["files"].get(file, {}).get("chunks", {})
+        chunk_hashes={}
+        new_pages, new_ids=[], []
+        added=0
+        duplicates=0
+        for i, page in enumerate(chunks):
+            vid=f"{file}-{i}"
+            text_hash=chunk_hash(page.page_content)
+            if known.get(vid)!=text_hash:
+                if duplicate_filter and duplicate_filter.check(vid, page.page_content) is not None:
+                    duplicates+=1
+                    continue
+                # Chroma search results carry no ids: hybrid retrieval reads this back
+                # to match dense hits with the BM25 ids (chat.hybrid_retriever)
+                page.metadata["vector_id"]=vid
+                new_pages.append(page)
+                new_ids.append(vid)
+            chunk_hashes[vid]=text_hash
+            if len(new_ids)>=ADD_BATCH_SIZE:
+                vectordb.add_documents(new_pages, ids=new_ids)
+                sparse.upsert((vid, page.page_content, page.metadata) for vid, page in zip(new_ids, new_pages))
+                added+=len(new_ids)
+                new_pages, new_ids=[], []
+        if new_ids:
+            vectordb.add_documents(new_pages, ids=new_ids)
+            sparse.upsert((vid, page.page_content, page.metadata) for vid, page in zip(new_ids, new_pages))
+            added+=len(new_ids)
+
+        _, to_delete=diff_chunks(manifest, file, chunk_hashes)
+        if to_delete:
+            vectordb.delete(ids=to_delete)
+            sparse.delete(to_delete)
+        stale_files=forget_chunks(to_delete)
+        print(f"{file}: {len(chunk_hashes)} chunks, {added} new or changed, {len(to_delete)} stale, "
+              f"{duplicates} near-duplicates skipped")
+
+        record_file(manifest, file, None if file in stale_files else current_hash, chunk_hashes)
+        # bm25 changes go to its journal before the manifest records them; bm25.json itself
+        # is rewritten once at the end of the run (sparse_index.py)
+        sparse.commit()
+        save_manifest(manifest, manifest_path)
+        if added or to_delete:
+            bump_index_version("chroma", persist_directory)
+    sparse.save()
+    save_manifest(manifest, manifest_path)
+    print(f"Embedding cache: {get_cache().stats()}")
+    return vectordb
+
+
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Build the Chroma vector db from the company PDFs.")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-embed every chunk")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="processes used to parse PDFs")
+    parser.add_argument("--no-dedup", action="store_true", help="embed near-duplicate chunks too")
+    args=parser.parse_args()
+
+    cwd=os.getcwd()
+    doc=os.path.join(cwd,'IQ_TechMax')
+    build_vector_db(doc, incremental=not args.full, workers=args.workers, dedup=not args.no_dedup)
@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from local_index import LOCAL_INDEX_DIR
+from retrieval_cache import INDEX_VERSION_PATH
+from shared import process_singleton, hit_rate
+
+# Semantic answer cache in front of the LLM.
+# Most traffic is the same few questions in different words (branches, HQ address,
+# products, contact email). A question whose embedding is within ANSWER_CACHE_THRESHOLD
+# cosine similarity of an earlier one in the same scope gets that answer back without
+# retrieval or an LLM call.
+#
+# Scopes keep tenants/personas apart: callers pass any hashable scope, e.g.
+# (tenant, role, description, source). Entries expire after ANSWER_CACHE_TTL seconds,
+# the least recently used are evicted beyond ANSWER_CACHE_MAX_ENTRIES, and the whole
+# cache is dropped when one of the index files below changes (re-ingest).
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Files rewritten by the ingest scripts (trailvector.py, Vector_Db.py, local index);
+# the version file is bumped on every write, including per-buyer ones (tenants.py)
+INDEX_FILES = [
+    "iq-bot-demo2_manifest.json",
+    "db1_manifest.json",
+    os.path.join(LOCAL_INDEX_DIR, "config.json"),
+    INDEX_VERSION_PATH,
+]
+
+
+def index_version(paths=INDEX_FILES):
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+
+class AnswerCache:
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, index_files=INDEX_FILES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_files = index_files
+        self.version = index_version(index_files)
+        self.entries = OrderedDict()  # key -> (scope, unit vector, answer, created), oldest use first
+        self.scopes = {}  # scope -> set of keys
+        self.next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    # Everything was answered from the old index
+    def _check_version(self):
+        version = index_version(self.index_files)
+        if version != self.version:
+            self.entries.clear()
+            self.scopes.clear()
+            self.version = version
+
+    def _remove(self, key):
+        scope = self.entries.pop(key)[0]
+        self.scopes[scope].discard(key)
+        if not self.scopes[scope]:
+            del self.scopes[scope]
+
+    # Returns the cached answer for the closest earlier question in `scope`, or None
+    def lookup(self, scope, vector):
+        query = _unit(vector)
+        if query is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            keys = [key for key in self.scopes.get(scope, ()) if now - self.entries[key][3] <= self.ttl]
+            for key in set(self.scopes.get(scope, ())) - set(keys):
+                self._remove(key)
+            if keys:
+                scores = np.stack([self.entries[key][1] for key in keys]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self.entries[keys[best]][2]
+            self.misses += 1
+            return None
+
+    def store(self, scope, vector, answer):
+        query = _unit(vector)
+        if query is None or not answer:
+            return
+        with self._lock:
+            self._check_version()
+            key = self.next_key
+            self.next_key += 1
+            self.entries[key] = (scope, query, answer, time.time())
+            self.scopes.setdefault(scope, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": hit_rate(self.hits, self.hits + self.misses),
+        }
+
+
+# Normalized float32 copy, None for a missing or all-zero embedding
+def _unit(vector):
+    if vector is None or not len(vector):
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+# One cache per process, created on first use
+get_answer_cache = process_singleton(AnswerCache)
+
+# Shared-cache helpers used by the chat scripts; no-ops when ANSWER_CACHE=0
+def lookup_answer(scope, vector):
+    return get_answer_cache().lookup(scope, vector) if ANSWER_CACHE_ENABLED else None
+
+def store_answer(scope, vector, answer):
+    if ANSWER_CACHE_ENABLED:
+        get_answer_cache().store(scope, vector, answer)
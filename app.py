@@ -1,5 +1,9 @@
-from flask import Flask, render_template, request, jsonify
-from cchat import chat
+import json
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from cchat import chat, chat_stream
+from intent_router import get_intent_router
+from gemini_stream import get_stream_metrics
+from context_cache import get_context_cache
 from flask_cors import CORS 
 
 app = Flask(__name__)
@@ -17,5 +21,29 @@ def chat_api():
     response = chat(user_input)
     return jsonify({"response": response})
 
+# Same as /iqbot, but the response is relayed as server-sent events while Gemini
+# generates it: one `data: {"delta": ...}` event per piece, then an `event: done`
+@app.route("/iqbot/stream", methods=["POST"])
+def chat_stream_api():
+    user_input = request.json.get("message", "")
+    if not user_input:
+        return jsonify({"response": "Invalid input!"}), 400
+
+    def events():
+        for delta in chat_stream(user_input):
+            yield f"data: {json.dumps({'delta': delta})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    # no-cache / X-Accel-Buffering keep proxies from holding the events back
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Intent router hit rate and latency saved (intent_router.py), time-to-first-token of
+# streamed responses (gemini_stream.py), tokens sent/cached per turn (context_cache.py)
+@app.route("/iqbot/stats", methods=["GET"])
+def chat_stats():
+    return jsonify({"intent_router": get_intent_router().stats(), "streaming": get_stream_metrics().stats(),
+                    "context_cache": get_context_cache().stats()})
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,290 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import queue
+import subprocess
+import multiprocessing
+import requests
+
+# Ingestion benchmark: runs the trailvector.py and Vector_Db.py pipelines over the
+# PDFs in the repo against the local fakes in fake_servers.py, so no API keys or
+# network are needed and numbers are comparable between runs.
+#
+# Every scenario runs cold (empty embedding cache, manifest and index) in its own
+# spawned process, so peak RSS belongs to that scenario alone. Results are appended
+# to a JSON file and compared with the previous run of the same scenario.
+#
+#   python bench_ingest.py                      # all scenarios, PDFs in the repo root
+#   python bench_ingest.py --latency 0.05 --scenario trailvector-pinecone
+
+BENCH_OUTPUT = "bench_ingest.json"
+SCENARIOS = ["trailvector-pinecone", "trailvector-local", "vector-db"]
+
+
+# === Per-stage timing ===
+# Stages nest (chunking pulls pages from parsing, Chroma calls the embeddings), so time
+# is charged to the innermost running stage only and the stages add up to the wall time.
+class StageTimer:
+    def __init__(self):
+        self.totals = {}
+        self.stack = []
+        self.mark = time.perf_counter()
+
+    def _charge(self):
+        now = time.perf_counter()
+        if self.stack:
+            self.totals[self.stack[-1]] = self.totals.get(self.stack[-1], 0.0) + now - self.mark
+        self.mark = now
+
+    def enter(self, stage):
+        self._charge()
+        self.stack.append(stage)
+
+    def exit(self):
+        self._charge()
+        self.stack.pop()
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            self.enter(stage)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.exit()
+        return timed
+
+    # Times each step of a generator, the consumer's work in between is not counted
+    def wrap_iter(self, stage, fn):
+        def timed(*args, **kwargs):
+            iterator = iter(fn(*args, **kwargs))
+            while True:
+                self.enter(stage)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.exit()
+                yield item
+        return timed
+
+    def report(self, wall):
+        stages = {stage: round(seconds, 4) for stage, seconds in sorted(self.totals.items())}
+        stages["other"] = round(max(wall - sum(self.totals.values()), 0.0), 4)
+        return stages
+
+
+# LangChain-style embeddings backed by the Gemini REST API (the fake one in benchmarks)
+class RestEmbeddings:
+    def __init__(self, base_url, model="models/embedding-001", batch_size=100):
+        self.url = f"{base_url}/{model}:batchEmbedContents?key={os.getenv('GOOGLE_API_KEY', 'bench')}"
+        self.model = model
+        self.batch_size = batch_size
+        self.session = requests.Session()
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            payload = {"requests": [{"model": self.model, "content": {"parts": [{"text": text}]}}
+                                    for text in texts[start:start + self.batch_size]]}
+            response = self.session.post(self.url, json=payload, timeout=60)
+            response.raise_for_status()
+            vectors.extend(item["values"] for item in response.json()["embeddings"])
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# === Scenarios (run in a child process) ===
+def run_trailvector(backend, pdf_folder, workdir, workers, chunker, timer):
+    import trailvector
+    import local_index
+
+    trailvector.parallel_extract = timer.wrap_iter("parse", trailvector.parallel_extract)
+    trailvector.CHUNKERS = {name: timer.wrap_iter("chunk", fn) for name, fn in trailvector.CHUNKERS.items()}
+    trailvector.embed_chunks = timer.wrap("embed", trailvector.embed_chunks)
+    trailvector.get_embedding = timer.wrap("embed", trailvector.get_embedding)
+    trailvector.upsert_to_pinecone = timer.wrap("upsert", trailvector.upsert_to_pinecone)
+    trailvector.delete_from_pinecone = timer.wrap("delete", trailvector.delete_from_pinecone)
+    local_index.LocalIndexStore.upsert = timer.wrap("upsert", local_index.LocalIndexStore.upsert)
+    local_index.LocalIndexStore.save = timer.wrap("index_build", local_index.LocalIndexStore.save)
+
+    manifest_path = os.path.join(workdir, "manifest.json")
+    trailvector.SPARSE_INDEX_PATH = os.path.join(workdir, "bm25.json")
+    trailvector.process_pdf_folder(pdf_folder, incremental=False, manifest_path=manifest_path, workers=workers,
+                                   checkpoint_path=os.path.join(workdir, "checkpoint.json"),
+                                   backend=backend, chunker=chunker)
+    return manifest_path
+
+def run_vector_db(pdf_folder, workdir, workers, timer):
+    import Vector_Db
+
+    class TimedChroma(Vector_Db.Chroma):
+        add_documents = timer.wrap("upsert", Vector_Db.Chroma.add_documents)
+        delete = timer.wrap("delete", Vector_Db.Chroma.delete)
+
+    embeddings = RestEmbeddings(os.environ["GEMINI_API_BASE"])
+    embeddings.embed_documents = timer.wrap("embed", embeddings.embed_documents)
+    Vector_Db.Chroma = TimedChroma
+    Vector_Db.parallel_extract = timer.wrap_iter("parse_chunk", Vector_Db.parallel_extract)
+
+    manifest_path = os.path.join(workdir, "manifest.json")
+    Vector_Db.build_vector_db(pdf_folder, incremental=False, manifest_path=manifest_path, workers=workers,
+                              embeddings=embeddings, persist_directory=os.path.join(workdir, "chroma"),
+                              sparse_path=os.path.join(workdir, "bm25.json"))
+    return manifest_path
+
+def scenario_worker(scenario, pdf_folder, workdir, workers, chunker, env, results, verbose):
+    os.environ.update(env)
+    if not verbose:
+        sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    timer = StageTimer()
+    started = time.perf_counter()
+    try:
+        if scenario == "vector-db":
+            manifest_path = run_vector_db(pdf_folder, workdir, workers, timer)
+        else:
+            manifest_path = run_trailvector(scenario.split("-", 1)[1], pdf_folder, workdir, workers, chunker, timer)
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+        return
+    wall = time.perf_counter() - started
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        chunks = sum(len(entry["chunks"]) for entry in json.load(f)["files"].values())
+    # ru_maxrss is in KB on Linux; parse workers are separate processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    results.put({"wall_seconds": round(wall, 4), "chunks": chunks, "stages": timer.report(wall),
+                 "peak_rss_mb": round(own, 1), "peak_worker_rss_mb": round(workers_peak, 1)})
+
+
+# === Driver ===
+def run_scenario(scenario, pdf_folder, pages, workers, chunker, gemini, gemini_url, pinecone, pinecone_url,
+                 verbose=False):
+    workdir = tempfile.mkdtemp(prefix=f"bench-{scenario}-")
+    env = {
+        "GEMINI_API_BASE": gemini_url,
+        "PINECONE_HOST": pinecone_url,
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY") or "bench",
+        "PINECONE_API_KEY": os.getenv("PINECONE_API_KEY") or "bench",
+        "EMBED_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+    }
+    before = {"gemini": dict(gemini.stats), "pinecone": dict(pinecone.stats)}
+    pinecone.namespaces.clear()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=scenario_worker,
+                              args=(scenario, pdf_folder, workdir, workers, chunker, env, results, verbose))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                result = {"error": f"benchmark process exited with code {process.exitcode}"}
+    process.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if "error" in result:
+        return result
+
+    embed_requests = gemini.stats["requests"] - before["gemini"]["requests"]
+    embed_bytes = gemini.stats["bytes_received"] - before["gemini"]["bytes_received"]
+    upsert_bytes = pinecone.stats["bytes_received"] - before["pinecone"]["bytes_received"]
+    wall = result["wall_seconds"]
+    return dict(result,
+                pages=pages,
+                pages_per_sec=round(pages / wall, 2),
+                chunks_per_sec=round(result["chunks"] / wall, 2),
+                embed_requests=embed_requests,
+                texts_embedded=gemini.stats["texts_embedded"] - before["gemini"]["texts_embedded"],
+                bytes_uploaded=embed_bytes + upsert_bytes,
+                embed_bytes=embed_bytes,
+                upsert_bytes=upsert_bytes)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Appends `run` to the JSON list in `path` and returns the previous run
+def append_result(path, run):
+    history = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+    history.append(run)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    return history[-2] if len(history) > 1 else None
+
+def print_comparison(run, previous):
+    for scenario, result in run["results"].items():
+        if "error" in result:
+            print(f"❌ {scenario}: {result['error']}")
+            continue
+        print(f"📊 {scenario}: {result['pages_per_sec']} pages/sec, {result['chunks_per_sec']} chunks/sec, "
+              f"{result['embed_requests']} embed requests, {result['bytes_uploaded']} bytes uploaded, "
+              f"peak RSS {result['peak_rss_mb']} MB")
+        print(f"   ⏱️ stages: {result['stages']}")
+        old = (previous or {}).get("results", {}).get(scenario)
+        if old and "error" not in old:
+            for metric in ["wall_seconds", "chunks_per_sec", "embed_requests", "bytes_uploaded", "peak_rss_mb"]:
+                if old[metric]:
+                    change = (result[metric] - old[metric]) / old[metric] * 100
+                    print(f"   {metric}: {old[metric]} -> {result[metric]} ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    from fake_servers import start_fake_gemini, start_fake_pinecone
+    from pdf_parallel import pdf_page_count, DEFAULT_WORKERS
+
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipelines against local fakes.")
+    parser.add_argument("--pdfs", default=os.getcwd(), help="folder with the PDFs (default: the repo root)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable, default: all")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--chunker", choices=["chars", "tokens"], default="chars", help="trailvector scenarios")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fakes add to every request")
+    parser.add_argument("--output", default=BENCH_OUTPUT)
+    parser.add_argument("--verbose", action="store_true", help="show the pipelines' own output")
+    args = parser.parse_args()
+
+    pdf_paths = sorted(glob.glob(os.path.join(args.pdfs, "*.pdf")) + glob.glob(os.path.join(args.pdfs, "*.PDF")))
+    assert pdf_paths, f"❌ No PDFs in {args.pdfs}"
+    pages = sum(pdf_page_count(path) for path in pdf_paths)
+    gemini, gemini_url = start_fake_gemini(latency=args.latency)
+    pinecone, pinecone_url = start_fake_pinecone(latency=args.latency)
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "pdfs": len(pdf_paths),
+        "pages": pages,
+        "workers": args.workers,
+        "chunker": args.chunker,
+        "latency": args.latency,
+        "results": {},
+    }
+    for scenario in args.scenario or SCENARIOS:
+        print(f"🏁 Running {scenario}...")
+        run["results"][scenario] = run_scenario(scenario, args.pdfs, pages, args.workers, args.chunker,
+                                                gemini, gemini_url, pinecone, pinecone_url, args.verbose)
+    gemini.shutdown()
+    pinecone.shutdown()
+
+    previous = append_result(args.output, run)
+    print_comparison(run, previous)
+    print(f"💾 Results appended to {args.output}")
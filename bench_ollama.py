@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+
+# Load test of the FastAPI chat in ollama.py against the fake Ollama in fake_servers.py.
+# `users` clients post messages to /send at the same time while a monitor task measures
+# event-loop lag (how late a 10 ms sleep wakes up), so a blocked loop shows up directly.
+# Scenarios:
+#   blocking   chain.invoke inside the request handler (the old send_message)
+#   executor   chain.invoke on the gate's bounded thread pool (OLLAMA_ASYNC=0)
+#   async      chain.ainvoke (the default)
+# The app is driven in-process through httpx's ASGI transport, so no server is needed.
+#
+#   python bench_ollama.py --users 50 --messages 2 --parallel 4
+
+BENCH_OUTPUT = "bench_ollama.json"
+SCENARIOS = ["blocking", "executor", "async"]
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 1) if samples else None
+
+async def run_scenario(ollama, scenario, users, messages, concurrency):
+    import httpx
+
+    if scenario == "blocking":
+        class BlockingGate(ollama.LLMGate):
+            async def run(self, chain, inputs):
+                return chain.invoke(inputs)
+        ollama.llm_gate = BlockingGate(concurrency)
+    else:
+        ollama.OLLAMA_ASYNC = scenario == "async"
+        ollama.llm_gate = ollama.LLMGate(concurrency)
+    ollama.chat_history.clear()
+
+    latencies, lags, errors = [], [], 0
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=ollama.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        # Latency counts from when a message is due: the start of the run for the first
+        # one, even if a blocked loop only lets the client send it much later
+        async def user(number, due):
+            nonlocal errors
+            for message in range(messages):
+                response = await client.post("/send", data={"user_input": f"user {number} question {message}"})
+                latencies.append(time.perf_counter() - due)
+                errors += response.status_code != 200
+                due = time.perf_counter()
+
+        async def monitor():
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - started - 0.01)
+
+        monitor_task = asyncio.create_task(monitor())
+        started = time.perf_counter()
+        await asyncio.gather(*(user(number, started) for number in range(users)))
+        wall = time.perf_counter() - started
+        done.set()
+        await monitor_task
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "latency_p50_ms": percentile_ms(latencies, 50),
+        "latency_p99_ms": percentile_ms(latencies, 99),
+        "loop_lag_p99_ms": percentile_ms(lags, 99),
+        "loop_lag_max_ms": round(max(lags) * 1000, 1) if lags else None,
+        "gate": ollama.llm_gate.stats() if scenario != "blocking" else None,
+    }
+
+
+if __name__ == "__main__":
+    from fake_servers import start_fake_ollama
+    from bench_ingest import append_result, git_commit
+
+    parser = argparse.ArgumentParser(description="Load test the ollama.py FastAPI chat against a fake Ollama.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=2, help="messages per user")
+    parser.add_argument("--parallel", type=int, default=4, help="generations the fake Ollama runs at once")
+    parser.add_argument("--concurrency", type=int, help="gate limit (default: --parallel)")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds per streamed chunk of the fake")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable, default: all")
+    parser.add_argument("--output", default=BENCH_OUTPUT)
+    args = parser.parse_args()
+
+    server, url = start_fake_ollama(token_delay=args.token_delay, parallel=args.parallel)
+    os.environ["OLLAMA_BASE_URL"] = url
+    output = os.path.abspath(args.output)
+    commit = git_commit()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="bench-ollama-"))  # ollama.py writes its template and static/ here
+    import ollama
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "users": args.users,
+        "messages": args.messages,
+        "parallel": args.parallel,
+        "token_delay": args.token_delay,
+        "results": {},
+    }
+    for scenario in args.scenario or SCENARIOS:
+        print(f"🏁 {scenario}: {args.users} users x {args.messages} messages...")
+        run["results"][scenario] = asyncio.run(run_scenario(ollama, scenario, args.users, args.messages,
+                                                            args.concurrency or args.parallel))
+    server.shutdown()
+
+    append_result(output, run)
+    for scenario, result in run["results"].items():
+        print(f"📊 {scenario:9s} {result['throughput_rps']:6.2f} req/s  latency p50 {result['latency_p50_ms']} ms "
+              f"p99 {result['latency_p99_ms']} ms  loop lag p99 {result['loop_lag_p99_ms']} ms "
+              f"max {result['loop_lag_max_ms']} ms  errors {result['errors']}")
+        if result["gate"]:
+            print(f"   🚦 peak queue depth {result['gate']['peak_queue_depth']}, "
+                  f"avg wait {result['gate']['avg_wait_ms']} ms, avg generation {result['gate']['avg_generation_ms']} ms")
+    print(f"💾 Results appended to {output}")
@@ -0,0 +1,269 @@
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+# Retrieval benchmark: answer quality (recall@k, MRR) against latency (p50/p99) for every
+# retrieval backend, on a labeled set of questions over the PDFs in the repo.
+#   pinecone-rest    trailpine.search_pinecone against the fake Pinecone in fake_servers.py
+#   local-<variant>  local_index.search_local_index over the same vectors, built flat, ivf,
+#                    int8 and pq (local_index.py / quantize.py)
+#   chroma           the chat.py retriever (Chroma similarity search + BM25) over a Vector_Db.py build
+# Every backend is ingested from scratch by its own ingest script, then queried through the
+# same code path the chat scripts use (hybrid fusion included, retrieval cache off).
+#
+# Runs offline: embeddings come from the fake Gemini in fake_servers.py and are kept in an
+# embedding cache, so after the first pass every query is a cache lookup and the timings
+# are retrieval alone. Pass a copy of a real cache (--embed-cache) to score real Gemini
+# vectors; texts missing from it still get fake vectors, which the run reports.
+#
+#   python bench_retrieval.py
+#   python bench_retrieval.py -k 5 --latency 0.02 --embed-cache embedding_cache.sqlite3
+
+BENCH_OUTPUT = "bench_retrieval.json"
+LOCAL_VARIANTS = {"flat": {}, "ivf": {"mode": "ivf"}, "int8": {"quantization": "int8"},
+                  "pq": {"quantization": "pq"}}
+
+# (question, phrase). A chunk is relevant to the question when its full text contains the
+# phrase (lowercase, whitespace collapsed); some PDFs extract without spaces.
+LABELED_QUESTIONS = [
+    ("What is the address of your headquarters?", "rajiv gandhi salai"),
+    ("What is the pin code of the Chennai office?", "600096"),
+    ("Which email should I write to for sales?", "sales@iqtechmax.com"),
+    ("In which cities and countries are your offices?", "bengaluru | france"),
+    ("When was IQ TechMax founded and by whom?", "founded in 2020"),
+    ("What products does IQ TechMax have?", "products:"),
+    ("How does IQ Lens help automotive technicians?", "automotive maintenance"),
+    ("How are AR and VR used in aerospace and defence?", "aerospace and defence"),
+    ("What can I do in IQ Verse?", "what can you do"),
+    ("Can I join virtual sports leagues in the metaverse?", "virtual sports leagues"),
+    ("Which game engines do your developers use?", "unity3d"),
+    ("What blockchain and NFT services do you offer?", "nft stacking & minting"),
+    ("What cloud services do you provide?", "aws architecture setup"),
+    ("Which industries have you worked with?", "industries worked with"),
+    ("What was the first platform the team built?", "zeedup"),
+    ("How many projects can the team develop concurrently?", "15 projects concurrently"),
+    ("What search engine optimization services do you provide?", "search engine optimization"),
+    ("Tell me about your corporate branding services", "corporate branding"),
+    ("What is the CEO's vision for farmers?", "helpingthefarmers"),
+    ("What is the CEO's mobile number?", "9551455515"),
+]
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text.lower())
+
+# question -> set of relevant chunk ids, from the full chunk texts of a BM25 file
+def label_corpus(sparse_path):
+    from sparse_index import SparseIndexStore
+    texts = {vector_id: normalize_text(text) for vector_id, (text, _) in SparseIndexStore(sparse_path).records.items()}
+    return {question: {vector_id for vector_id, text in texts.items() if phrase in text}
+            for question, phrase in LABELED_QUESTIONS}
+
+
+# === Metrics ===
+# recall@k is capped at min(|relevant|, k), so a question with more relevant chunks than k
+# can still reach 1.0; MRR is the reciprocal rank of the first relevant chunk in the top k
+def score_ranking(ranked_ids, relevant, k):
+    top = ranked_ids[:k]
+    found = len(relevant & set(top))
+    first = next((rank for rank, vector_id in enumerate(top, 1) if vector_id in relevant), None)
+    return found / min(len(relevant), k), 1.0 / first if first else 0.0
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+# retrieve(query, k) -> [(score, id, metadata)]; every question is run once for the
+# scores and `repeat` more times for the timings
+def evaluate(retrieve, labels, k, repeat):
+    recalls, reciprocal_ranks, samples = [], [], []
+    skipped = [question for question, relevant in labels.items() if not relevant]
+    for question, relevant in labels.items():
+        if not relevant:
+            continue
+        ranked = [vector_id for _, vector_id, _ in retrieve(question, k)]
+        recall, reciprocal_rank = score_ranking(ranked, relevant, k)
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            retrieve(question, k)
+            samples.append(time.perf_counter() - started)
+    if not recalls:
+        return {"error": "no labeled question has a relevant chunk in this corpus"}
+    return {
+        "questions": len(recalls),
+        "unlabeled": skipped,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        f"hit@{k}": round(float(np.mean([r > 0 for r in reciprocal_ranks])), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "p50_ms": percentile_ms(samples, 50) if samples else None,
+        "p99_ms": percentile_ms(samples, 99) if samples else None,
+    }
+
+
+# === Backends ===
+# Each returns {name: (retrieve, sparse_path)}; imports happen after the environment is set
+def pinecone_backends(pdf_folder, workdir):
+    import trailvector
+    import trailpine
+
+    trailvector.process_pdf_folder(pdf_folder, incremental=False, manifest_path=os.path.join(workdir, "manifest.json"),
+                                   checkpoint_path=os.path.join(workdir, "checkpoint.json"), backend="pinecone")
+    return {"pinecone-rest": (lambda query, k: trailpine.search_pinecone(query, k), trailvector.SPARSE_INDEX_PATH)}
+
+def local_backends(pdf_folder, workdir):
+    import trailvector
+    import trailpine
+    from local_index import LOCAL_INDEX_DIR, LocalIndex, build_index, search_local_index
+
+    trailvector.process_pdf_folder(pdf_folder, incremental=False, backend="local", quantization=None)
+    source = LocalIndex(LOCAL_INDEX_DIR)
+    ids = [record["id"] for record in source.records]
+    metadatas = [record["metadata"] for record in source.records]
+    vectors = source.dense_vectors()
+
+    backends = {}
+    for variant, options in LOCAL_VARIANTS.items():
+        index_dir = os.path.join(workdir, f"local-{variant}")
+        build_index(index_dir, ids, vectors, metadatas, **options)
+        shutil.copy(os.path.join(LOCAL_INDEX_DIR, "bm25.json"), os.path.join(index_dir, "bm25.json"))
+        retrieve = (lambda index_dir: lambda query, k: search_local_index(trailpine.get_embedding(query), k,
+                                                                          index_dir, query))(index_dir)
+        backends[f"local-{variant}"] = (retrieve, os.path.join(index_dir, "bm25.json"))
+    return backends
+
+def chroma_backends(pdf_folder, workdir, gemini_url):
+    import Vector_Db
+    from bench_ingest import RestEmbeddings
+    from sparse_index import hybrid_search, dense_candidates
+
+    persist_directory = os.path.join(workdir, "chroma")
+    sparse_path = os.path.join(workdir, "chroma_bm25.json")
+    # Query embeddings go through the same embedding cache as the ingest
+    vector_db = Vector_Db.build_vector_db(pdf_folder, incremental=False,
+                                          manifest_path=os.path.join(workdir, "chroma_manifest.json"),
+                                          embeddings=RestEmbeddings(gemini_url), persist_directory=persist_directory,
+                                          sparse_path=sparse_path)
+
+    # Same ranking as chat.hybrid_retriever, before packing
+    def retrieve(query, k):
+        dense = [(score, doc.metadata.get("vector_id", doc.page_content), dict(doc.metadata, text=doc.page_content))
+                 for doc, score in vector_db.similarity_search_with_score(query, k=dense_candidates(k))]
+        return hybrid_search(query, dense, k, sparse_path)
+
+    return {"chroma": (retrieve, sparse_path)}
+
+
+def run_benchmark(pdf_folder, workdir, gemini_url, k, repeat, verbose):
+    from embedding_cache import get_cache
+
+    results = {}
+    builders = [("pinecone-rest", lambda: pinecone_backends(pdf_folder, workdir)),
+                ("local", lambda: local_backends(pdf_folder, workdir)),
+                ("chroma", lambda: chroma_backends(pdf_folder, workdir, gemini_url))]
+    for group, build in builders:
+        print(f"🏁 Ingesting for {group}...")
+        stdout = sys.stdout
+        if not verbose:
+            sys.stdout = open(os.devnull, "w", encoding="utf-8")
+        try:
+            backends = build()
+        except Exception as e:  # e.g. the LangChain packages are not installed for chroma
+            results[group] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        finally:
+            if not verbose:
+                sys.stdout.close()
+                sys.stdout = stdout
+        for name, (retrieve, sparse_path) in backends.items():
+            print(f"🔎 Querying {name}...")
+            results[name] = evaluate(retrieve, label_corpus(sparse_path), k, repeat)
+    return results, get_cache().stats()
+
+def print_results(run, previous):
+    k = run["k"]
+    print(f"📚 {len(LABELED_QUESTIONS)} labeled questions, k={k}, {run['repeat']} timed runs per question")
+    print(f"{'backend':15s} {'recall@' + str(k):>9s} {'hit@' + str(k):>7s} {'mrr':>7s} {'p50 ms':>9s} {'p99 ms':>9s}")
+    for name, result in run["results"].items():
+        if "error" in result:
+            print(f"❌ {name}: {result['error']}")
+            continue
+        print(f"{name:15s} {result[f'recall@{k}']:9.3f} {result[f'hit@{k}']:7.3f} {result['mrr']:7.3f} "
+              f"{result['p50_ms']:9.3f} {result['p99_ms']:9.3f}")
+        if result["unlabeled"]:
+            print(f"   ⚠️ no relevant chunk for: {result['unlabeled']}")
+        old = (previous or {}).get("results", {}).get(name)
+        if old and "error" not in old and previous.get("k") == k:
+            changes = [f"{metric} {old[metric]} -> {result[metric]}" for metric in [f"recall@{k}", "mrr", "p50_ms"]
+                       if old[metric] != result[metric]]
+            if changes:
+                print(f"   vs previous run: {', '.join(changes)}")
+
+
+if __name__ == "__main__":
+    from fake_servers import start_fake_gemini, start_fake_pinecone
+    from bench_ingest import append_result, git_commit
+
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency across backends, offline.")
+    parser.add_argument("--pdfs", default=os.getcwd(), help="folder with the PDFs (default: the repo root)")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per question")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fakes add to every request")
+    parser.add_argument("--embed-cache", help="embedding cache to start from (copied, never written)")
+    parser.add_argument("--output", default=BENCH_OUTPUT)
+    parser.add_argument("--verbose", action="store_true", help="show the ingest scripts' own output")
+    args = parser.parse_args()
+
+    pdf_paths = sorted(glob.glob(os.path.join(args.pdfs, "*.pdf")))
+    assert pdf_paths, f"❌ No PDFs in {args.pdfs}"
+    gemini, gemini_url = start_fake_gemini(latency=args.latency)
+    pinecone, pinecone_url = start_fake_pinecone(latency=args.latency)
+
+    # Every path the ingest and retrieval modules read at import time points into the
+    # work directory, so the repo's own indexes and caches are left alone
+    workdir = tempfile.mkdtemp(prefix="bench-retrieval-")
+    embed_cache_path = os.path.join(workdir, "embedding_cache.sqlite3")
+    if args.embed_cache:
+        shutil.copy(args.embed_cache, embed_cache_path)
+    os.environ.update({
+        "GEMINI_API_BASE": gemini_url,
+        "PINECONE_HOST": pinecone_url,
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY") or "bench",
+        "PINECONE_API_KEY": os.getenv("PINECONE_API_KEY") or "bench",
+        "EMBED_CACHE_PATH": embed_cache_path,
+        "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+        "SPARSE_INDEX_PATH": os.path.join(workdir, "bm25.json"),
+        "INDEX_VERSION_PATH": os.path.join(workdir, "index_versions.json"),
+        "RETRIEVAL_BACKEND": "",
+        "RETRIEVAL_CACHE": "0",
+    })
+
+    started = time.perf_counter()
+    results, cache_stats = run_benchmark(args.pdfs, workdir, gemini_url, args.k, args.repeat, args.verbose)
+    gemini.shutdown()
+    pinecone.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "pdfs": len(pdf_paths),
+        "k": args.k,
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "embed_cache": bool(args.embed_cache),
+        "results": results,
+    }
+    previous = append_result(args.output, run)
+    print_results(run, previous)
+    if args.embed_cache and gemini.stats["texts_embedded"]:
+        print(f"⚠️ {gemini.stats['texts_embedded']} texts were not in {args.embed_cache} and got fake vectors")
+    print(f"🧮 Embedding cache: {cache_stats}")
+    print(f"⏱️ {time.perf_counter() - started:.1f}s, results appended to {args.output}")
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema.output_parser import StrOutputParser
 from langchain.schema import AIMessage, HumanMessage
+from prompt_registry import compiled_chain
 
 load_dotenv()
 
@@ -29,6 +30,17 @@ def get_system_prompt(character_name):
         "Maintain a smooth and realistic phone call experience."
     )
 
+# Prompt and chain of one character, compiled on first use and reused by every session
+# (prompt_registry.py)
+def get_chain(character_name):
+    def build():
+        prompt_template = ChatPromptTemplate.from_messages([
+            ("system", get_system_prompt(character_name)),
+            MessagesPlaceholder("chat_history")
+        ])
+        return prompt_template | model | StrOutputParser()
+    return compiled_chain("call", build, character_name=character_name)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -54,20 +66,11 @@ def chat():
     chat_history = chat_histories[session_id]
 
     try:
-        system_prompt = get_system_prompt(character_name)
-
-        # Create the prompt template using the system prompt and chat history
-        messages = [
-            ("system", system_prompt),
-            MessagesPlaceholder("chat_history")
-        ]
-        prompt_template = ChatPromptTemplate.from_messages(messages)
-
         # Append user input to chat history
         chat_history.append(HumanMessage(content=user_input))
 
-        # Build the chain and invoke the model
-        chain = prompt_template | model | StrOutputParser()
+        # Reuse the character's compiled chain and invoke the model
+        chain = get_chain(character_name)
         result = chain.invoke({"chat_history": chat_history})
 
         # Clean the response and add it to the chat history
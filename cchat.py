@@ -4,12 +4,18 @@ from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema.output_parser import StrOutputParser
 from langchain.schema import AIMessage, HumanMessage
+from intent_router import get_intent_router, CCHAT_FACTS
+from gemini_stream import strip_stars, timed_stream
+from context_cache import CacheUsageCallback, invoke_with_fallback, stream_with_fallback
+from prompt_registry import compiled_chain
+import time
 
 load_dotenv()
 
 # Initialize the model (using ChatGoogleGenerativeAI with model "gemini-2.0-flash-exp")
 #model = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp")
-model = ChatGoogleGenerativeAI(model="gemini-2.0-flash-001")
+MODEL_NAME = "gemini-2.0-flash-001"
+model = ChatGoogleGenerativeAI(model=MODEL_NAME)
 
 # Global chat history (for a real app, consider per-session history management)
 chat_history = []
@@ -30,7 +36,7 @@ system_prompt = (
     "We create dynamic Web 3.0 applications using the latest tools and frameworks.\n\n"
     "For product and service inquiries, suggest visiting our official website: https://www.iqtechmax.com/ or, if they are specifically interested in IQ Bot, direct them to https://ai.iqtechmax.com/.\n\n"
     "Additional Details:\n"
-    "IQ TechMax was founded in 2019 by Prashanth Gandidoss (GP), the founder and CEO. Our products include IQ Verse, IQ Lens, and IQ Bot."
+    "IQ TechMax was founded in 2020 by Prashanth Gandidoss (GP), the founder and CEO. Our products include IQ Verse, IQ Lens, and IQ Bot."
     "Before answering, please review the previous conversation exchanges to ensure your response is contextually consistent."
         # ---------------------
         # "You are Bot, an AI phone assistant. "
@@ -51,15 +57,43 @@ messages = [
 ]
 prompt_template = ChatPromptTemplate.from_messages(messages)
 
+# cchat has a single persona, so its chain is built once here instead of every turn
+chain = prompt_template | model | StrOutputParser()
+
+# With CONTEXT_CACHE=1 the system prompt is registered once as a Gemini cached context
+# (context_cache.py) and turns send only the history; the chain for the current cache name
+# comes from the prompt registry. Token counts of every turn go to the context cache stats.
+# At about 485 tokens this prompt is below Gemini's minimum cacheable size, so it is sent
+# in full until it grows (context_cache.py skips it without a create call).
+history_prompt = ChatPromptTemplate.from_messages([MessagesPlaceholder("chat_history")])
+usage_config = {"callbacks": [CacheUsageCallback()]}
+
+def cached_chain(name):
+    def build():
+        return history_prompt | ChatGoogleGenerativeAI(model=MODEL_NAME, cached_content=name) | StrOutputParser()
+    return compiled_chain("cchat-cached", build, cached_content=name)
+
 def chat(user_input: str) -> str:
     global chat_history
     try:
         # Append the user's message to the chat history
         chat_history.append(HumanMessage(content=user_input))
+
+        # Fixed company facts of system_prompt (branches, contact, founder, products) are
+        # answered locally by the intent router; anything it is unsure about goes to Gemini
+        router = get_intent_router()
+        fact = router.answer(user_input, CCHAT_FACTS)
+        if fact is not None:
+            chat_history.append(AIMessage(content=fact))
+            return fact
         
-        # Build the chain and invoke the model
-        chain = prompt_template | model | StrOutputParser()
-        result = chain.invoke({"chat_history": chat_history})
+        # Invoke the model
+        started = time.perf_counter()
+        inputs = {"chat_history": chat_history}
+        result = invoke_with_fallback(MODEL_NAME, system_prompt,
+                                      lambda name: cached_chain(name).invoke(inputs, config=usage_config),
+                                      lambda: chain.invoke(inputs, config=usage_config))
+        router.record_llm(time.perf_counter() - started)
         
         # Clean the response by removing asterisks, then add it to chat history
         response = result.replace("*", "")
@@ -67,4 +101,43 @@ def chat(user_input: str) -> str:
         return response
     except Exception as e:
         # In case of an error, return a JSON-friendly error message
-        return f"An error occurred: {str(e)}"
\ No newline at end of file
+        return f"An error occurred: {str(e)}"
+
+# Same turn as chat(), yielding the cleaned response piece by piece as Gemini streams it
+# (chain.stream uses streamGenerateContent). Time-to-first-token is recorded in the
+# stream metrics (gemini_stream.py); the full response goes to the history at the end.
+# A turn that fails before anything was shown is taken back out of the history, so a
+# retry (index.html falls back to /iqbot) does not send the question twice; one that
+# fails or is cut off part-way keeps the part the user saw.
+def chat_stream(user_input: str):
+    global chat_history
+    question = HumanMessage(content=user_input)
+    chat_history.append(question)
+    router = get_intent_router()
+    fact = router.answer(user_input, CCHAT_FACTS)
+    if fact is not None:
+        chat_history.append(AIMessage(content=fact))
+        yield fact
+        return
+
+    started = time.perf_counter()
+    pieces = []
+    try:
+        inputs = {"chat_history": chat_history}
+        stream = stream_with_fallback(MODEL_NAME, system_prompt,
+                                      lambda name: cached_chain(name).stream(inputs, config=usage_config),
+                                      lambda: chain.stream(inputs, config=usage_config))
+        for piece in timed_stream(strip_stars(stream), started):
+            pieces.append(piece)
+            yield piece
+    except (Exception, GeneratorExit) as e:
+        if pieces:
+            chat_history.append(AIMessage(content="".join(pieces)))
+        elif chat_history and chat_history[-1] is question:
+            chat_history.pop()
+        if isinstance(e, GeneratorExit):  # client disconnected
+            raise
+        yield f"An error occurred: {str(e)}"
+        return
+    router.record_llm(time.perf_counter() - started)
+    chat_history.append(AIMessage(content="".join(pieces)))
\ No newline at end of file
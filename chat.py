@@ -184,29 +184,69 @@
 #############################
 
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.vectorstores import Chroma
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
+from embedding_cache import CachedEmbeddings
+from local_index import RETRIEVAL_BACKEND, LOCAL_INDEX_DIR, get_local_index
+from sparse_index import hybrid_search, dense_candidates, tokenize
+from answer_cache import lookup_answer, store_answer
+from context_packer import pack_matches, PACK_CANDIDATES
+from retrieval_cache import cached_retrieval
+from intent_router import get_intent_router, CHAT_FACTS
+from context_cache import CacheUsageCallback, get_context_cache, invoke_with_fallback
+from prompt_registry import compiled_chain
 
 # Load environment variables
 load_dotenv()
 
-# Set up directories and embeddings
+# Set up directories and embeddings (repeated questions hit the shared embedding cache)
 cwd = os.getcwd()
 db = os.path.join(cwd, 'db1')
-embeddings = GoogleGenerativeAIEmbeddings(model='models/embedding-001')
-
-# Initialize Chroma database
-vector_db = Chroma(persist_directory=db, embedding_function=embeddings)
-retriever = vector_db.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+embeddings = CachedEmbeddings(GoogleGenerativeAIEmbeddings(model='models/embedding-001'), 'models/embedding-001')
+
+# Dense matches from Chroma (or the in-process index, local_index.py) fused with BM25
+# matches for exact terms like product names and phone numbers (sparse_index.py).
+# Overlapping chunks are merged and the rest packed into the token budget (context_packer.py).
+# Repeated queries reuse the ranked matches of the last search (retrieval_cache.py).
+def hybrid_retriever(query):
+    candidates = 5 * PACK_CANDIDATES
+
+    def retrieve():
+        if RETRIEVAL_BACKEND == "local":
+            dense = get_local_index().search(embeddings.embed_query(query), top_k=dense_candidates(candidates))
+            return hybrid_search(query, dense, candidates, os.path.join(LOCAL_INDEX_DIR, "bm25.json"))
+        # Chunks embedded before Vector_Db.py stored "vector_id" never fuse with BM25: rebuild with --full
+        dense = [(score, doc.metadata.get("vector_id", doc.page_content), dict(doc.metadata, text=doc.page_content))
+                 for doc, score in vector_db.similarity_search_with_score(query, k=dense_candidates(candidates))]
+        return hybrid_search(query, dense, candidates, os.path.join(cwd, 'db1_bm25.json'))
+
+    if RETRIEVAL_BACKEND == "local":
+        matches = cached_retrieval("local", LOCAL_INDEX_DIR, query, candidates, retrieve)
+    else:
+        matches = cached_retrieval("chroma", db, query, candidates, retrieve)
+    return [Document(page_content=passage["text"], metadata=dict(passage["metadata"], text=passage["text"],
+                                                                 id=passage["ids"][0], ids=passage["ids"]))
+            for passage in pack_matches(matches)]
+
+# Initialize the retriever: Chroma by default, the local index when RETRIEVAL_BACKEND=local
+if RETRIEVAL_BACKEND != "local":
+    vector_db = Chroma(persist_directory=db, embedding_function=embeddings)
+retriever = RunnableLambda(hybrid_retriever)
 
 # Set up the LLM
-llm = ChatGoogleGenerativeAI(model='gemini-2.0-flash-exp')
+QA_MODEL = 'gemini-2.0-flash-exp'
+llm = ChatGoogleGenerativeAI(model=QA_MODEL)
 #llm = ChatGoogleGenerativeAI(model='gemini-1.5-flash')
 
 # Prompt to contextualize questions
@@ -226,10 +266,70 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-# Create a history-aware retriever
-history_aware_retriever = create_history_aware_retriever(
-    llm, retriever, contextualize_q_prompt
-)
+# Rewrites a follow-up question into a standalone one (an extra Gemini call)
+contextualize_chain = contextualize_q_prompt | llm | StrOutputParser()
+
+# === Rewrite gate ===
+# Decides locally whether the question needs the history-aware rewrite:
+#   "skip"      no history, or a long question naming its subject -> retrieve on it as is
+#   "rewrite"   refers back to the conversation (pronouns, "what about ...", very short)
+#   "speculate" unsure -> retrieve on the raw question while the rewrite runs
+REFERRING_WORDS = {"it", "its", "they", "them", "their", "that", "this", "those", "these", "he", "she",
+                   "him", "her", "his", "there", "same", "above", "previous", "former", "latter",
+                   "one", "ones", "else", "more", "again", "another", "other"}
+FOLLOW_UP_STARTS = ("and ", "but ", "so ", "also", "what about", "how about", "tell me more", "what else")
+SPECULATION_OVERLAP = 0.6  # rewrites this close to the raw question keep the speculative retrieval
+
+def rewrite_decision(question, chat_history):
+    if not chat_history:
+        return "skip"
+    lowered = question.lower().strip()
+    words = re.findall(r"[a-z0-9']+", lowered)
+    if len(words) <= 2 or lowered.startswith(FOLLOW_UP_STARTS) or REFERRING_WORDS & set(words):
+        return "rewrite"
+    # Names (capitalized words after the first) or numbers say what the question is about
+    names = [w for w in question.split()[1:] if w[:1].isupper()] or re.findall(r"\d", question)
+    if len(words) >= 5 and names:
+        return "skip"
+    return "speculate"
+
+def token_overlap(a, b):
+    a, b = set(tokenize(a)), set(tokenize(b))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+rewrite_executor = ThreadPoolExecutor(max_workers=4)
+
+# Retrieval for `question`, rewriting it first only when the gate asks for it.
+# Fills `timings` with seconds per stage and the path taken.
+def retrieve_documents(question, chat_history, timings):
+    started = time.perf_counter()
+    decision = rewrite_decision(question, chat_history)
+    timings["gate"] = time.perf_counter() - started
+    timings["path"] = decision
+
+    def timed(stage, fn, *args):
+        stage_started = time.perf_counter()
+        result = fn(*args)
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - stage_started
+        return result
+
+    if decision == "skip":
+        return timed("retrieve", retriever.invoke, question)
+    rewrite_input = {"input": question, "chat_history": chat_history}
+    if decision == "rewrite":
+        rewritten = timed("rewrite", contextualize_chain.invoke, rewrite_input)
+        return timed("retrieve", retriever.invoke, rewritten)
+
+    # Speculate: both run at once; the raw-question documents are used when the
+    # rewrite turns out to be (nearly) the same question
+    speculative = rewrite_executor.submit(timed, "retrieve", retriever.invoke, question)
+    rewritten = timed("rewrite", contextualize_chain.invoke, rewrite_input)
+    documents = speculative.result()
+    if token_overlap(question, rewritten) >= SPECULATION_OVERLAP:
+        timings["path"] = "speculate-hit"
+        return documents
+    timings["path"] = "speculate-miss"
+    return timed("retrieve", retriever.invoke, rewritten)
 
 # Prompt for question-answering
 
@@ -269,18 +369,90 @@ qa_prompt = ChatPromptTemplate.from_messages(
 
 # Create the question-answering chain
 question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
-# Chat function to handle user input and provide a response
-def chat(user_input, chat_history=None):
+# With CONTEXT_CACHE=1 the fixed part of qa_system_prompt (everything before {context}) is
+# registered once as a Gemini cached context (context_cache.py) and the retrieved documents
+# move to the user turn. Experimental models have no caching, so with the -exp model every
+# turn falls back to the full prompt. Token counts of every answer go to the cache stats.
+# The prefix is also far below Gemini's minimum cacheable size, so it is sent in full
+# until it grows (context_cache.py skips it without a create call).
+qa_static_prefix = qa_system_prompt.split("{context}")[0]
+cached_qa_prompt = ChatPromptTemplate.from_messages(
+    [
+        MessagesPlaceholder("chat_history"),
+        ("human", "{context}\n\n{input}"),
+    ]
+)
+usage_config = {"callbacks": [CacheUsageCallback()]}
+
+def cached_answer_chain(name):
+    def build():
+        return create_stuff_documents_chain(ChatGoogleGenerativeAI(model=QA_MODEL, cached_content=name), cached_qa_prompt)
+    return compiled_chain("chat-qa-cached", build, cached_content=name)
+
+# Seconds spent per stage over all chat() calls, and how often each gate path was taken
+stage_totals = {}
+path_counts = {}
+
+def stage_report():
+    calls = sum(path_counts.values())
+    return {"calls": calls, "paths": dict(path_counts),
+            "avg_seconds": {stage: round(total / max(calls, 1), 4) for stage, total in stage_totals.items()},
+            "intent_router": get_intent_router().stats(),
+            "context_cache": get_context_cache().stats()}
+
+# Chat function to handle user input and provide a response.
+# Pass a dict as `timings` to get this call's stage timings (gate/rewrite/retrieve/answer/total).
+def chat(user_input, chat_history=None, timings=None):
     if chat_history is None:
         chat_history = []  # Initialize chat history if not provided
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+
+    # A question the rewrite gate would not rewrite can skip straight to the intent router.
+    # Only a first turn (no history) that is a near-duplicate of an earlier first turn is
+    # answered from the semantic answer cache (answer_cache.py): later answers may still
+    # depend on the conversation even when the question reads as standalone.
+    standalone = rewrite_decision(user_input, chat_history) == "skip"
+    first_turn = not chat_history
+    router = get_intent_router()
+    if standalone:
+        # The address and branches in qa_system_prompt are answered by the local intent
+        # router (intent_router.py)
+        fact = router.answer(user_input, CHAT_FACTS)
+        if fact is not None:
+            chat_history.append(HumanMessage(content=user_input))
+            chat_history.append(AIMessage(content=fact))
+            timings.update(path="intent", total=time.perf_counter() - started)
+            path_counts["intent"] = path_counts.get("intent", 0) + 1
+            return fact
+    if first_turn:
+        query_vector = embeddings.embed_query(user_input)
+        cached = lookup_answer(("chat.py",), query_vector)
+        if cached is not None:
+            chat_history.append(HumanMessage(content=user_input))
+            chat_history.append(AIMessage(content=cached))
+            timings.update(path="answer-cache", total=time.perf_counter() - started)
+            path_counts["answer-cache"] = path_counts.get("answer-cache", 0) + 1
+            return cached
     
-    # Process the user's query through the retrieval chain
-    result = rag_chain.invoke({"input": user_input, "chat_history": chat_history})
+    # Retrieve (rewriting the question only if needed), then answer from the documents
+    documents = retrieve_documents(user_input, chat_history, timings)
+    answer_started = time.perf_counter()
+    inputs = {"input": user_input, "chat_history": chat_history, "context": documents}
+    answer = invoke_with_fallback(QA_MODEL, qa_static_prefix,
+                                  lambda name: cached_answer_chain(name).invoke(inputs, config=usage_config),
+                                  lambda: question_answer_chain.invoke(inputs, config=usage_config))
+    timings["answer"] = time.perf_counter() - answer_started
+    router.record_llm(timings["answer"])
+    timings["total"] = time.perf_counter() - started
+    for stage, seconds in timings.items():
+        if stage != "path":
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+    path_counts[timings["path"]] = path_counts.get(timings["path"], 0) + 1
     
     # Clean up the response
-    response = result["answer"].strip()
+    response = answer.strip()
     
     # Convert words surrounded by asterisks into bold text
     #response = response.replace("*", "")
@@ -295,6 +467,9 @@ def chat(user_input, chat_history=None):
         if response.startswith(phrase):
             response = response.replace(phrase, "").strip()
     
+    if first_turn:
+        store_answer(("chat.py",), query_vector, response)
+
     # Update the chat history
     chat_history.append(HumanMessage(content=user_input))
     chat_history.append(AIMessage(content=response))
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import threading
+from array import array
+import numpy as np
+from sparse_index import tokenize
+
+# Incremental index over a chat history text file (trail4.py's chat_history.txt2).
+# Every line appended through ChatHistoryIndex.append is tokenized into a postings
+# table (term -> line ids) in a SQLite file next to the history, so a lookup reads a
+# few index pages per query term instead of the whole transcript.
+# Lines can also carry an embedding for similarity lookups over recent history.
+#
+# The index remembers how many bytes of the history file it has seen; lines written
+# to the file some other way are picked up on the next call.
+
+HISTORY_RESULTS = 10  # lines returned per search
+HISTORY_VECTOR_WINDOW = int(os.getenv("HISTORY_VECTOR_WINDOW", "10000"))  # recent lines scanned by similar()
+
+
+class ChatHistoryIndex:
+    def __init__(self, history_path, index_path=None):
+        self.history_path = history_path
+        self.index_path = index_path or history_path + ".index.sqlite3"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS lines (id INTEGER PRIMARY KEY, text TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, line_id INTEGER NOT NULL,"
+            " PRIMARY KEY (term, line_id)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS vectors (line_id INTEGER PRIMARY KEY, vector BLOB NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+        )
+        self._conn.commit()
+
+    def _offset(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'offset'").fetchone()
+        return row[0] if row else 0
+
+    def _index_lines(self, lines, offset, embed_fn=None):
+        rows = [line.strip() for line in lines if line.strip()]
+        for text in rows:
+            line_id = self._conn.execute("INSERT INTO lines (text) VALUES (?)", (text,)).lastrowid
+            self._conn.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)",
+                                   [(term, line_id) for term in set(tokenize(text))])
+            vector = embed_fn(text) if embed_fn else None
+            if vector:
+                self._conn.execute("INSERT INTO vectors VALUES (?, ?)", (line_id, array("f", vector).tobytes()))
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('offset', ?)", (offset,))
+        self._conn.commit()
+
+    # Index whatever the history file gained since the last call (only complete lines).
+    # A file that shrank was replaced, so the index is rebuilt from the start.
+    def _catch_up(self):
+        if not os.path.exists(self.history_path):
+            return
+        offset = self._offset()
+        size = os.path.getsize(self.history_path)
+        if size == offset:
+            return
+        if size < offset:
+            self._conn.executescript("DELETE FROM lines; DELETE FROM postings; DELETE FROM vectors;")
+            offset = 0
+        with open(self.history_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if complete:
+            self._index_lines(complete.decode("utf-8", errors="replace").split("\n"), offset + len(complete))
+
+    # Append `text` to the history file and index its lines in the same step.
+    # embed_fn(line) -> vector stores an embedding per line for similar().
+    def append(self, text, embed_fn=None):
+        with self._lock:
+            self._catch_up()
+            data = text.encode("utf-8")
+            with open(self.history_path, "ab") as f:
+                f.write(data)
+                end = f.tell()
+            self._index_lines(text.split("\n"), end, embed_fn)
+
+    # Most recent lines containing any query term, oldest first. Each term reads at most
+    # `limit` postings, so the cost does not grow with the length of the history.
+    def search(self, query, limit=HISTORY_RESULTS):
+        with self._lock:
+            self._catch_up()
+            line_ids = set()
+            for term in set(tokenize(query)):
+                line_ids.update(row[0] for row in self._conn.execute(
+                    "SELECT line_id FROM postings WHERE term = ? ORDER BY line_id DESC LIMIT ?", (term, limit)))
+            newest = sorted(line_ids)[-limit:]
+            if not newest:
+                return []
+            placeholders = ",".join("?" * len(newest))
+            return [row[0] for row in self._conn.execute(
+                f"SELECT text FROM lines WHERE id IN ({placeholders}) ORDER BY id", newest)]
+
+    # Lines whose stored embedding is closest to `vector`, among the last `window` embedded lines
+    def similar(self, vector, top_k=5, window=HISTORY_VECTOR_WINDOW):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT v.line_id, v.vector, l.text FROM vectors v JOIN lines l ON l.id = v.line_id "
+                "ORDER BY v.line_id DESC LIMIT ?", (window,)).fetchall()
+        if not rows or not any(vector):
+            return []
+        matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows])
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best = np.argsort(-scores)[:top_k]
+        return [rows[i][2] for i in best]
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+# One index per history file and process
+def get_history_index(history_path):
+    with _open_lock:
+        if history_path not in _open_indexes:
+            _open_indexes[history_path] = ChatHistoryIndex(history_path)
+        return _open_indexes[history_path]
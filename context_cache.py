@@ -0,0 +1,325 @@
+import os
+import time
+import hashlib
+import threading
+import requests
+from langchain_core.callbacks import BaseCallbackHandler
+from http_client import get_http_client
+from gemini_stream import stream_generate_content
+from pdf_stream import estimate_tokens
+from shared import process_singleton
+
+# Gemini context caching for the static system prompts.
+# cchat.py, chat.py and trail3.py resend fixed company facts and instructions with every
+# turn. With CONTEXT_CACHE=1 a static prefix is registered once as a cachedContents
+# resource and later calls only reference it by name, so the prefix is neither re-uploaded
+# nor billed at the full input rate. A cache is re-created shortly before its TTL runs out,
+# and again whenever Gemini reports it gone.
+#
+# Gemini only caches prefixes of at least CONTEXT_CACHE_MIN_TOKENS. The current prompts
+# are far below that (cchat.py about 485 tokens, the trail3.py persona about 300, chat.py's
+# QA instructions less), so today they are all skipped client-side without a create call
+# and sent in full; caching only starts paying off once a prefix grows past the minimum
+# (e.g. with the company PDFs inlined in the system prompt).
+#
+# Whenever caching is not available the full prompt is sent as before:
+#   - CONTEXT_CACHE is off
+#   - the prefix is below the minimum cacheable size (estimated client-side; a borderline
+#     prefix Gemini rejects falls back like any failed create)
+#   - the model has no caching (e.g. the -exp models)
+#   - creating the cache failed (retried after CONTEXT_CACHE_RETRY seconds)
+#   - another turn is creating the cache for the same prefix right now
+#
+# Tokens per turn (prompt, served from cache, sent at the full rate) are collected from the
+# usage metadata of every call and reported by ContextCache.stats().
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))  # seconds
+CONTEXT_CACHE_REFRESH_MARGIN = 60  # re-create this many seconds before the TTL ends
+CONTEXT_CACHE_RETRY = int(os.getenv("CONTEXT_CACHE_RETRY", "300"))  # back-off after a failed create
+CACHED_TOKEN_RATE = float(os.getenv("CACHED_TOKEN_RATE", "0.25"))  # price of a cached token vs a sent one
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "4096"))  # Gemini's minimum cached content size
+
+
+def prefix_key(model, system_text):
+    return model, hashlib.sha256(system_text.encode("utf-8")).hexdigest()
+
+# Gemini answers 404 for a cachedContent that expired; other errors about it name it.
+# Any other 400/403 (bad request, API key) is a real error, not a lost cache.
+def is_cache_error(error):
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None) == 404:
+        return True
+    message = f"{error} {getattr(response, 'text', '') if response is not None else ''}"
+    return "cachedcontent" in message.lower().replace(" ", "").replace("_", "")
+
+
+class ContextCache:
+    def __init__(self, enabled=CONTEXT_CACHE_ENABLED, ttl=CONTEXT_CACHE_TTL, api_key=None,
+                 min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.api_key = api_key
+        self.min_tokens = min_tokens
+        self.entries = {}  # (model, prefix hash) -> (cache name, refresh at)
+        self.failed = {}  # (model, prefix hash) -> retry at
+        self.creating = set()  # (model, prefix hash) being created by some turn
+        self.too_small = set()  # (model, prefix hash) below min_tokens
+        self.created = 0
+        self.create_errors = 0
+        self.invalidations = 0
+        self.turns = 0
+        self.cached_turns = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def _create(self, model, system_text):
+        api_key = self.api_key or os.getenv("GOOGLE_API_KEY")
+        body = {"model": f"models/{model}",
+                "systemInstruction": {"parts": [{"text": system_text}]},
+                "ttl": f"{self.ttl}s"}
+        response = get_http_client().post(f"{GEMINI_API_BASE}/cachedContents?key={api_key}", json=body)
+        return response.json()["name"]
+
+    # Whether `system_text` can be served from a cached context at all: caching is on and the
+    # prefix reaches the minimum size. Callers use it to keep their uncached request as is.
+    def cacheable(self, system_text):
+        return self.enabled and estimate_tokens(system_text) >= self.min_tokens
+
+    # Name of the cached context holding `system_text`, created on first use and re-created
+    # near expiry; None when the full prompt has to be sent
+    def name_for(self, model, system_text):
+        if not self.enabled:
+            return None
+        key = prefix_key(model, system_text)
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and now < entry[1]:
+                return entry[0]
+            if key in self.too_small or now < self.failed.get(key, 0):
+                return None
+            if estimate_tokens(system_text) < self.min_tokens:
+                print(f"ℹ️ Prompt prefix of about {estimate_tokens(system_text)} tokens is below the "
+                      f"{self.min_tokens}-token context cache minimum, sending full prompts")
+                self.too_small.add(key)
+                return None
+            # One turn creates the cache, without holding the lock over the request; the
+            # others keep using the old cache while it is refreshed, or send the full prompt
+            if key in self.creating:
+                return entry[0] if entry is not None else None
+            self.creating.add(key)
+        try:
+            name = self._create(model, system_text)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"⚠️ Context cache unavailable for {model}, sending full prompts: {e}")
+            with self._lock:
+                self.creating.discard(key)
+                self.create_errors += 1
+                self.failed[key] = time.time() + CONTEXT_CACHE_RETRY
+                self.entries.pop(key, None)
+            return None
+        with self._lock:
+            self.creating.discard(key)
+            self.created += 1
+            self.entries[key] = (name, now + max(self.ttl - CONTEXT_CACHE_REFRESH_MARGIN, 1))
+        return name
+
+    # Forget a cache Gemini no longer knows; the next name_for() creates a new one
+    def invalidate(self, model, system_text):
+        with self._lock:
+            if self.entries.pop(prefix_key(model, system_text), None) is not None:
+                self.invalidations += 1
+
+    def record_usage(self, prompt_tokens, cached_tokens=0, output_tokens=0):
+        with self._lock:
+            self.turns += 1
+            self.cached_turns += cached_tokens > 0
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+
+    def stats(self):
+        with self._lock:
+            turns = self.turns or 1
+            sent = self.prompt_tokens - self.cached_tokens
+            return {
+                "enabled": self.enabled,
+                "caches": len(self.entries),
+                "created": self.created,
+                "create_errors": self.create_errors,
+                "below_minimum": len(self.too_small),
+                "invalidations": self.invalidations,
+                "turns": self.turns,
+                "cached_turns": self.cached_turns,
+                "prompt_tokens_per_turn": round(self.prompt_tokens / turns, 1),
+                "cached_tokens_per_turn": round(self.cached_tokens / turns, 1),
+                "sent_tokens_per_turn": round(sent / turns, 1),
+                "billed_input_tokens_per_turn": round((sent + CACHED_TOKEN_RATE * self.cached_tokens) / turns, 1),
+                "output_tokens_per_turn": round(self.output_tokens / turns, 1),
+            }
+
+
+# One context cache per process, created on first use
+get_context_cache = process_singleton(ContextCache)
+
+
+# === REST: generateContent with the static prefix cached ===
+def content_payload(name, system_text, contents, generation_config=None):
+    if name is not None:
+        payload = {"cachedContent": name, "contents": contents}
+    else:
+        payload = {"systemInstruction": {"parts": [{"text": system_text}]}, "contents": contents}
+    if generation_config:
+        payload["generationConfig"] = generation_config
+    return payload
+
+def record_metadata(cache, metadata, usage=None):
+    prompt_tokens = metadata.get("promptTokenCount", 0)
+    cached_tokens = metadata.get("cachedContentTokenCount", 0)
+    output_tokens = metadata.get("candidatesTokenCount", 0)
+    cache.record_usage(prompt_tokens, cached_tokens, output_tokens)
+    if usage is not None:
+        usage.update(cached=cached_tokens > 0, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens,
+                     sent_tokens=prompt_tokens - cached_tokens, output_tokens=output_tokens)
+
+# `contents` is the per-turn part. Returns the text of the first candidate. Pass a dict as
+# `usage` to get this call's token counts (prompt/cached/sent/output and whether it was cached).
+def generate_content(model, system_text, contents, api_key=None, usage=None, cache=None, generation_config=None):
+    cache = cache or get_context_cache()
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    url = f"{GEMINI_API_BASE}/models/{model}:generateContent?key={api_key}"
+    name = cache.name_for(model, system_text)
+    result = None
+    if name is not None:
+        try:
+            result = get_http_client().post(url, json=content_payload(name, system_text, contents,
+                                                                       generation_config)).json()
+        except requests.exceptions.HTTPError as e:
+            if not is_cache_error(e):
+                raise
+            cache.invalidate(model, system_text)
+    if result is None:
+        result = get_http_client().post(url, json=content_payload(None, system_text, contents,
+                                                                   generation_config)).json()
+
+    record_metadata(cache, result.get("usageMetadata", {}), usage)
+    return result["candidates"][0]["content"]["parts"][0]["text"]
+
+# Streaming variant (streamGenerateContent), yielding the text of each chunk; the token
+# counts are recorded once the stream is complete
+def stream_content(model, system_text, contents, api_key=None, usage=None, cache=None, generation_config=None):
+    cache = cache or get_context_cache()
+    metadata = {}
+
+    def stream(name):
+        return stream_generate_content(model, content_payload(name, system_text, contents, generation_config),
+                                       api_key=api_key, usage=metadata)
+
+    yield from stream_with_fallback(model, system_text, stream, lambda: stream(None), cache=cache)
+    record_metadata(cache, metadata, usage)
+
+
+# === LangChain: ChatGoogleGenerativeAI(cached_content=...) with the same fall-back ===
+# Pass as `config={"callbacks": [CacheUsageCallback()]}` to record the token counts of
+# every model call of a chain
+class CacheUsageCallback(BaseCallbackHandler):
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations[:1]:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                details = metadata.get("input_token_details") or {}
+                (self.cache or get_context_cache()).record_usage(metadata.get("input_tokens", 0),
+                                                                 details.get("cache_read", 0),
+                                                                 metadata.get("output_tokens", 0))
+
+# cached_call(name) runs the turn against the cached prefix, full_call() with the full prompt
+def invoke_with_fallback(model, system_text, cached_call, full_call, cache=None):
+    cache = cache or get_context_cache()
+    name = cache.name_for(model, system_text)
+    if name is None:
+        return full_call()
+    try:
+        return cached_call(name)
+    except Exception as e:
+        if not is_cache_error(e):
+            raise
+        cache.invalidate(model, system_text)
+        return full_call()
+
+# Streaming variant: a stale cache shows up before the first chunk, so only then is the
+# turn retried with the full prompt
+def stream_with_fallback(model, system_text, cached_stream, full_stream, cache=None):
+    cache = cache or get_context_cache()
+    name = cache.name_for(model, system_text)
+    if name is None:
+        yield from full_stream()
+        return
+    started = False
+    try:
+        for chunk in cached_stream(name):
+            started = True
+            yield chunk
+    except Exception as e:
+        if started or not is_cache_error(e):
+            raise
+        cache.invalidate(model, system_text)
+        yield from full_stream()
+
+
+# === Demo: tokens and bytes per turn, full prompt vs cached prefix, against the fake Gemini ===
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare full-prompt and context-cached Gemini turns.")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--ttl", type=int, default=3600, help="cache TTL in seconds (small values show refreshes)")
+    args = parser.parse_args()
+
+    import glob
+    from fake_servers import start_fake_gemini
+    from intent_router import CCHAT_FACTS
+    from pdf_stream import iter_pdf_pages
+
+    # Stand-in for the cchat.py system prompt (which needs langchain_google_genai to import),
+    # and the same prompt with the company PDFs inlined: only the latter is big enough to cache
+    short_prompt = ("You are IQ Bot, built by IQ TechMax. Provide short and crisp answers based on the user "
+                    "query, and elaborate if more details are requested.\n\nCompany Information:\n" +
+                    "\n".join(CCHAT_FACTS.values()) +
+                    "\nBefore answering, please review the previous conversation exchanges.")
+    documents = "\n".join(text for path in sorted(glob.glob("*.pdf")) for _, text in iter_pdf_pages(path))
+    long_prompt = short_prompt + "\n\nCompany documents:\n" + documents
+
+    model = "gemini-2.0-flash-001"
+    questions = ["What services do you offer?", "Tell me about IQ Lens", "Who founded the company?",
+                 "Do you work with blockchain?", "How do I contact sales?"]
+
+    def run(label, caching, server_caching=True, expire_after=None, system_prompt=long_prompt):
+        server, base = start_fake_gemini(caching=server_caching)
+        global GEMINI_API_BASE
+        GEMINI_API_BASE = base
+        cache = ContextCache(enabled=caching, ttl=args.ttl, api_key="fake")
+        started = time.perf_counter()
+        for turn in range(args.turns):
+            if expire_after is not None and turn == expire_after:
+                server.caches.clear()  # Gemini dropped the cache early
+            contents = [{"role": "user", "parts": [{"text": questions[turn % len(questions)]}]}]
+            generate_content(model, system_prompt, contents, api_key="fake", cache=cache)
+        elapsed = (time.perf_counter() - started) / args.turns * 1000
+        server.shutdown()
+        print(f"{label}: {elapsed:.1f} ms/turn, {server.stats['bytes_received'] // args.turns} bytes sent/turn")
+        print(f"   📊 {cache.stats()}")
+
+    print(f"📏 cchat-sized prompt ~{estimate_tokens(short_prompt)} tokens, with PDFs ~{estimate_tokens(long_prompt)}, "
+          f"cache minimum {CONTEXT_CACHE_MIN_TOKENS}")
+    run("✂️ prompt below minimum", caching=True, system_prompt=short_prompt)
+    run("📨 full prompt         ", caching=False)
+    run("🗄️ cached prefix       ", caching=True)
+    run("🔁 cache lost mid-run  ", caching=True, expire_after=args.turns // 2)
+    run("🚫 caching unsupported ", caching=True, server_caching=False)
@@ -0,0 +1,183 @@
+import os
+import zlib
+import argparse
+import numpy as np
+from pdf_stream import estimate_tokens
+from sparse_index import tokenize
+
+# Context assembly between retrieval and the prompt.
+# Chunks overlap by up to 150 characters (chunk_text / iter_chunks) and neighbouring
+# chunks of one document are often retrieved together, so joining them raw repeats
+# text in every prompt. pack_context():
+#   1. merges chunks of the same document whose texts overlap or contain one another
+#   2. picks passages by maximal marginal relevance (MMR): rank relevance minus the
+#      highest similarity to a passage already picked, so near-repeats lose out
+#   3. stops when CONTEXT_TOKEN_BUDGET (estimated Gemini tokens) is filled
+# Callers retrieve top_k * PACK_CANDIDATES matches and let the budget decide how many fit.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "768"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = rank order only, lower = more diversity
+PACK_CANDIDATES = 2  # matches retrieved per final chunk
+MIN_OVERLAP = 20  # characters two texts must share to be merged
+MAX_OVERLAP = 400
+HASH_DIM = 4096  # hashed term-frequency vectors used for the similarity matrix
+
+
+def document_key(vector_id, metadata):
+    return metadata.get("source") or str(vector_id).rsplit("-", 1)[0]
+
+# Length of the longest suffix of `a` that is a prefix of `b` (0 below MIN_OVERLAP)
+def text_overlap(a, b):
+    probe = b[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    start = max(0, len(a) - MAX_OVERLAP)
+    position = a.find(probe, start)
+    while position != -1:
+        if b.startswith(a[position:]):
+            return len(a) - position
+        position = a.find(probe, position + 1)
+    return 0
+
+# Glue b onto a if one contains the other or they overlap; None if they are unrelated
+def merge_texts(a, b):
+    if b in a:
+        return a
+    if a in b:
+        return b
+    overlap = text_overlap(a, b)
+    if overlap:
+        return a + b[overlap:]
+    overlap = text_overlap(b, a)
+    if overlap:
+        return b + a[overlap:]
+    return None
+
+
+# matches: [(score, id, metadata)] best first, metadata["text"] holding the chunk.
+# Returns passages [{"text", "rank", "ids", "metadata"}] ordered by their best rank.
+def merge_overlapping(matches):
+    groups = {}
+    for rank, (_, vector_id, metadata) in enumerate(matches):
+        text = metadata.get("text", "")
+        if text:
+            groups.setdefault(document_key(vector_id, metadata), []).append((rank, vector_id, metadata, text))
+
+    passages = []
+    for parts in groups.values():
+        # Document order, so neighbouring chunks are compared with each other
+        parts.sort(key=lambda part: (part[2].get("page", 0), part[2].get("offset", part[2].get("start_index", 0))))
+        current = None
+        for rank, vector_id, metadata, text in parts:
+            merged = merge_texts(current["text"], text) if current else None
+            if merged is None:
+                current = {"text": text, "rank": rank, "ids": [vector_id], "metadata": metadata}
+                passages.append(current)
+            else:
+                current["text"] = merged
+                current["rank"] = min(current["rank"], rank)
+                current["ids"].append(vector_id)
+    return sorted(passages, key=lambda passage: passage["rank"])
+
+
+def hashed_term_vectors(texts, dim=HASH_DIM):
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            matrix[row, zlib.crc32(token.encode("utf-8")) % dim] += 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# Indices of the passages to keep, in pick order. One greedy MMR pass: every step
+# scores all remaining passages at once and skips those that no longer fit the budget.
+def select_mmr(texts, relevance, budget, lam=MMR_LAMBDA):
+    if not texts:
+        return []
+    vectors = hashed_term_vectors(texts)
+    similarity = vectors @ vectors.T
+    costs = np.array([estimate_tokens(text) for text in texts])
+    redundancy = np.zeros(len(texts), dtype=np.float32)
+    available = np.ones(len(texts), dtype=bool)
+    chosen = []
+    remaining = budget
+    while True:
+        available &= costs <= remaining
+        if not available.any():
+            break
+        scores = np.where(available, lam * relevance - (1 - lam) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        available[best] = False
+        remaining -= costs[best]
+        redundancy = np.maximum(redundancy, similarity[best])
+    return chosen
+
+# Merged, diversified passages that fit the token budget, best first
+def pack_matches(matches, budget=CONTEXT_TOKEN_BUDGET, lam=MMR_LAMBDA):
+    passages = merge_overlapping(matches)
+    if not passages:
+        return []
+    relevance = 1.0 - np.array([passage["rank"] for passage in passages], dtype=np.float32) / len(matches)
+    chosen = select_mmr([passage["text"] for passage in passages], relevance, budget, lam)
+    if not chosen:
+        # Even the best passage is over budget: keep its start rather than nothing
+        best = dict(passages[0], text=passages[0]["text"][:budget * 4])
+        return [best]
+    return [passages[i] for i in chosen]
+
+# Same "matches -> context string" shape as the "\n".join(...) it replaces
+def pack_context(matches, budget=CONTEXT_TOKEN_BUDGET, lam=MMR_LAMBDA):
+    return "\n".join(passage["text"] for passage in pack_matches(matches, budget, lam))
+
+
+# === Benchmark: packed context vs raw join ===
+if __name__ == "__main__":
+    import glob
+    import time
+    import tempfile
+    from fake_servers import fake_embedding
+    from pdf_stream import iter_pdf_pages, iter_chunks
+    from local_index import build_index, LocalIndex
+    from sparse_index import SparseIndexStore, hybrid_search, dense_candidates, BENCH_QUERIES
+
+    parser = argparse.ArgumentParser(description="Compare packed context with the raw join of retrieved chunks.")
+    parser.add_argument("--pdfs", default=os.getcwd(), help="folder with the PDFs (default: the repo root)")
+    parser.add_argument("-k", type=int, default=3, help="chunks in the raw context")
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    ids, texts, metadatas = [], [], []
+    for path in sorted(glob.glob(os.path.join(args.pdfs, "*.pdf"))):
+        for chunk in iter_chunks(iter_pdf_pages(path)):
+            ids.append(f"{os.path.basename(path)}-{chunk['index']}")
+            texts.append(chunk["text"])
+            metadatas.append({"text": chunk["text"], "page": chunk["page"], "offset": chunk["offset"]})
+    workdir = tempfile.mkdtemp(prefix="bench-pack-")
+    build_index(workdir, ids, [fake_embedding(t) for t in texts], metadatas)
+    store = SparseIndexStore(os.path.join(workdir, "bm25.json"))
+    store.upsert(zip(ids, texts, metadatas))
+    store.save()
+    index = LocalIndex(workdir)
+    sparse_path = os.path.join(workdir, "bm25.json")
+
+    def retrieve(query, top_k):
+        dense = index.search(fake_embedding(query), dense_candidates(top_k))
+        return hybrid_search(query, dense, top_k, sparse_path)
+
+    print(f"📚 {len(ids)} chunks, {len(BENCH_QUERIES)} queries, raw k={args.k}, "
+          f"packed from {args.k * PACK_CANDIDATES} with a {args.budget}-token budget")
+    totals = {"raw": [0, 0, 0.0], "packed": [0, 0, 0.0]}  # tokens, hits, seconds
+    for query, expected in BENCH_QUERIES:
+        raw = "\n".join(m[2]["text"] for m in retrieve(query, args.k))
+        started = time.perf_counter()
+        candidates = retrieve(query, args.k * PACK_CANDIDATES)
+        packed = pack_context(candidates, args.budget)
+        elapsed = time.perf_counter() - started
+        for name, context in [("raw", raw), ("packed", packed)]:
+            totals[name][0] += estimate_tokens(context)
+            totals[name][1] += expected in context.lower()
+        totals["packed"][2] += elapsed
+    for name, (tokens, hits, seconds) in totals.items():
+        print(f"{name:7s} {tokens / len(BENCH_QUERIES):7.1f} tokens/query  answer present {hits}/{len(BENCH_QUERIES)}"
+              + (f"  retrieve+pack {seconds / len(BENCH_QUERIES) * 1000:.2f} ms" if seconds else ""))
@@ -0,0 +1,118 @@
+import os
+import re
+import zlib
+import numpy as np
+
+# Near-duplicate chunk filter (MinHash + LSH), run before embedding.
+# Our PDFs repeat the same boilerplate (company intro, contact block, service lists),
+# so many chunks say the same thing in almost the same words. Only the first copy
+# is embedded; later copies are skipped and never reach the index or the prompts.
+#
+# Each chunk is reduced to the set of its 5-word shingles and summarized by a
+# MinHash signature of NUM_PERM values; two chunks agree on a signature value with
+# probability equal to the Jaccard similarity of their shingle sets. LSH buckets the
+# signatures by bands so a new chunk is only compared with likely matches.
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))  # estimated Jaccard similarity
+SHINGLE_WORDS = 5
+NUM_PERM = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.7 similarity almost always share a bucket
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(1)
+# a < 2^29 and shingle hashes < 2^32 keep a * x + b inside uint64
+_A = _rng.integers(1, 1 << 29, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 29, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+# MinHash signature as a uint32 array of NUM_PERM values
+def minhash(text):
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles(text)], dtype=np.uint64)
+    values = (hashes[:, None] * _A + _B) % _PRIME
+    return (values.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+def similarity(signature, other):
+    return float(np.mean(signature == other))
+
+
+# Signatures are kept as hex strings so they can live in the ingest manifest:
+#   signatures {vector id: hex signature} of the chunks that were embedded
+#   duplicates {vector id: id of the embedded chunk it duplicates}
+class NearDuplicateFilter:
+    def __init__(self, signatures=None, duplicates=None, threshold=DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.signatures = {}
+        self.duplicates = dict(duplicates or {})
+        self.orphans = set()  # duplicates whose kept copy changed, see take_orphans()
+        self.buckets = {}
+        for vector_id, signature in (signatures or {}).items():
+            self._add(vector_id, np.frombuffer(bytes.fromhex(signature), dtype="<u4"))
+
+    def _bands(self, signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+    def _add(self, vector_id, signature):
+        self.signatures[vector_id] = signature
+        for key in self._bands(signature):
+            self.buckets.setdefault(key, set()).add(vector_id)
+
+    # Returns the id of an already kept chunk that `text` nearly duplicates, or None after
+    # keeping the chunk. A changed chunk replaces the old signature stored under the same id,
+    # and the chunks that duplicated its old text become orphans.
+    def check(self, vector_id, text):
+        self.duplicates.pop(vector_id, None)
+        if self._discard(vector_id):
+            self.orphans |= self._orphan({vector_id})
+        signature = minhash(text)
+        candidates = set()
+        for key in self._bands(signature):
+            candidates |= self.buckets.get(key, set())
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            score = similarity(signature, self.signatures[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is not None:
+            self.duplicates[vector_id] = best
+            return best
+        self._add(vector_id, signature)
+        return None
+
+    def _discard(self, vector_id):
+        signature = self.signatures.pop(vector_id, None)
+        if signature is not None:
+            for key in self._bands(signature):
+                self.buckets[key].discard(vector_id)
+        return signature is not None
+
+    def _orphan(self, kept_ids):
+        orphans = {dup for dup, kept in self.duplicates.items() if kept in kept_ids}
+        for vector_id in orphans:
+            del self.duplicates[vector_id]
+        return orphans
+
+    # Forget chunks that left the index. Returns the ids of duplicates whose kept copy
+    # was among them; those chunks have to be embedded again on their own.
+    def remove(self, ids):
+        ids = set(ids)
+        for vector_id in ids:
+            self.duplicates.pop(vector_id, None)
+        orphans = self._orphan({vector_id for vector_id in ids if self._discard(vector_id)}) - ids
+        self.orphans -= ids
+        return orphans
+
+    # Duplicates orphaned by check() since the last call (their kept copy changed text)
+    def take_orphans(self):
+        orphans, self.orphans = self.orphans, set()
+        return orphans
+
+    def to_manifest(self):
+        return ({vector_id: signature.astype("<u4").tobytes().hex() for vector_id, signature in self.signatures.items()},
+                dict(self.duplicates))
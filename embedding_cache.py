@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from shared import process_singleton, hit_rate
+
+# Persistent embedding cache shared by every embedding call site.
+# Entries are keyed by (model, task_type, sha256(text)) and stored as float32 blobs
+# in one SQLite file. When the cache grows past max_entries the least recently used
+# entries are evicted.
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite3")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+
+def cache_key(model, task_type, text):
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}|{task_type or ''}|{text_hash}"
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBED_CACHE_PATH, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # Returns a list aligned with `texts`: the cached vector, or None on a miss
+    def get_many(self, model, task_type, texts):
+        keys = [cache_key(model, task_type, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return [array("f", found[key]).tolist() if key in found else None for key in keys]
+
+    def get(self, model, task_type, text):
+        return self.get_many(model, task_type, [text])[0]
+
+    def put_many(self, model, task_type, texts, vectors):
+        now = time.time()
+        rows = [(cache_key(model, task_type, text), array("f", vector).tobytes(), now)
+                for text, vector in zip(texts, vectors) if vector]
+        if not rows:
+            return
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def put(self, model, task_type, text, vector):
+        self.put_many(model, task_type, [text], [vector])
+
+    # Drop the least recently used entries down to 90% of the limit
+    def _evict(self):
+        excess = self._count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._count -= excess
+        self.evictions += excess
+
+    def stats(self):
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": hit_rate(self.hits, self.hits + self.misses),
+        }
+
+
+# One cache per process, opened on first use
+get_cache = process_singleton(EmbeddingCache)
+
+# Embed one text through the cache; embed_fn(text) is only called on a miss
+def cached_embedding(model, task_type, text, embed_fn):
+    cache = get_cache()
+    vector = cache.get(model, task_type, text)
+    if vector is None:
+        vector = embed_fn(text)
+        if vector:
+            cache.put(model, task_type, text, vector)
+    return vector
+
+# Embed many texts through the cache; embed_many_fn(texts) only receives the misses
+# and must return vectors (or None for failures) in the same order
+def cached_embeddings(model, task_type, texts, embed_many_fn):
+    cache = get_cache()
+    vectors = cache.get_many(model, task_type, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        fresh = embed_many_fn([texts[i] for i in missing])
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+        cache.put_many(model, task_type, [texts[i] for i in missing], fresh)
+    return vectors
+
+
+# Drop-in wrapper for LangChain embeddings (e.g. GoogleGenerativeAIEmbeddings)
+# used by Chroma in chat.py and Vector_Db.py
+class CachedEmbeddings:
+    def __init__(self, embeddings, model, document_task_type="retrieval_document",
+                 query_task_type="retrieval_query"):
+        self.embeddings = embeddings
+        self.model = model
+        self.document_task_type = document_task_type
+        self.query_task_type = query_task_type
+
+    def embed_documents(self, texts):
+        return cached_embeddings(self.model, self.document_task_type, list(texts),
+                                 self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return cached_embedding(self.model, self.query_task_type, text, self.embeddings.embed_query)
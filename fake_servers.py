@@ -0,0 +1,351 @@
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import contextlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the remote APIs used by the ingestion and chat scripts.
+# Point the scripts at them with e.g. GEMINI_API_BASE=http://127.0.0.1:8765/v1beta
+# PINECONE_HOST=http://127.0.0.1:8766 and OLLAMA_BASE_URL=http://127.0.0.1:8767
+
+EMBED_DIM = 768
+PINECONE_MAX_REQUEST_BYTES = 2 * 1024 * 1024  # Pinecone rejects larger upserts
+
+# === Deterministic fake embedding ===
+# Hashed bag-of-words, so texts sharing words get similar vectors
+def fake_embedding(text, dim=EMBED_DIM):
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        slot = int.from_bytes(digest[:4], "little") % dim
+        vector[slot] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+# Deterministic completion that echoes the end of the prompt, with markdown stars
+# so the clean-up of the callers is exercised
+def fake_reply(prompt, words=40):
+    tail = " ".join(re.findall(r"\w+", prompt)[-12:])
+    filler = ("IQ TechMax builds **AI**, AR/VR, blockchain and metaverse products such as IQ Lens, IQ Verse "
+              "and IQ Bot, with offices in Chennai, Bengaluru, France and the USA.").split(" ")
+    body = [filler[i % len(filler)] for i in range(words)]
+    return f"This is a fake reply about: {tail}. " + " ".join(body)
+
+
+def parts_text(parts):
+    return " ".join(part.get("text", "") for part in parts)
+
+
+def reply_pieces(reply, words_per_piece=3):
+    words = reply.split(" ")
+    return [" ".join(words[i:i + words_per_piece]) + (" " if i + words_per_piece < len(words) else "")
+            for i in range(0, len(words), words_per_piece)]
+
+
+# === Shared handler plumbing ===
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+    disable_nagle_algorithm = True  # headers and body are separate writes; avoids 40 ms delayed-ACK stalls
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Chunked transfer encoding, one chunk per item of `pieces` (bytes), `delay` seconds apart
+    def _send_chunked(self, pieces, content_type, delay=0.0):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for data in pieces:
+            if delay:
+                time.sleep(delay)
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    # Server-sent events, one event per body in `events`
+    def _send_sse(self, events, delay=0.0):
+        pieces = (f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8") for event in events)
+        self._send_chunked(pieces, "text/event-stream", delay)
+
+    # Reads the request, updates stats and applies latency/error injection.
+    # Returns (path, payload), or (path, None) when an injected error was sent.
+    def _read_request(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        path = self.path.split("?")[0]
+
+        with server.lock:
+            server.stats["requests"] += 1
+            server.stats["bytes_received"] += length
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send_json(503, {"error": {"code": 503, "message": "fake overload"}})
+            return path, None
+        return path, json.loads(body or b"{}")
+
+
+# === Fake Gemini REST API ===
+class FakeGeminiHandler(FakeHandler):
+    def do_POST(self):
+        server = self.server
+        path, payload = self._read_request()
+        if payload is None:
+            return
+
+        if path.endswith(":embedContent"):
+            with server.lock:
+                server.stats["texts_embedded"] += 1
+            text = " ".join(part.get("text", "") for part in payload["content"]["parts"])
+            return self._send_json(200, {"embedding": {"values": fake_embedding(text)}})
+
+        if path.endswith(":batchEmbedContents"):
+            embeddings = []
+            for request in payload.get("requests", []):
+                text = " ".join(part.get("text", "") for part in request["content"]["parts"])
+                embeddings.append({"values": fake_embedding(text)})
+            with server.lock:
+                server.stats["texts_embedded"] += len(embeddings)
+            return self._send_json(200, {"embeddings": embeddings})
+
+        # Context caching: the cache holds a system instruction until its TTL runs out.
+        # Like Gemini, content below min_cache_tokens is rejected; with caching=False every
+        # create fails, as for a model without caching.
+        if path.endswith("/cachedContents"):
+            if not server.caching:
+                return self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                                       "message": "Model does not support cached content"}})
+            text = parts_text(payload.get("systemInstruction", {}).get("parts", []))
+            if len(text) // 4 < server.min_cache_tokens:
+                return self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                                       "message": f"Cached content is too small. total_token_count="
+                                                                  f"{len(text) // 4}, min_total_token_count="
+                                                                  f"{server.min_cache_tokens}"}})
+            ttl = float(payload.get("ttl", "3600s").rstrip("s"))
+            with server.lock:
+                server.stats["caches_created"] += 1
+                name = f"cachedContents/fake-{server.stats['caches_created']}"
+                server.caches[name] = (text, time.time() + ttl)
+            return self._send_json(200, {"name": name, "model": payload.get("model"),
+                                         "usageMetadata": {"totalTokenCount": len(text) // 4}})
+
+        if path.endswith(":generateContent") or path.endswith(":streamGenerateContent"):
+            cached_text = ""
+            if payload.get("cachedContent"):
+                with server.lock:
+                    cached_text, expires = server.caches.get(payload["cachedContent"], (None, 0))
+                if cached_text is None or time.time() >= expires:
+                    return self._send_json(403, {"error": {"code": 403, "status": "PERMISSION_DENIED",
+                                                           "message": "CachedContent not found (or permission denied)"}})
+            sent_text = " ".join([parts_text(payload.get("systemInstruction", {}).get("parts", []))] +
+                                 [parts_text(content.get("parts", [])) for content in payload.get("contents", [])])
+            reply = fake_reply(cached_text + " " + sent_text)
+            # Structured output (responseMimeType application/json): the reply as the
+            # {"response", "updatedSummary"} object of the trail*.py scripts
+            if payload.get("generationConfig", {}).get("responseMimeType") == "application/json":
+                summary = "User asked about: " + " ".join(re.findall(r"\w+", sent_text)[-8:])
+                reply = json.dumps({"response": reply, "updatedSummary": summary})
+            with server.lock:
+                server.stats["generations"] += 1
+                server.stats["cached_generations"] += bool(cached_text)
+            usage = {"promptTokenCount": len(cached_text) // 4 + len(sent_text) // 4,
+                     "candidatesTokenCount": len(reply) // 4}
+            if cached_text:
+                usage["cachedContentTokenCount"] = len(cached_text) // 4
+            # A few words per event, like the real stream; the blocking call takes as long
+            # as the whole stream
+            pieces = reply_pieces(reply)
+            if path.endswith(":generateContent"):
+                time.sleep(server.token_delay * len(pieces))
+                return self._send_json(200, {"candidates": [{"content": {"parts": [{"text": reply}], "role": "model"}}],
+                                             "usageMetadata": usage})
+            events = [{"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]} for piece in pieces]
+            events[-1]["usageMetadata"] = usage
+            return self._send_sse(events, server.token_delay)
+
+        self._send_json(404, {"error": {"code": 404, "message": f"unknown path {path}"}})
+
+
+# === Fake Pinecone data-plane REST API ===
+# Vectors are kept in memory per namespace: {namespace: {id: (values, metadata)}}
+class FakePineconeHandler(FakeHandler):
+    def do_POST(self):
+        server = self.server
+        if int(self.headers.get("Content-Length", 0)) > PINECONE_MAX_REQUEST_BYTES:
+            self.rfile.read(int(self.headers["Content-Length"]))
+            return self._send_json(400, {"code": 3, "message": "request size exceeds 2MB limit"})
+
+        path, payload = self._read_request()
+        if payload is None:
+            return
+        namespace = server.namespaces.setdefault(payload.get("namespace", ""), {})
+
+        if path == "/vectors/upsert":
+            with server.lock:
+                for vector in payload["vectors"]:
+                    namespace[vector["id"]] = (vector["values"], vector.get("metadata", {}))
+                server.stats["vectors_upserted"] += len(payload["vectors"])
+            return self._send_json(200, {"upsertedCount": len(payload["vectors"])})
+
+        if path == "/vectors/delete":
+            with server.lock:
+                if payload.get("deleteAll"):
+                    namespace.clear()
+                for vector_id in payload.get("ids", []):
+                    namespace.pop(vector_id, None)
+            return self._send_json(200, {})
+
+        if path == "/query":
+            matches = fake_query(namespace, payload["vector"], payload.get("topK", 10),
+                                 payload.get("filter"), payload.get("includeMetadata", False))
+            return self._send_json(200, {"matches": matches, "namespace": payload.get("namespace", "")})
+
+        self._send_json(404, {"code": 5, "message": f"unknown path {path}"})
+
+
+# === Fake Ollama API ===
+# /api/generate streams newline-delimited JSON like Ollama. At most `parallel` generations
+# run at once (Ollama's OLLAMA_NUM_PARALLEL); the others wait for a slot.
+class FakeOllamaHandler(FakeHandler):
+    def do_POST(self):
+        server = self.server
+        path, payload = self._read_request()
+        if payload is None:
+            return
+        if path != "/api/generate":
+            return self._send_json(404, {"error": f"unknown path {path}"})
+
+        model = payload.get("model", "llama2")
+        pieces = reply_pieces(fake_reply(payload.get("prompt", "")))
+        with server.slots:
+            with server.lock:
+                server.stats["generations"] += 1
+                server.active += 1
+                server.stats["peak_active"] = max(server.stats["peak_active"], server.active)
+            try:
+                if payload.get("stream") is False:
+                    time.sleep(server.token_delay * len(pieces))
+                    return self._send_json(200, {"model": model, "response": "".join(pieces), "done": True})
+                lines = [{"model": model, "response": piece, "done": False} for piece in pieces]
+                lines.append({"model": model, "response": "", "done": True, "eval_count": len(pieces)})
+                self._send_chunked((json.dumps(line).encode("utf-8") + b"\n" for line in lines),
+                                   "application/x-ndjson", server.token_delay)
+            finally:
+                with server.lock:
+                    server.active -= 1
+
+
+# Brute-force cosine search with support for simple {"field": value} / {"field": {"$eq": value}} filters
+def fake_query(namespace, vector, top_k, metadata_filter=None, include_metadata=False):
+    def matches_filter(metadata):
+        for field, condition in (metadata_filter or {}).items():
+            expected = condition.get("$eq") if isinstance(condition, dict) else condition
+            if metadata.get(field) != expected:
+                return False
+        return True
+
+    query_norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    scored = []
+    for vector_id, (values, metadata) in list(namespace.items()):
+        if not matches_filter(metadata):
+            continue
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        score = sum(a * b for a, b in zip(vector, values)) / (norm * query_norm)
+        scored.append((score, vector_id, metadata))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    results = []
+    for score, vector_id, metadata in scored[:top_k]:
+        match = {"id": vector_id, "score": score}
+        if include_metadata:
+            match["metadata"] = metadata
+        results.append(match)
+    return results
+
+
+def _start(handler, port, latency, error_rate, stats):
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.lock = threading.Lock()
+    server.stats = dict(stats, requests=0, bytes_received=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Start a fake server on a background thread; returns (server, base_url).
+# Use port=0 to pick a free port. Call server.shutdown() when done.
+# token_delay is the pause before every event of a streamed completion.
+# caching=False makes every cachedContents create fail, as for an unsupported model;
+# min_cache_tokens is the smallest cacheable content (4096 for the current Gemini models).
+def start_fake_gemini(port=0, latency=0.0, error_rate=0.0, token_delay=0.0, caching=True, min_cache_tokens=4096):
+    server = _start(FakeGeminiHandler, port, latency, error_rate,
+                    {"texts_embedded": 0, "generations": 0, "caches_created": 0, "cached_generations": 0})
+    server.token_delay = token_delay
+    server.caching = caching
+    server.min_cache_tokens = min_cache_tokens
+    server.caches = {}  # name -> (system text, expiry time)
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+def start_fake_pinecone(port=0, latency=0.0, error_rate=0.0):
+    server = _start(FakePineconeHandler, port, latency, error_rate, {"vectors_upserted": 0})
+    server.namespaces = {}
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# parallel=0 lets every generation run at once.
+def start_fake_ollama(port=0, latency=0.0, error_rate=0.0, token_delay=0.02, parallel=4):
+    server = _start(FakeOllamaHandler, port, latency, error_rate, {"generations": 0, "peak_active": 0})
+    server.token_delay = token_delay
+    server.slots = threading.BoundedSemaphore(parallel) if parallel else contextlib.nullcontext()
+    server.active = 0
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local fake API servers.")
+    parser.add_argument("--port", type=int, default=8765, help="fake Gemini port")
+    parser.add_argument("--pinecone-port", type=int, default=8766, help="fake Pinecone port")
+    parser.add_argument("--ollama-port", type=int, default=8767, help="fake Ollama port")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    parser.add_argument("--no-caching", action="store_true", help="reject Gemini context cache creation")
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="generations the fake Ollama runs at once")
+    args = parser.parse_args()
+
+    gemini, gemini_url = start_fake_gemini(args.port, args.latency, args.error_rate, args.token_delay,
+                                           not args.no_caching)
+    pinecone, pinecone_url = start_fake_pinecone(args.pinecone_port, args.latency, args.error_rate)
+    ollama, ollama_url = start_fake_ollama(args.ollama_port, args.latency, args.error_rate, args.token_delay,
+                                           args.ollama_parallel)
+    print(f"🧪 Fake Gemini API on {gemini_url} (set GEMINI_API_BASE to this)")
+    print(f"🧪 Fake Pinecone API on {pinecone_url} (set PINECONE_HOST to this)")
+    print(f"🧪 Fake Ollama API on {ollama_url} (set OLLAMA_BASE_URL to this)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        gemini.shutdown()
+        pinecone.shutdown()
+        ollama.shutdown()
+        print(f"📊 Gemini: {gemini.stats}")
+        print(f"📊 Pinecone: {pinecone.stats}")
+        print(f"📊 Ollama: {ollama.stats}")
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from http_client import get_http_client
+from shared import process_singleton
+
+# Token streaming from Gemini.
+# streamGenerateContent with alt=sse answers with one server-sent event per chunk of the
+# completion, so the first words can be shown while the rest is still being generated.
+# stream_generate_content() yields the text of every chunk; strip_stars() applies the
+# `.replace("*", "")` clean-up chunk by chunk; timed_stream() records time-to-first-token
+# (TTFT) and total time of every stream in the per-process StreamMetrics, which app.py
+# serves on /iqbot/stats.
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+STREAM_METRICS_WINDOW = 1000  # most recent streams kept for the percentiles
+
+
+# Yields the text of each chunk. The first attempt is retried like any other call
+# (http_client.py); once text has been yielded a broken stream raises.
+# Pass a dict as `usage` to get the usageMetadata sent with the last chunk.
+def stream_generate_content(model, payload, api_key=None, usage=None):
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    url = f"{GEMINI_API_BASE}/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+    response = get_http_client().post(url, json=payload, stream=True)
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            if usage is not None and "usageMetadata" in event:
+                usage.update(event["usageMetadata"])
+            for candidate in event.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+
+# Removing a single character needs no look-ahead, so every chunk is cleaned as it arrives
+def strip_stars(chunks):
+    for chunk in chunks:
+        chunk = chunk.replace("*", "")
+        if chunk:
+            yield chunk
+
+
+class StreamMetrics:
+    def __init__(self, window=STREAM_METRICS_WINDOW):
+        self.ttft = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.streams = 0
+        self.chunks = 0
+        self._lock = threading.Lock()
+
+    def record(self, ttft, total, chunks):
+        with self._lock:
+            self.streams += 1
+            self.chunks += chunks
+            if ttft is not None:
+                self.ttft.append(ttft)
+            self.total.append(total)
+
+    @staticmethod
+    def _percentile(samples, q):
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1000, 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "chunks": self.chunks,
+                "ttft_p50_ms": self._percentile(self.ttft, 50),
+                "ttft_p95_ms": self._percentile(self.ttft, 95),
+                "total_p50_ms": self._percentile(self.total, 50),
+                "total_p95_ms": self._percentile(self.total, 95),
+            }
+
+
+# One metrics collector per process, created on first use
+get_stream_metrics = process_singleton(StreamMetrics)
+
+# Passes `chunks` through, timing from `started` (default: the first pull) to the first
+# non-empty chunk and to the end of the stream. A stream abandoned early is still recorded.
+def timed_stream(chunks, started=None, metrics=None):
+    metrics = metrics or get_stream_metrics()
+    started = started or time.perf_counter()
+    ttft = None
+    count = 0
+    try:
+        for chunk in chunks:
+            if ttft is None and chunk:
+                ttft = time.perf_counter() - started
+            count += 1
+            yield chunk
+    finally:
+        metrics.record(ttft, time.perf_counter() - started, count)
+
+
+# === Demo: streamed vs blocking answer against the fake Gemini ===
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare time-to-first-token of streamed and blocking Gemini calls.")
+    parser.add_argument("--prompt", default="Tell me about IQ TechMax products and services")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds between chunks of the fake")
+    parser.add_argument("--real", action="store_true", help="call the real API (needs GOOGLE_API_KEY)")
+    args = parser.parse_args()
+
+    if not args.real:
+        from fake_servers import start_fake_gemini
+        gemini, GEMINI_API_BASE = start_fake_gemini(token_delay=args.token_delay)
+    payload = {"contents": [{"parts": [{"text": args.prompt}]}]}
+    model = "gemini-1.5-flash"
+
+    started = time.perf_counter()
+    url = f"{GEMINI_API_BASE}/models/{model}:generateContent?key={os.getenv('GOOGLE_API_KEY')}"
+    blocking = get_http_client().post(url, json=payload).json()["candidates"][0]["content"]["parts"][0]["text"]
+    blocking_seconds = time.perf_counter() - started
+
+    metrics = StreamMetrics()
+    streamed = "".join(timed_stream(strip_stars(stream_generate_content(model, payload)), metrics=metrics))
+    print(f"🐢 blocking: first text after {blocking_seconds * 1000:.1f} ms")
+    print(f"⚡ streamed: {metrics.stats()}")
+    print(f"✅ same text (after * stripping): {streamed == blocking.replace('*', '')}")
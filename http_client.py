@@ -0,0 +1,205 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from functools import partial
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from shared import process_singleton
+
+# Shared HTTP layer for the Gemini and Pinecone REST calls.
+#   - one requests.Session per client: pooled keep-alive connections, no handshake per call
+#   - every attempt has a timeout and the whole call (retries included) a deadline
+#   - 429/5xx and connection errors are retried with jittered exponential backoff
+#     (Retry-After is honoured when the server sends one)
+#   - a circuit breaker per host fails calls fast after BREAKER_FAILURES consecutive
+#     failures, then lets one trial call through every BREAKER_RESET seconds
+# Errors are raised as requests exceptions, so existing `except requests.exceptions...`
+# handlers keep working. AsyncHttpClient is the asyncio front end over the same session.
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))  # keep-alive connections per host
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))  # seconds per attempt
+HTTP_DEADLINE = float(os.getenv("HTTP_DEADLINE", "60"))  # seconds per call, retries included
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))  # attempt n waits uniform(0, HTTP_BACKOFF * 2**n)
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))  # seconds
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    pass
+
+
+def retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    # Closed: every call passes. Open: none do until reset_after has passed, then a single
+    # trial call (half-open) decides whether the circuit closes again.
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_after:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            failed_trial = self.trial
+            self.trial = False
+            if ok:
+                self.consecutive = 0
+                self.opened_at = None
+                return
+            self.consecutive += 1
+            if failed_trial or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.trial else "open"
+
+
+# Retry bookkeeping for one call, shared by the sync and async clients
+class _Call:
+    def __init__(self, client, url, timeout, deadline, max_retries):
+        self.client = client
+        self.host = urlsplit(url).netloc
+        self.breaker = client.breaker(self.host)
+        self.timeout = timeout or client.timeout
+        self.end = time.monotonic() + (deadline or client.deadline)
+        self.max_retries = client.max_retries if max_retries is None else max_retries
+        self.attempt = 0
+
+    # Timeout for the next attempt; raises when the circuit is open or the deadline passed
+    def start(self):
+        if not self.breaker.allow():
+            self.client.count("short_circuited")
+            raise CircuitOpenError(f"Circuit open for {self.host}, failing fast")
+        remaining = self.end - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded for {self.host}")
+        self.client.count("requests")
+        return min(self.timeout, remaining)
+
+    # None when `response` is final (raised for a non-retryable 4xx), otherwise the
+    # seconds to wait before retrying. Raises the last error once retries run out.
+    def finish(self, response, error):
+        if response is not None and not retryable(response.status_code):
+            self.breaker.record(True)
+            response.raise_for_status()
+            return None
+        self.breaker.record(False)
+        self.client.count("failures")
+        if response is not None:
+            error = requests.exceptions.HTTPError(f"HTTP {response.status_code} from {self.host}", response=response)
+            response.close()  # hands the connection back to the pool
+        delay = self.delay(response)
+        if self.attempt >= self.max_retries or time.monotonic() + delay >= self.end:
+            raise error
+        self.attempt += 1
+        self.client.count("retries")
+        print(f"⚠️ Request to {self.host} failed ({error}), retrying in {delay:.1f}s...")
+        return delay
+
+    def delay(self, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return random.uniform(0, self.client.backoff * (2 ** self.attempt))
+
+
+class HttpClient:
+    def __init__(self, pool_size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT, deadline=HTTP_DEADLINE,
+                 max_retries=HTTP_MAX_RETRIES, backoff=HTTP_BACKOFF, headers=None):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", **(headers or {})})
+        self.breakers = {}  # host -> CircuitBreaker
+        self.counters = {"requests": 0, "retries": 0, "failures": 0, "short_circuited": 0}
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker()
+            return self.breakers[host]
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    # One attempt: (response, None) or (None, error)
+    def _send(self, url, json, data, headers, timeout, stream):
+        try:
+            return self.session.post(url, json=json, data=data, headers=headers, timeout=timeout, stream=stream), None
+        except requests.exceptions.RequestException as e:
+            return None, e
+
+    # POST with retries; returns the response of the first successful attempt
+    def post(self, url, json=None, data=None, headers=None, timeout=None, deadline=None, max_retries=None,
+             stream=False):
+        call = _Call(self, url, timeout, deadline, max_retries)
+        while True:
+            response, error = self._send(url, json, data, headers, call.start(), stream)
+            delay = call.finish(response, error)
+            if delay is None:
+                return response
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, breakers={host: b.state for host, b in self.breakers.items()})
+
+
+# asyncio front end: attempts run on a bounded thread pool over the client's pooled
+# session while the coroutine awaits, and backoff waits do not block the event loop
+class AsyncHttpClient:
+    def __init__(self, client=None, max_workers=HTTP_POOL_SIZE):
+        self.client = client or get_http_client()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http")
+
+    async def post(self, url, json=None, data=None, headers=None, timeout=None, deadline=None, max_retries=None):
+        loop = asyncio.get_running_loop()
+        call = _Call(self.client, url, timeout, deadline, max_retries)
+        while True:
+            attempt_timeout = call.start()
+            send = partial(self.client._send, url, json, data, headers, attempt_timeout, False)
+            try:
+                response, error = await asyncio.wait_for(loop.run_in_executor(self.executor, send), attempt_timeout)
+            except asyncio.TimeoutError:
+                response, error = None, requests.exceptions.Timeout(f"No response from {call.host} in {attempt_timeout:.1f}s")
+            delay = call.finish(response, error)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+
+
+# One client (and one async front end) per process, created on first use
+get_http_client = process_singleton(HttpClient)
+get_async_http_client = process_singleton(lambda: AsyncHttpClient(get_http_client()))
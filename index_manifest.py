@@ -0,0 +1,53 @@
+import os
+import json
+import hashlib
+
+# Manifest of what is already in a vector index, so re-runs only embed what changed.
+# Layout: {"files": {file_name: {"hash": <file sha256>, "chunks": {vector_id: <chunk sha256>}}}}
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+# Write to a temp file first so an interrupted run never leaves a half-written manifest
+def save_manifest(manifest, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# True when the file on disk is byte-identical to what the manifest recorded
+def file_unchanged(manifest, file_name, current_hash):
+    entry = manifest["files"].get(file_name)
+    return entry is not None and entry["hash"] == current_hash
+
+# Compare the fresh chunks of a file ({vector_id: chunk_hash}) with the manifest.
+# Returns (ids to embed, ids to delete from the index).
+def diff_chunks(manifest, file_name, new_chunks):
+    old_chunks = manifest["files"].get(file_name, {}).get("chunks", {})
+    to_embed = [vid for vid, h in new_chunks.items() if old_chunks.get(vid) != h]
+    to_delete = [vid for vid in old_chunks if vid not in new_chunks]
+    return to_embed, to_delete
+
+# Ids of every chunk belonging to files that have disappeared from the folder
+def removed_files(manifest, current_files):
+    current = set(current_files)
+    return {name: list(entry["chunks"]) for name, entry in manifest["files"].items() if name not in current}
+
+def record_file(manifest, file_name, current_hash, chunks):
+    manifest["files"][file_name] = {"hash": current_hash, "chunks": dict(chunks)}
+
+def forget_file(manifest, file_name):
+    manifest["files"].pop(file_name, None)
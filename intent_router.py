@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import threading
+from shared import process_singleton, hit_rate
+
+# Local intent router for the fixed company facts that the cchat.py / chat.py system
+# prompts hard-code (branches, HQ address, contact, founder, products).
+# Such questions are answered straight from the calling script's fact table (CCHAT_FACTS,
+# CHAT_FACTS), with no Gemini round trip. Each table only holds what that script's prompt
+# states, so the router never answers something the LLM would not have been told.
+#
+# Routing is deliberately conservative. A question is only answered here when:
+#   - it names the company ("IQ TechMax", "your company", "you")
+#   - it is short
+#   - one intent clearly wins
+#   - that intent's vocabulary covers at least INTENT_MIN_COVERAGE of the question's
+#     content words
+# Anything else ("What about Chennai?", "Do you have a branch in Germany?", follow-ups)
+# falls through to the LLM.
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER", "1") == "1"
+INTENT_MIN_COVERAGE = float(os.getenv("INTENT_MIN_COVERAGE", "0.75"))
+INTENT_MAX_WORDS = 14
+
+HQ_ADDRESS = ("Suite 102, 1st Floor at Door #108, 1st Main Road, Rajiv Gandhi Salai, Burma Industrial Colony, "
+              "Thiruvalluvar Nagar, Perungudi, Chennai, Tamil Nadu 600096")
+
+# intent -> (strong cues, weak cues). Strong cues count double when scoring.
+INTENTS = {
+    "branches": (
+        {"branch", "branches", "offices", "locations", "countries", "presence"},
+        {"office", "located", "location", "operate", "chennai", "bengaluru", "bangalore", "france", "usa",
+         "america", "india", "cities"},
+    ),
+    "hq_address": (
+        {"address", "headquarters", "headquarter", "hq"},
+        {"office", "located", "location", "head", "main", "visit", "situated", "chennai"},
+    ),
+    "contact": (
+        {"contact", "email", "mail", "phone", "reach"},
+        {"number", "call", "sales", "mobile", "id", "talk", "touch", "connect"},
+    ),
+    "founder": (
+        {"founder", "founded", "ceo", "established"},
+        {"started", "start", "owner", "owns", "head", "runs", "year", "since", "when", "founders"},
+    ),
+    "products": (
+        {"products", "product", "offerings"},
+        {"offer", "sell", "build", "make", "list", "main", "provide"},
+    ),
+}
+
+# intent -> answer, from the cchat.py system prompt (no HQ address there)
+CCHAT_FACTS = {
+    "branches": "IQ TechMax has branches in Chennai (Headquarters), Bengaluru, France and the USA. "
+                "For more details, contact sales@iqtechmax.com or call 9551455515.",
+    "contact": "You can reach us at sales@iqtechmax.com or call 9551455515.",
+    "founder": "IQ TechMax was founded in 2020 by Prashanth Gandidoss (GP), our founder and CEO.",
+    "products": "Our products include IQ Verse, IQ Lens and IQ Bot. Visit https://www.iqtechmax.com/ to learn more, "
+                "or https://ai.iqtechmax.com/ for IQ Bot.",
+}
+
+# intent -> answer, from the chat.py QA prompt (address and branches; everything else
+# comes from the retrieved PDFs)
+CHAT_FACTS = {
+    "branches": "IQ TechMax has branches in Chennai (Headquarters), Bengaluru, France and the USA. "
+                "For more details on these branches, contact sales@iqtechmax.com.",
+    "hq_address": f"IQ TechMax headquarters address: {HQ_ADDRESS}.",
+}
+
+COMPANY_WORDS = {"iq", "techmax", "iqtechmax", "company", "you", "your", "yours", "firm", "organization",
+                 "organisation"}
+FILLER = {"a", "about", "all", "an", "and", "any", "are", "can", "could", "do", "does", "for", "get", "give",
+          "have", "has", "hi", "hello", "how", "i", "in", "is", "it", "know", "me", "my", "of", "on", "please",
+          "share", "tell", "the", "there", "to", "us", "want", "was", "what", "whats", "where", "which", "who",
+          "whom", "with", "would", "s", "may"}
+
+
+def words(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def mentions_company(tokens, text):
+    return bool(COMPANY_WORDS & set(tokens)) or "iq techmax" in text.lower()
+
+# Returns (intent, coverage) for a confident match, or (None, coverage) to fall through
+def classify(query):
+    tokens = words(query)
+    if not tokens or len(tokens) > INTENT_MAX_WORDS or not mentions_company(tokens, query):
+        return None, 0.0
+    content = [t for t in tokens if t not in FILLER and t not in COMPANY_WORDS]
+    if not content:
+        return None, 0.0
+    scores = {}
+    for intent, (strong, weak) in INTENTS.items():
+        scores[intent] = sum(2 if t in strong else 1 if t in weak else 0 for t in content)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    best, second = ranked[0], ranked[1]
+    strong, weak = INTENTS[best]
+    coverage = sum(t in strong or t in weak for t in content) / len(content)
+    # The winner needs a clear lead and a strong cue (or weak cues explaining every word);
+    # everything else is left to the LLM
+    confident = strong & set(content) or (coverage == 1.0 and scores[best] >= 2)
+    if not confident or scores[best] <= scores[second] or coverage < INTENT_MIN_COVERAGE:
+        return None, coverage
+    return best, coverage
+
+
+class IntentRouter:
+    def __init__(self):
+        self.queries = 0
+        self.hits = 0
+        self.intents = {}
+        self.router_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    # The fixed answer for `query` from `facts` (the calling script's table), or None when
+    # the LLM should answer. Intents are classified over every cue set, so a question
+    # about a fact missing from `facts` falls through instead of matching a weaker intent.
+    def answer(self, query, facts):
+        started = time.perf_counter()
+        intent, _ = classify(query) if INTENT_ROUTER_ENABLED else (None, 0.0)
+        with self._lock:
+            self.queries += 1
+            self.router_seconds += time.perf_counter() - started
+            if intent not in facts:
+                return None
+            self.hits += 1
+            self.intents[intent] = self.intents.get(intent, 0) + 1
+        return facts[intent]
+
+    # Callers report how long the LLM took on fall-through turns; each hit is credited
+    # with the average of those as latency saved
+    def record_llm(self, seconds):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            llm_average = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            router_average = self.router_seconds / self.queries if self.queries else 0.0
+            return {
+                "queries": self.queries,
+                "hits": self.hits,
+                "hit_rate": hit_rate(self.hits, self.queries),
+                "intents": dict(self.intents),
+                "router_ms": round(router_average * 1000, 3),
+                "llm_ms": round(llm_average * 1000, 1),
+                "latency_saved_s": round(self.hits * max(llm_average - router_average, 0.0), 2),
+            }
+
+
+# One router per process, created on first use
+get_intent_router = process_singleton(IntentRouter)
+
+
+# === Evaluation: routed vs expected on sample questions ===
+SAMPLE_QUESTIONS = [
+    ("Where are IQ TechMax branches?", "branches"),
+    ("Which countries does your company have offices in?", "branches"),
+    ("Does IQ TechMax have an office in France?", "branches"),
+    ("What is the address of IQ TechMax headquarters?", "hq_address"),
+    ("Where is your HQ?", "hq_address"),
+    ("How can I contact IQ TechMax?", "contact"),
+    ("What is your email id?", "contact"),
+    ("Give me your phone number", "contact"),
+    ("Who is the founder of IQ TechMax?", "founder"),
+    ("Who is your CEO?", "founder"),
+    ("When was IQ TechMax founded?", "founder"),
+    ("What products does IQ TechMax offer?", "products"),
+    ("List your products", "products"),
+    ("What about Chennai?", None),
+    ("Do you have a branch in Germany?", None),
+    ("What is IQ Lens and how does it use AR?", None),
+    ("Tell me about blockchain services at IQ TechMax", None),
+    ("Can you compare IQ Verse with IQ Lens pricing?", None),
+    ("What is the weather in Bengaluru?", None),
+    ("Hi", None),
+    ("Explain how your CEO's vision shapes the product roadmap for the next five years", None),
+]
+
+if __name__ == "__main__":
+    correct = 0
+    for question, expected in SAMPLE_QUESTIONS:
+        started = time.perf_counter()
+        intent, coverage = classify(question)
+        elapsed = (time.perf_counter() - started) * 1000
+        correct += intent == expected
+        mark = "✅" if intent == expected else "❌"
+        print(f"{mark} {question!r:80s} -> {intent or 'LLM':10s} coverage {coverage:.2f}  {elapsed:.3f} ms")
+    routed = sum(1 for _, expected in SAMPLE_QUESTIONS if expected)
+    print(f"📊 {correct}/{len(SAMPLE_QUESTIONS)} routed as expected "
+          f"({routed} fact questions, {len(SAMPLE_QUESTIONS) - routed} that must reach the LLM)")
+    for script, facts in (("cchat.py", CCHAT_FACTS), ("chat.py", CHAT_FACTS)):
+        answered = sum(1 for _, expected in SAMPLE_QUESTIONS if expected in facts)
+        print(f"   {script}: answers {', '.join(facts)} ({answered} of the fact questions)")
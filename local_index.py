@@ -0,0 +1,283 @@
+import os
+import json
+import threading
+import numpy as np
+from sparse_index import hybrid_search, dense_candidates
+from context_packer import pack_context, PACK_CANDIDATES
+from retrieval_cache import bump_index_version
+from quantize import train_int8, encode_int8, int8_scores, train_pq, encode_pq, pq_scores
+
+# In-process vector index for our small corpus (a few thousand 768-dim vectors).
+#
+# Vectors are L2-normalized and stored in a memory-mapped file, so every worker
+# process that opens the index shares one copy through the OS page cache.
+#   mode "flat": exact search, one matrix-vector product over all vectors
+#   mode "ivf":  approximate search, k-means coarse clusters and only the
+#                `nprobe` closest clusters are scored
+#
+# Layout of an index directory:
+#   config.json    dim, dtype, count, mode, nlist, quantization
+#   vectors.bin    (count, dim) float32/float16, row i belongs to ids[i]
+#   records.json   [{"id": ..., "metadata": {...}}] in row order
+#   ivf.npz        centroids, list_offsets, list_rows (ivf mode only)
+#   codes.bin      quantized codes: (count, dim) int8, or (m, count) uint8 for pq
+#   quant.npz      int8 scales or PQ codebooks
+#
+# With quantization (quantize.py) the codes are loaded into memory and scanned as a first
+# pass; the best top_k * LOCAL_INDEX_RERANK rows are then re-scored exactly on the float32
+# vectors.bin, which stays memory-mapped and is only read for those rows. The scanned
+# (resident) part shrinks 4x for int8 and ~15-50x for pq; the file on disk grows by the
+# codes. Run quantize.py for measured memory, latency and recall.
+
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "")  # "local" routes retrieval here
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "flat")  # "flat" or "ivf"
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # "float32" or "float16" (unquantized only)
+IVF_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "") or None  # "int8", "pq" or unset
+RERANK_FACTOR = int(os.getenv("LOCAL_INDEX_RERANK", "10"))  # candidates re-scored per result
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# Dot products of every row with `query`; float16 rows are upcast a cache-sized block at a time
+def score_rows(matrix, query):
+    if matrix.dtype == np.float32:
+        return matrix @ query
+    return int8_scores(matrix, query, np.float32(1.0))
+
+# Plain k-means on normalized vectors (spherical, so similarity is a dot product)
+def kmeans(vectors, nlist, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = normalize(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+# === Writing ===
+# Write ids/vectors/metadata as a new index. Files are written next to the old ones
+# and swapped in with os.replace, so open readers keep a consistent (old) view.
+def build_index(index_dir, ids, vectors, metadatas, mode=LOCAL_INDEX_MODE, dtype=LOCAL_INDEX_DTYPE, nlist=None,
+                quantization=LOCAL_INDEX_QUANTIZATION):
+    os.makedirs(index_dir, exist_ok=True)
+    vectors = normalize(vectors) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+    count, dim = vectors.shape
+
+    quantization = quantization if count else None
+    if quantization:
+        dtype = "float32"  # the exact re-score tier
+
+    stored = np.memmap(os.path.join(index_dir, "vectors.bin.tmp"), dtype=dtype, mode="w+",
+                       shape=(max(count, 1), max(dim, 1)))
+    if count:
+        stored[:count] = vectors
+    stored.flush()
+    del stored
+
+    files = {"vectors.bin": "vectors.bin.tmp"}
+    if mode == "ivf" and count:
+        nlist = nlist or max(1, int(np.sqrt(count)))
+        nlist = min(nlist, count)
+        centroids, assignment = kmeans(vectors, nlist)
+        order = np.argsort(assignment, kind="stable").astype(np.int32)
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+        with open(os.path.join(index_dir, "ivf.npz.tmp"), "wb") as f:
+            np.savez(f, centroids=centroids, list_offsets=offsets, list_rows=order)
+        files["ivf.npz"] = "ivf.npz.tmp"
+    else:
+        mode = "flat"
+
+    if quantization:
+        if quantization == "pq":
+            params = {"codebooks": train_pq(vectors)}
+            codes = encode_pq(vectors, params["codebooks"])
+        else:
+            params = {"scales": train_int8(vectors)}
+            codes = encode_int8(vectors, params["scales"])
+        codes.tofile(os.path.join(index_dir, "codes.bin.tmp"))
+        with open(os.path.join(index_dir, "quant.npz.tmp"), "wb") as f:
+            np.savez(f, **params)
+        files["codes.bin"] = "codes.bin.tmp"
+        files["quant.npz"] = "quant.npz.tmp"
+
+    with open(os.path.join(index_dir, "records.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump([{"id": i, "metadata": m} for i, m in zip(ids, metadatas)], f)
+    files["records.json"] = "records.json.tmp"
+
+    with open(os.path.join(index_dir, "config.json.tmp"), "w", encoding="utf-8") as f:
+        json.dump({"dim": dim, "dtype": dtype, "count": count, "mode": mode, "nlist": nlist,
+                   "quantization": quantization}, f)
+    files["config.json"] = "config.json.tmp"  # swapped last, readers key off it
+
+    for final, tmp in files.items():
+        os.replace(os.path.join(index_dir, tmp), os.path.join(index_dir, final))
+
+
+# Mutable view used at ingest time with the same upsert/delete semantics as Pinecone.
+# Changes are kept in memory and written with save().
+class LocalIndexStore:
+    def __init__(self, index_dir=LOCAL_INDEX_DIR, mode=LOCAL_INDEX_MODE, dtype=LOCAL_INDEX_DTYPE,
+                 quantization=LOCAL_INDEX_QUANTIZATION):
+        self.index_dir = index_dir
+        self.mode = mode
+        self.dtype = dtype
+        self.quantization = quantization
+        self.records = {}  # id -> (vector, metadata)
+        self.dirty = False
+        os.makedirs(index_dir, exist_ok=True)
+        if os.path.exists(os.path.join(index_dir, "config.json")):
+            index = LocalIndex(index_dir)
+            vectors = index.dense_vectors()
+            for row, record in enumerate(index.records):
+                self.records[record["id"]] = (vectors[row], record["metadata"])
+
+    def upsert(self, vectors, on_acknowledged=None):
+        for vector in vectors:
+            self.records[vector["id"]] = (vector["values"], vector.get("metadata", {}))
+        self.dirty = True
+        if on_acknowledged:
+            on_acknowledged([vector["id"] for vector in vectors])
+        print(f"✅ Stored {len(vectors)} vectors in the local index.")
+        return True
+
+    def delete(self, ids):
+        for vector_id in ids:
+            self.records.pop(vector_id, None)
+        self.dirty = True
+        return True
+
+    def save(self):
+        if not self.dirty:
+            return
+        ids = sorted(self.records)
+        build_index(self.index_dir, ids,
+                    [self.records[i][0] for i in ids], [self.records[i][1] for i in ids],
+                    self.mode, self.dtype, quantization=self.quantization)
+        self.dirty = False
+        bump_index_version("local", self.index_dir)  # drops cached retrievals (retrieval_cache.py)
+
+
+# === Reading ===
+class LocalIndex:
+    def __init__(self, index_dir=LOCAL_INDEX_DIR):
+        self.index_dir = index_dir
+        self.config_mtime = os.path.getmtime(os.path.join(index_dir, "config.json"))
+        with open(os.path.join(index_dir, "config.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        with open(os.path.join(index_dir, "records.json"), "r", encoding="utf-8") as f:
+            self.records = json.load(f)
+
+        count, dim = self.config["count"], self.config["dim"]
+        self.vectors = np.memmap(os.path.join(index_dir, "vectors.bin"), dtype=self.config["dtype"], mode="r",
+                                 shape=(max(count, 1), max(dim, 1)))[:count]
+        if self.config["mode"] == "ivf":
+            with np.load(os.path.join(index_dir, "ivf.npz")) as ivf:
+                self.centroids = ivf["centroids"]
+                self.list_offsets = ivf["list_offsets"]
+                self.list_rows = ivf["list_rows"]
+
+        # Quantized codes are read into memory: they are scanned on every query
+        self.quantization = self.config.get("quantization")
+        if self.quantization:
+            with np.load(os.path.join(index_dir, "quant.npz")) as quant:
+                self.quant_params = dict(quant)
+            if self.quantization == "pq":
+                shape = (len(self.quant_params["codebooks"]), count)
+                dtype = np.uint8
+            else:
+                shape = (count, dim)
+                dtype = np.int8
+            self.codes = np.fromfile(os.path.join(index_dir, "codes.bin"), dtype=dtype).reshape(shape)
+
+    # All vectors as float32
+    def dense_vectors(self):
+        return np.array(self.vectors, dtype=np.float32)
+
+    # Bytes held in memory for the first pass (codes and their parameters); the float32
+    # vectors are only paged in for re-scored rows
+    def resident_bytes(self):
+        return self.codes.nbytes + sum(p.nbytes for p in self.quant_params.values())
+
+    # Approximate scores of `rows` (all rows when None) from the quantized codes
+    def approximate_scores(self, query, rows=None):
+        if self.quantization == "pq":
+            codes = self.codes if rows is None else self.codes[:, rows]
+            return pq_scores(codes, query, self.quant_params["codebooks"])
+        codes = self.codes if rows is None else self.codes[rows]
+        return int8_scores(codes, query, self.quant_params["scales"])
+
+    # Returns [(score, id, metadata)] best first
+    def search(self, vector, top_k=3, nprobe=IVF_NPROBE):
+        if not len(self.records):
+            return []
+        query = normalize(vector)
+
+        if self.config["mode"] == "ivf":
+            probe = np.argsort(self.centroids @ query)[::-1][:nprobe]
+            rows = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe])
+        else:
+            rows = None
+
+        if self.quantization:
+            # First pass on the in-memory codes, then exact float32 scores for the best
+            # candidates only
+            approx = self.approximate_scores(query, rows)
+            keep = min(len(approx), top_k * RERANK_FACTOR)
+            if keep == 0:
+                return []
+            candidates = np.argpartition(-approx, keep - 1)[:keep]
+            # Sorted rows keep the reads from vectors.bin sequential
+            rows = np.sort(candidates if rows is None else rows[candidates])
+            scores = score_rows(self.vectors[rows], query)
+        elif rows is not None:
+            scores = score_rows(self.vectors[rows], query)
+        else:
+            scores = score_rows(self.vectors, query)
+
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        results = []
+        for i in best:
+            row = rows[i] if rows is not None else i
+            record = self.records[row]
+            results.append((float(scores[i]), record["id"], record["metadata"]))
+        return results
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+# One open index per directory and process, reopened when the index is rewritten
+def get_local_index(index_dir=LOCAL_INDEX_DIR):
+    config_path = os.path.join(index_dir, "config.json")
+    with _open_lock:
+        index = _open_indexes.get(index_dir)
+        if index is None or os.path.getmtime(config_path) != index.config_mtime:
+            index = _open_indexes[index_dir] = LocalIndex(index_dir)
+        return index
+
+# Same "query -> context string" contract as trailpine.get_context_from_pinecone.
+# With the query text, BM25 matches from bm25.json are fused in (sparse_index.py);
+# the matches are merged and packed into the token budget (context_packer.py).
+def get_context_from_local_index(vector, top_k=3, index_dir=LOCAL_INDEX_DIR, query=None):
+    if not vector:
+        return ""
+    return pack_context(search_local_index(vector, top_k * PACK_CANDIDATES, index_dir, query))
+
+# The ranked matches [(score, id, metadata)] behind it
+def search_local_index(vector, top_k, index_dir=LOCAL_INDEX_DIR, query=None):
+    matches = get_local_index(index_dir).search(vector, dense_candidates(top_k) if query else top_k)
+    return hybrid_search(query, matches, top_k, os.path.join(index_dir, "bm25.json"))
@@ -28,9 +28,18 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_community.llms import Ollama
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi import HTTPException
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
+import asyncio
+import time
 import os
 
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # or fake_servers.py
+OLLAMA_ASYNC = os.getenv("OLLAMA_ASYNC", "1") == "1"  # chain.ainvoke; "0" runs chain.invoke on a thread pool
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))  # generations in flight at once
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "200"))  # requests waiting beyond this get a 503
+
 app = FastAPI()
 
 # Ensure the "static" directory exists
@@ -50,7 +59,7 @@ app.add_middleware(
 )
 
 # LLM setup
-llm = Ollama(model="llama2")
+llm = Ollama(model="llama2", base_url=OLLAMA_BASE_URL)
 prompt = ChatPromptTemplate.from_messages([ 
     ("system", "You are a helpful AI assistant. Your name is KTM the bot."), 
     ("user", "user query:{query}") 
@@ -61,6 +70,74 @@ chain = prompt | llm | output_parser
 # Store chat history in memory (for this demo)
 chat_history = []
 
+# === LLM calls off the event loop ===
+# Every generation goes through the gate: at most max_concurrency run at once (Ollama
+# itself only generates a few in parallel), the rest wait their turn without blocking
+# the event loop, and beyond max_queue waiting requests new ones are turned away with
+# a 503. All state is touched from the event loop thread only, so no lock is needed.
+class LLMGate:
+    def __init__(self, max_concurrency=OLLAMA_MAX_CONCURRENCY, max_queue=OLLAMA_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self.waiting = 0  # queue depth
+        self.peak_waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    # chain.ainvoke when OLLAMA_ASYNC, else chain.invoke on the bounded thread pool
+    async def run(self, chain, inputs):
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="The bot is busy, please try again shortly.")
+        queued = time.perf_counter()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        self.wait_seconds += started - queued
+        self.in_flight += 1
+        try:
+            if OLLAMA_ASYNC:
+                reply = await chain.ainvoke(inputs)
+            else:
+                reply = await asyncio.get_running_loop().run_in_executor(self.executor, chain.invoke, inputs)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+        # Failures are counted apart so they do not skew avg_generation_ms
+        self.completed += 1
+        self.run_seconds += time.perf_counter() - started
+        return reply
+
+    def stats(self):
+        started = self.completed + self.failed
+        return {
+            "mode": "async" if OLLAMA_ASYNC else "executor",
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / started * 1000, 1) if started else 0.0,
+            "avg_generation_ms": round(self.run_seconds / self.completed * 1000, 1) if self.completed else 0.0,
+        }
+
+llm_gate = LLMGate()
+
 @app.get("/", response_class=HTMLResponse)
 async def chat_ui(request: Request):
     return templates.TemplateResponse("chat_template.html", {"request": request, "chat_history": chat_history})
@@ -69,11 +146,18 @@ async def chat_ui(request: Request):
 async def send_message(request: Request, user_input: str = Form(...)):
     user_msg = user_input.strip()
     if user_msg:
+        # The turn is recorded once the bot has replied, so a 503 or a failed generation
+        # leaves no unanswered message behind
+        bot_reply = await llm_gate.run(chain, {"query": user_msg})
         chat_history.append(("user", user_msg))
-        bot_reply = chain.invoke({"query": user_msg})
         chat_history.append(("bot", bot_reply))
     return templates.TemplateResponse("chat_template.html", {"request": request, "chat_history": chat_history})
 
+# Queue depth and latency of the LLM calls
+@app.get("/stats")
+async def llm_stats():
+    return llm_gate.stats()
+
 # Inline template using Jinja2
 with open("chat_template.html", "w") as f:
     f.write('''
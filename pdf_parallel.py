@@ -0,0 +1,55 @@
+import os
+from collections import deque
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+from pdf_stream import iter_pdf_pages
+
+# Parallel PDF parsing across a process pool.
+# Small files are one task each, large files are split into page ranges. Results
+# come back in file order and then page order regardless of which worker finished first.
+
+PAGES_PER_TASK = 4
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+def pdf_page_count(file_path):
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+# Worker: [(page_number, text)] for pages start..stop-1 (page numbers start at 1, empty pages skipped)
+def extract_page_range(file_path, start, stop):
+    return list(iter_pdf_pages(file_path, start, stop))
+
+def plan_tasks(paths, count_pages=pdf_page_count, pages_per_task=PAGES_PER_TASK):
+    tasks = []
+    for path in paths:
+        total = count_pages(path)
+        for start in range(0, max(total, 1), pages_per_task):
+            tasks.append((path, start, min(start + pages_per_task, total)))
+    return tasks
+
+# Yields (path, task_result) in task order. At most workers * 2 tasks are in flight,
+# so finished results never pile up in memory ahead of the consumer.
+def parallel_extract(paths, workers=DEFAULT_WORKERS, task=extract_page_range,
+                     count_pages=pdf_page_count, pages_per_task=PAGES_PER_TASK):
+    tasks = plan_tasks(paths, count_pages, pages_per_task)
+    if workers <= 1:
+        for path, start, stop in tasks:
+            yield path, task(path, start, stop)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for path, start, stop in tasks:
+            in_flight.append((path, executor.submit(task, path, start, stop)))
+            if len(in_flight) >= workers * 2:
+                done_path, future = in_flight.popleft()
+                yield done_path, future.result()
+        while in_flight:
+            done_path, future = in_flight.popleft()
+            yield done_path, future.result()
+
+# Regroups parallel_extract output into (path, iterator over that file's items)
+def iter_file_results(results):
+    for path, group in groupby(results, key=lambda item: item[0]):
+        yield path, (item for _, batch in group for item in batch)
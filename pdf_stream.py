@@ -0,0 +1,108 @@
+import re
+from collections import deque
+import pdfplumber
+
+# Streaming PDF extraction and chunking.
+# Pages are read one at a time and chunks are yielded as soon as enough text has
+# arrived, so memory stays bounded by one page plus one chunk whatever the file size.
+
+CHUNK_TOKENS = 256  # token budget of iter_token_chunks
+CHUNK_OVERLAP_TOKENS = 32
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+# === Pages ===
+# Yields (page_number, text) starting at 1, releasing each page's parsed objects after use.
+# start/stop (0-based, stop exclusive) limit it to a page range, as for pdf_parallel tasks.
+def iter_pdf_pages(file_path, start=0, stop=None):
+    with pdfplumber.open(file_path) as pdf:
+        for number, page in enumerate(pdf.pages[start:stop], start=start + 1):
+            text = page.extract_text()
+            page.close()
+            if text:
+                yield number, text
+
+# === Chunks ===
+# Same windows as trailvector.chunk_text over the "\n"-joined pages, so chunk
+# indexes (and therefore vector ids) do not change. Each chunk is a dict:
+# {"index", "text", "page" (page the chunk starts on), "offset" (char offset in the document)}
+def iter_chunks(pages, chunk_size=1000, overlap=150):
+    step = chunk_size - overlap
+    buffer = ""
+    buffer_offset = 0  # document offset of buffer[0]
+    page_starts = deque()  # (document offset, page number) of pages still in the buffer
+    index = 0
+
+    def emit():
+        while len(page_starts) > 1 and page_starts[1][0] <= buffer_offset:
+            page_starts.popleft()
+        return {"index": index, "text": buffer[:chunk_size], "page": page_starts[0][1], "offset": buffer_offset}
+
+    for number, text in pages:
+        page_starts.append((buffer_offset + len(buffer), number))
+        buffer += text + "\n"
+        while len(buffer) >= chunk_size:
+            yield emit()
+            index += 1
+            buffer = buffer[step:]
+            buffer_offset += step
+
+    while buffer:
+        yield emit()
+        index += 1
+        buffer = buffer[step:]
+        buffer_offset += step
+
+# === Token-budgeted chunks ===
+# Rough Gemini token count (about 4 characters per token for English text)
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+# Yields (sentence, offset in text), splitting on sentence punctuation and blank lines
+def iter_sentences(text):
+    position = 0
+    for boundary in list(SENTENCE_BOUNDARY.finditer(text)) + [None]:
+        end = boundary.start() if boundary else len(text)
+        segment = text[position:end]
+        if segment.strip():
+            yield segment.strip(), position + len(segment) - len(segment.lstrip())
+        if boundary:
+            position = boundary.end()
+
+# Packs whole sentences into chunks of at most `max_tokens` (estimated), starting each
+# chunk with the last sentences of the previous one up to `overlap_tokens`. Sentences
+# longer than the budget are cut into budget-sized pieces. Chunks have the same shape
+# as iter_chunks: {"index", "text", "page", "offset"}.
+def iter_token_chunks(pages, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    max_chars = max_tokens * 4
+    current = []  # (document offset, page number, sentence, tokens)
+    size = 0
+    index = 0
+    document_offset = 0
+
+    def emit():
+        return {"index": index, "text": " ".join(s for _, _, s, _ in current),
+                "page": current[0][1], "offset": current[0][0]}
+
+    for number, text in pages:
+        for sentence, start in iter_sentences(text):
+            for cut in range(0, len(sentence), max_chars):
+                piece = sentence[cut:cut + max_chars]
+                tokens = estimate_tokens(piece)
+                if current and size + tokens > max_tokens:
+                    yield emit()
+                    index += 1
+                    carry, carried = [], 0
+                    for item in reversed(current):
+                        if carried + item[3] > overlap_tokens:
+                            break
+                        carry.insert(0, item)
+                        carried += item[3]
+                    if carried + tokens > max_tokens:
+                        carry, carried = [], 0
+                    current, size = carry, carried
+                current.append((document_offset + start + cut, number, piece, tokens))
+                size += tokens
+        document_offset += len(text) + 1
+
+    if current:
+        yield emit()
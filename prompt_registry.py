@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from shared import process_singleton, hit_rate
+
+# Per-persona LangChain chains (`prompt | model | parser`), compiled once and reused
+# across requests and sessions. Chains live in an LRU keyed by (kind, persona fields),
+# so a process serving many characters keeps only the PROMPT_REGISTRY_SIZE most
+# recently used.
+#
+# The plain f-string system prompts of the trail*.py scripts are not cached: rendering
+# one costs well under a microsecond, less than a registry lookup (see the benchmark).
+
+PROMPT_REGISTRY_SIZE = int(os.getenv("PROMPT_REGISTRY_SIZE", "256"))
+
+
+class PromptRegistry:
+    def __init__(self, max_entries=PROMPT_REGISTRY_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (kind, persona) -> chain, oldest use first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+        self._lock = threading.Lock()
+
+    # The chain for `key`, built with build() on first use
+    def get(self, key, build):
+        with self._lock:
+            compiled = self.entries.get(key)
+            if compiled is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        started = time.perf_counter()
+        compiled = build()
+        with self._lock:
+            self.build_seconds += time.perf_counter() - started
+            compiled = self.entries.setdefault(key, compiled)  # a concurrent build may have won
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return compiled
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hit_rate(self.hits, self.hits + self.misses),
+                "build_ms": round(self.build_seconds * 1000, 2),
+            }
+
+
+# One registry per process, created on first use
+get_prompt_registry = process_singleton(PromptRegistry)
+
+def persona_key(kind, persona):
+    return (kind,) + tuple(sorted((field, str(value)) for field, value in persona.items()))
+
+# `kind` names the chain (one per script), persona fields are passed as keywords and
+# build() returns the chain for this persona
+def compiled_chain(kind, build, **persona):
+    return get_prompt_registry().get(persona_key(kind, persona), build)
+
+
+# === Benchmark: per-request overhead before the network call ===
+if __name__ == "__main__":
+    import argparse
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.messages import HumanMessage
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    parser = argparse.ArgumentParser(description="Per-request prompt/chain overhead, rebuilt vs registry.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--personas", type=int, default=20, help="distinct characters the requests cycle through")
+    args = parser.parse_args()
+
+    model = FakeListChatModel(responses=["ok"])
+    instructions = "Keep responses short and natural, just like a real conversation.\n" * 20
+
+    # Same shape as call.get_system_prompt and the chat() body that used it
+    def system_prompt(character_name):
+        return f"You are {character_name}, an AI phone assistant. Say: 'Hello, this is {character_name}.'\n" + instructions
+
+    def build_chain(character_name):
+        prompt = ChatPromptTemplate.from_messages([("system", system_prompt(character_name)),
+                                                   MessagesPlaceholder("chat_history")])
+        return prompt | model | StrOutputParser()
+
+    # Same shape as the trail3.py system prompt
+    def build_prompt(name, role, description, query, context, summary):
+        return (f"You are {name}, a {role} built by IQ TechMax. Your character: {description}.\n"
+                f"User query: {query}\nContext: {context}\nChat summary so far: {summary}\n"
+                f"{instructions}Introduce yourself with {name}.\nNow answer the following query: {query}\n")
+
+    history = [HumanMessage(content="What are your office hours?")]
+    context = "IQ TechMax has branches in Chennai, Bengaluru, France and the USA. " * 10
+    names = [f"agent-{i}" for i in range(args.personas)]
+
+    def timed(fn):
+        started = time.perf_counter()
+        for i in range(args.requests):
+            fn(names[i % len(names)])
+        return (time.perf_counter() - started) / args.requests * 1e6
+
+    # Chain: everything up to the model call, i.e. compile + render the prompt messages
+    rebuilt = timed(lambda name: build_chain(name).first.invoke({"chat_history": history}))
+    cached = timed(lambda name: compiled_chain("bench", lambda: build_chain(name), character_name=name)
+                   .first.invoke({"chat_history": history}))
+    print(f"🔗 chain  rebuilt {rebuilt:8.1f} µs/request   registry {cached:8.1f} µs/request")
+
+    fresh = timed(lambda name: build_prompt(name, "sales agent", "friendly", "Where are you?", context, "None yet"))
+    lookup = timed(lambda name: compiled_chain("bench", lambda: build_chain(name), character_name=name))
+    print(f"📝 trail-style f-string prompt {fresh:8.1f} µs/request   registry lookup alone {lookup:8.1f} µs/request")
+    print(f"📊 {get_prompt_registry().stats()}")
@@ -0,0 +1,157 @@
+import os
+import argparse
+import numpy as np
+
+# Compact vector codes for the local index (local_index.py). The codes are kept in memory
+# and scanned as a first pass; the best candidates are re-scored exactly on the float32
+# vectors, which stay memory-mapped on disk.
+#   int8: per-dimension scalar quantization, 1 byte per dimension (4x smaller than float32).
+#   pq:   product quantization, the vector is cut into `m` sub-vectors and each is replaced
+#         by the id of its nearest of 256 centroids, 1 byte per sub-vector (3072 / m x smaller,
+#         plus 768 KB of codebooks whatever the corpus size).
+#
+# numpy has no int8 BLAS, so the int8 scan is only slightly faster than a float32 one; the
+# pq scan reads 48 bytes per vector and is the fast first pass once the corpus outgrows
+# the CPU cache. Run this module to measure resident memory, bytes on disk, p50 latency
+# and recall@k of every format (--count 50000 for a larger corpus).
+
+PQ_M = int(os.getenv("LOCAL_INDEX_PQ_M", "48"))  # 48 sub-vectors of 16 dims -> 64x smaller codes
+PQ_CENTROIDS = 256
+PQ_TRAIN_SAMPLE = 4096  # codebooks are trained on at most this many vectors
+
+
+# === int8 ===
+def train_int8(vectors):
+    scales = np.abs(vectors).max(axis=0)
+    scales[scales == 0] = 1.0
+    return (scales / 127.0).astype(np.float32)
+
+def encode_int8(vectors, scales):
+    return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+
+# Blocks of 128 rows are upcast into a float32 temporary that stays in the CPU cache
+# (128 x 768 x 4 bytes = 384 KB); larger blocks spill to memory and cost 2-3x more
+def int8_scores(codes, query, scales, block_size=128):
+    scaled_query = (query * scales).astype(np.float32)
+    return np.concatenate([codes[i:i + block_size].astype(np.float32) @ scaled_query
+                           for i in range(0, len(codes), block_size)] or [np.zeros(0, np.float32)])
+
+
+# === Product quantization ===
+def train_pq(vectors, m=PQ_M, centroids=PQ_CENTROIDS, iterations=8, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(vectors) > PQ_TRAIN_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), PQ_TRAIN_SAMPLE, replace=False)]
+    count, dim = vectors.shape
+    assert dim % m == 0, f"dimension {dim} is not divisible by m={m}"
+    sub_dim = dim // m
+    centroids = min(centroids, count)
+    codebooks = np.zeros((m, centroids, sub_dim), dtype=np.float32)
+
+    for j in range(m):
+        sub = vectors[:, j * sub_dim:(j + 1) * sub_dim]
+        book = sub[rng.choice(count, centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = nearest_centroid(sub, book)
+            sums = np.stack([np.bincount(assignment, weights=sub[:, d], minlength=centroids)
+                             for d in range(sub_dim)], axis=1)
+            counts = np.bincount(assignment, minlength=centroids)[:, None]
+            book = np.where(counts > 0, sums / np.maximum(counts, 1), book)
+        codebooks[j] = book
+    return codebooks
+
+def nearest_centroid(sub_vectors, book):
+    # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+    return np.argmax(sub_vectors @ book.T - 0.5 * (book * book).sum(axis=1), axis=1)
+
+# Codes are stored sub-vector major, shape (m, count), so each ADC lookup reads one
+# contiguous row of codes
+def encode_pq(vectors, codebooks):
+    m, _, sub_dim = codebooks.shape
+    codes = np.empty((m, len(vectors)), dtype=np.uint8)
+    for j in range(m):
+        codes[j] = nearest_centroid(vectors[:, j * sub_dim:(j + 1) * sub_dim], codebooks[j])
+    return codes
+
+# Asymmetric distance computation (ADC): the query stays exact and one 256-entry table
+# per sub-vector holds its dot product with every centroid; a vector's score is the sum
+# of its m table entries
+def pq_scores(codes, query, codebooks):
+    m, _, sub_dim = codebooks.shape
+    table = np.einsum("jkd,jd->jk", codebooks, query.reshape(m, sub_dim)).astype(np.float32)
+    scores = np.zeros(codes.shape[1], dtype=np.float32)
+    for j in range(m):
+        scores += table[j].take(codes[j])
+    return scores
+
+
+# === Measuring ===
+def recall_at_k(exact_ids, approx_ids, k):
+    hits = sum(len(set(e[:k]) & set(a[:k])) for e, a in zip(exact_ids, approx_ids))
+    return hits / (k * len(exact_ids))
+
+# Builds a local index in every storage format and reports the bytes scanned in memory per
+# query, bytes on disk, p50 search latency and recall@k against exact float32 search
+def quantization_report(vectors, queries, k=5):
+    import time
+    import tempfile
+    from local_index import normalize, build_index, LocalIndex
+
+    vectors, queries = normalize(vectors), normalize(queries)
+    exact = [np.argsort(-(vectors @ q))[:k] for q in queries]
+    ids = [str(i) for i in range(len(vectors))]
+    variants = {"float32": {}, "float16": {"dtype": "float16"}, "int8": {"quantization": "int8"},
+                "pq": {"quantization": "pq"}}
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, options in variants.items():
+            index_dir = os.path.join(workdir, name)
+            build_index(index_dir, ids, vectors, [{}] * len(ids), mode="flat", **options)
+            index = LocalIndex(index_dir)
+            latencies, found = [], []
+            for q in queries:
+                started = time.perf_counter()
+                matches = index.search(q, k)
+                latencies.append(time.perf_counter() - started)
+                found.append([int(vector_id) for _, vector_id, _ in matches])
+            disk = sum(os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir)
+                       if f.endswith((".bin", ".npz")))
+            memory = index.resident_bytes() if index.quantization else index.vectors.nbytes
+            report[name] = {
+                "memory_bytes": memory,
+                "shrink": round(vectors.nbytes / memory, 1),
+                "disk_bytes": disk,
+                "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+                "recall": round(recall_at_k(exact, found, k), 3),
+            }
+            del index
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report memory, latency and recall@k of the quantized storage formats.")
+    parser.add_argument("--index-dir", help="measure on an existing local index (default: random data)")
+    parser.add_argument("--count", type=int, default=5000, help="random vectors when no --index-dir is given")
+    parser.add_argument("--isotropic", action="store_true",
+                        help="plain Gaussian vectors (worst case for pq) instead of low-rank ones")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        from local_index import LocalIndex
+        data = LocalIndex(args.index_dir).dense_vectors()
+    else:
+        # Text embeddings occupy a small subspace of their 768 dimensions; plain Gaussian
+        # vectors spread over all of them
+        data = rng.standard_normal((args.count, 768)).astype(np.float32)
+        if not args.isotropic:
+            basis = rng.standard_normal((64, 768)).astype(np.float32)
+            data = rng.standard_normal((args.count, 64)).astype(np.float32) @ basis + 0.3 * data
+    # Queries are perturbed copies of stored vectors, like a paraphrased question
+    picks = rng.choice(len(data), min(args.queries, len(data)), replace=False)
+    queries = data[picks] + 0.5 * data.std() * rng.standard_normal((len(picks), data.shape[1])).astype(np.float32)
+
+    for name, row in quantization_report(data, queries, args.k).items():
+        print(f"{name:8s} {row}")
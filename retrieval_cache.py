@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from shared import process_singleton, hit_rate
+
+# Cache of ranked retrieval results in front of embed + vector search.
+# Repeated turns (voice_chat retries, the same question reworded with different case or
+# punctuation) get the ranked matches [(score, id, metadata)] of the earlier search back
+# without an embedding call or a vector query.
+#
+# Entries are keyed by (index, normalized query, k) where `index` names one store and
+# tenant, e.g. "pinecone:iq-bot-demo/buyer-acme-<hash>" or "local:/srv/local_index". Every entry
+# is tagged with that index's version from INDEX_VERSION_PATH as it was before the search
+# ran; the ingest scripts bump the version whenever they write (trailvector.py,
+# Vector_Db.py, LocalIndexStore.save), so the next lookup after a re-ingest misses, also
+# when the write landed while the search was in flight. RETRIEVAL_CACHE_TTL bounds
+# staleness for writes made outside these scripts.
+
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE", "1") == "1"
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))  # seconds
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "1024"))
+INDEX_VERSION_PATH = os.getenv("INDEX_VERSION_PATH", "index_versions.json")
+VERSION_LOCK_TIMEOUT = 10.0  # seconds; an older lock file was left by a crashed writer
+
+
+def normalize_query(query):
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+# store: "pinecone" (name = index name, plus the namespace), "local" or "chroma"
+# (name = index directory)
+def index_key(store, name, namespace=""):
+    if store == "pinecone":
+        return f"pinecone:{name}/{namespace}"
+    return f"{store}:{os.path.abspath(name)}"
+
+
+# === Index versions ===
+def load_versions(path=INDEX_VERSION_PATH):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Exclusive lock file next to the version file (O_EXCL works on every platform), so
+# concurrent ingests do not lose each other's bumps
+def lock_versions(path, timeout=VERSION_LOCK_TIMEOUT):
+    lock_path = path + ".lock"
+    started = time.time()
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)  # stale
+                    continue
+            except OSError:
+                continue  # released meanwhile
+            if time.time() - started > timeout:
+                raise TimeoutError(f"Index version file is locked: {lock_path}")
+            time.sleep(0.01)
+
+# Called by the ingest scripts after every write to an index
+def bump_index_version(store, name, namespace="", path=INDEX_VERSION_PATH):
+    lock_path = lock_versions(path)
+    try:
+        versions = load_versions(path)
+        key = index_key(store, name, namespace)
+        versions[key] = versions.get(key, 0) + 1
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(versions, f, indent=2)
+        os.replace(path + ".tmp", path)
+        return versions[key]
+    finally:
+        os.remove(lock_path)
+
+
+class RetrievalCache:
+    def __init__(self, max_entries=RETRIEVAL_CACHE_MAX_ENTRIES, ttl=RETRIEVAL_CACHE_TTL,
+                 version_path=INDEX_VERSION_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_path = version_path
+        self.entries = OrderedDict()  # (index, query, k) -> (version, matches, created), oldest use first
+        self.versions = {}
+        self.version_stamp = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    # The version file is only re-read when it changed on disk
+    def _version(self, index):
+        try:
+            stat = os.stat(self.version_path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp != self.version_stamp:
+            self.versions = load_versions(self.version_path) if stamp else {}
+            self.version_stamp = stamp
+        return self.versions.get(index, 0)
+
+    def version(self, index):
+        with self._lock:
+            return self._version(index)
+
+    def get(self, index, query, k):
+        key = (index, normalize_query(query), k)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == self._version(index) and time.time() - entry[2] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    # `version` is the index version read before the search that produced `matches`
+    def put(self, index, query, k, matches, version=None):
+        key = (index, normalize_query(query), k)
+        with self._lock:
+            if version is None:
+                version = self._version(index)
+            self.entries[key] = (version, matches, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": hit_rate(self.hits, self.hits + self.misses),
+        }
+
+
+# One cache per process, created on first use
+get_retrieval_cache = process_singleton(RetrievalCache)
+
+# Ranked matches for `query` from the cache, or from retrieve_fn() (embed + search) on a
+# miss. Empty results are not cached, so a failed search is retried on the next call.
+# The version is read before the search: an ingest finishing meanwhile leaves the entry
+# stale instead of tagging pre-ingest matches with the new version.
+def cached_retrieval(store, name, query, k, retrieve_fn, namespace=""):
+    if not RETRIEVAL_CACHE_ENABLED:
+        return retrieve_fn()
+    cache = get_retrieval_cache()
+    index = index_key(store, name, namespace)
+    matches = cache.get(index, query, k)
+    if matches is None:
+        version = cache.version(index)
+        matches = retrieve_fn()
+        if matches:
+            cache.put(index, query, k, matches, version)
+    return matches
@@ -0,0 +1,23 @@
+import threading
+
+# Helpers for the per-process caches, clients and collectors (embedding_cache.py,
+# answer_cache.py, http_client.py, ...).
+
+
+# Getter for one `factory()` instance per process, created on first use:
+#   get_answer_cache = process_singleton(AnswerCache)
+def process_singleton(factory):
+    instance = None
+    lock = threading.Lock()
+
+    def get():
+        nonlocal instance
+        with lock:
+            if instance is None:
+                instance = factory()
+            return instance
+    return get
+
+# Share of lookups answered from a cache, for stats()
+def hit_rate(hits, lookups):
+    return round(hits / lookups, 3) if lookups else 0.0
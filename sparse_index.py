@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import argparse
+import threading
+import numpy as np
+
+# BM25 inverted index built at ingest time next to the vectors, and reciprocal rank
+# fusion (RRF) of its results with the dense ones.
+# Dense search misses exact terms ("IQ Lens", phone numbers, addresses); BM25 finds
+# them, RRF merges both rankings without having to calibrate their scores.
+#
+# File format (JSON):
+#   {"k1", "b", "records": [{"id", "text", "metadata"}], "postings": {term: [[row, tf], ...]}}
+# Ingest rewrites it once per run; until then each file's changes are appended to
+# "<path>.log" (one JSON line per commit(), {id: [text, metadata] or null}) and replayed
+# by the next SparseIndexStore, so a run that stops early loses nothing the manifest has.
+
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"  # fuse BM25 into dense retrieval
+SPARSE_INDEX_PATH = os.getenv("SPARSE_INDEX_PATH", "iq-bot-demo2_bm25.json")  # written by trailvector.py
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # rank constant of reciprocal rank fusion
+HYBRID_DEPTH = 4  # each ranking contributes top_k * HYBRID_DEPTH candidates
+
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how", "i", "in", "is",
+             "it", "me", "my", "of", "on", "or", "our", "the", "to", "us", "we", "what", "where", "who",
+             "with", "you", "your"}
+# Phone numbers and other digit runs written with spaces/dashes ("+91 95514 55515",
+# "(044) 2496-1234"). Digit groups are joined by at most one space or hyphen, never a
+# newline, so numbers in separate table cells or lines stay separate tokens.
+NUMBER = re.compile(r"\+?\(?\d(?:\)?[ \-]?\(?\d)+")
+NUMBER_MIN_DIGITS = 7
+
+
+def tokenize(text):
+    text = text.lower()
+    tokens = [t for t in re.findall(r"\w+", text) if t not in STOPWORDS]
+    # Also index digit runs as one token, so differently formatted numbers match
+    numbers = (re.sub(r"\D", "", match) for match in NUMBER.findall(text))
+    tokens.extend(digits for digits in numbers if len(digits) >= NUMBER_MIN_DIGITS)
+    return tokens
+
+
+# === Writing ===
+# Mutable view used at ingest time, same upsert/delete/save shape as LocalIndexStore
+class SparseIndexStore:
+    def __init__(self, path=SPARSE_INDEX_PATH):
+        self.path = path
+        self.journal_path = path + ".log"
+        self.records = {}  # id -> (text, metadata)
+        self.uncommitted = {}  # id -> (text, metadata), or None if deleted, since the last commit()
+        self.dirty = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for record in json.load(f)["records"]:
+                    self.records[record["id"]] = (record["text"], record["metadata"])
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            for n, line in enumerate(lines):
+                try:
+                    changes = json.loads(line)
+                except ValueError:  # the last line of a killed run: cut it so commits append cleanly
+                    with open(self.journal_path, "w", encoding="utf-8") as f:
+                        f.writelines(lines[:n])
+                    break
+                for vector_id, record in changes.items():
+                    if record is None:
+                        self.records.pop(vector_id, None)
+                    else:
+                        self.records[vector_id] = tuple(record)
+            self.dirty = True
+
+    def upsert(self, records):
+        for vector_id, text, metadata in records:
+            self.records[vector_id] = self.uncommitted[vector_id] = (text, metadata)
+        self.dirty = True
+
+    def delete(self, ids):
+        for vector_id in ids:
+            self.records.pop(vector_id, None)
+            self.uncommitted[vector_id] = None
+        self.dirty = True
+
+    # Appends the changes since the last commit to the journal; call it before the
+    # manifest records them
+    def commit(self):
+        if not self.uncommitted:
+            return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.uncommitted) + "\n")
+        self.uncommitted = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        ids = sorted(self.records)
+        postings = {}
+        for row, vector_id in enumerate(ids):
+            counts = {}
+            for token in tokenize(self.records[vector_id][0]):
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append([row, tf])
+        body = {"k1": BM25_K1, "b": BM25_B,
+                "records": [{"id": i, "text": self.records[i][0], "metadata": self.records[i][1]} for i in ids],
+                "postings": postings}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(body, f)
+        os.replace(self.path + ".tmp", self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.uncommitted = {}
+        self.dirty = False
+
+
+# === Reading ===
+class SparseIndex:
+    def __init__(self, path=SPARSE_INDEX_PATH):
+        self.mtime = os.path.getmtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            body = json.load(f)
+        self.records = body["records"]
+        k1, b = body["k1"], body["b"]
+
+        lengths = np.zeros(len(self.records), dtype=np.float32)
+        for rows in body["postings"].values():
+            for row, tf in rows:
+                lengths[row] += tf
+        average = lengths.mean() if len(lengths) else 1.0
+        norms = k1 * (1 - b + b * lengths / max(average, 1e-9))
+
+        # BM25 weight of every (term, row) pair is computed once here
+        self.postings = {}
+        for term, rows in body["postings"].items():
+            rows = np.asarray(rows, dtype=np.int64)
+            idf = np.log(1 + (len(self.records) - len(rows) + 0.5) / (len(rows) + 0.5))
+            tf = rows[:, 1].astype(np.float32)
+            self.postings[term] = (rows[:, 0], (idf * tf * (k1 + 1) / (tf + norms[rows[:, 0]])).astype(np.float32))
+
+    # Returns [(score, id, metadata)] best first; metadata includes the full "text"
+    def search(self, query, top_k=5):
+        scores = np.zeros(len(self.records), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                rows, weights = self.postings[term]
+                scores[rows] += weights
+        matched = np.flatnonzero(scores)
+        top_k = min(top_k, len(matched))
+        if top_k == 0:
+            return []
+        best = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[row]), self.records[row]["id"], dict(self.records[row]["metadata"],
+                                                                      text=self.records[row]["text"]))
+                for row in best]
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+# One open index per file and process, reopened when the file is rewritten; None if missing
+def get_sparse_index(path=SPARSE_INDEX_PATH):
+    if not os.path.exists(path):
+        return None
+    with _open_lock:
+        index = _open_indexes.get(path)
+        if index is None or os.path.getmtime(path) != index.mtime:
+            index = _open_indexes[path] = SparseIndex(path)
+        return index
+
+
+# === Fusion ===
+# How many dense matches to fetch so fusion has candidates beyond the final top_k
+def dense_candidates(top_k):
+    return top_k * HYBRID_DEPTH if HYBRID_RETRIEVAL else top_k
+
+# rankings: lists of keys, best first. Returns keys ordered by sum(1 / (k + rank)).
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+# Fuses dense matches [(score, id, metadata)] with BM25 matches for `query` from the
+# index at `path`. Returns the top_k fused matches in the same shape, or the dense
+# matches unchanged when hybrid retrieval is off or there is no sparse index.
+def hybrid_search(query, dense, top_k, path=SPARSE_INDEX_PATH):
+    return fuse_sparse(query, dense, top_k, get_sparse_index(path) if HYBRID_RETRIEVAL and query else None)
+
+# Same with an already open SparseIndex (or None), e.g. one held per tenant
+def fuse_sparse(query, dense, top_k, index):
+    if index is None or not HYBRID_RETRIEVAL or not query:
+        return dense[:top_k]
+    sparse = index.search(query, top_k * HYBRID_DEPTH)
+    by_id = {vector_id: (score, vector_id, metadata) for score, vector_id, metadata in sparse}
+    # Dense metadata may hold truncated text (Pinecone), so it only fills in BM25 misses
+    for match in dense:
+        by_id.setdefault(match[1], match)
+    fused = reciprocal_rank_fusion([[m[1] for m in dense], [m[1] for m in sparse]])
+    return [by_id[vector_id] for vector_id in fused[:top_k]]
+
+
+# === Benchmark: hybrid vs dense-only on exact-term questions ===
+BENCH_QUERIES = [
+    ("What is IQ Lens?", "iq lens"),
+    ("Tell me about IQ Verse", "iq verse"),
+    ("What is the phone number? +91 95514 55515", "55515"),
+    ("sales@iqtechmax.com contact", "sales@iqtechmax.com"),
+    ("Is there an office in Perungudi?", "perungudi"),
+    ("Pin code 600096", "600096"),
+    ("Do you have a branch in France?", "france"),
+    ("Who is the CEO?", "ceo"),
+    ("Metaverse services", "metaverse"),
+    ("Bengaluru branch", "bengaluru"),
+]
+
+def percentile(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+if __name__ == "__main__":
+    import glob
+    import tempfile
+    from fake_servers import fake_embedding
+    from pdf_stream import iter_pdf_pages, iter_chunks
+    from local_index import build_index, LocalIndex
+
+    parser = argparse.ArgumentParser(description="Compare hybrid (BM25 + dense, RRF) and dense-only retrieval.")
+    parser.add_argument("--pdfs", default=os.getcwd(), help="folder with the PDFs (default: the repo root)")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200, help="timed runs per query")
+    args = parser.parse_args()
+
+    # Offline corpus: the PDFs chunked like trailvector.py, embedded with the fake embedding
+    ids, texts, metadatas = [], [], []
+    for path in sorted(glob.glob(os.path.join(args.pdfs, "*.pdf"))):
+        for chunk in iter_chunks(iter_pdf_pages(path)):
+            ids.append(f"{os.path.basename(path)}-{chunk['index']}")
+            texts.append(chunk["text"])
+            metadatas.append({"text": chunk["text"][:500], "page": chunk["page"]})
+    workdir = tempfile.mkdtemp(prefix="bench-hybrid-")
+    build_index(workdir, ids, [fake_embedding(t) for t in texts], metadatas)
+    store = SparseIndexStore(os.path.join(workdir, "bm25.json"))
+    store.upsert(zip(ids, texts, metadatas))
+    store.save()
+    dense_index = LocalIndex(workdir)
+    sparse_path = os.path.join(workdir, "bm25.json")
+    full_text = dict(zip(ids, texts))
+
+    def dense_only(query, vector):
+        return dense_index.search(vector, args.k)
+
+    def hybrid(query, vector):
+        return hybrid_search(query, dense_index.search(vector, args.k * HYBRID_DEPTH), args.k, sparse_path)
+
+    print(f"📚 {len(ids)} chunks, {len(BENCH_QUERIES)} exact-term queries, k={args.k}")
+    for name, retrieve in [("dense", dense_only), ("hybrid", hybrid)]:
+        hits, samples = 0, []
+        for query, expected in BENCH_QUERIES:
+            vector = fake_embedding(query)  # embedding time is the same for both, left out
+            matches = retrieve(query, vector)
+            hits += any(expected in full_text[vector_id].lower() for _, vector_id, _ in matches)
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                retrieve(query, vector)
+                samples.append(time.perf_counter() - started)
+        print(f"{name:7s} hit@{args.k} {hits}/{len(BENCH_QUERIES)}  "
+              f"p50 {percentile(samples, 50)} ms  p99 {percentile(samples, 99)} ms")
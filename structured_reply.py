@@ -0,0 +1,254 @@
+import os
+import re
+import json
+
+# Structured answer + summary replies for the trail*.py scripts.
+# With STRUCTURED_OUTPUT=1 (the default) Gemini is asked for JSON matching REPLY_SCHEMA
+# ({"response": ..., "updatedSummary": ...}, in that order), so a reply no longer has to
+# be split on "Updated Summary:" or stripped of ```json fences before json.loads.
+#
+# ReplyParser reads that object incrementally: fed the chunks of streamGenerateContent,
+# it returns the new text of the "response" string as soon as it arrives and has every
+# field once the closing brace is seen, so the summary needs no second pass.
+# parse_reply() remains the fall-back for replies that are not the expected JSON
+# (STRUCTURED_OUTPUT=0 or a model that ignores the schema).
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+STREAM_FIELD = "response"
+
+REPLY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "response": {"type": "STRING"},
+        "updatedSummary": {"type": "STRING"},
+    },
+    "required": ["response", "updatedSummary"],
+    "propertyOrdering": ["response", "updatedSummary"],  # stream the answer first
+}
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+# generationConfig asking for REPLY_SCHEMA, or None when structured output is off
+def reply_config():
+    if not STRUCTURED_OUTPUT:
+        return None
+    return {"responseMimeType": "application/json", "responseSchema": REPLY_SCHEMA}
+
+# Adds the reply generationConfig to a generateContent payload
+def with_reply_schema(payload):
+    config = reply_config()
+    if config:
+        payload["generationConfig"] = config
+    return payload
+
+
+# (answer, updated summary) from a complete reply: JSON (fenced or not), then the
+# "Updated Summary:" layout; otherwise the whole text and `summary` unchanged
+def parse_reply(text, summary=None):
+    cleaned = text.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(cleaned)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get("response"), str):
+        updated = data.get("updatedSummary")
+        return data["response"].strip(), updated.strip() if isinstance(updated, str) else summary
+    parts = text.split("Updated Summary:")
+    if len(parts) == 2:
+        return parts[0].replace("Response:", "").strip(), parts[1].strip()
+    return text.strip(), summary
+
+
+# Incremental parser for a flat JSON object of string values. Anything before the
+# opening brace (e.g. a ```json fence) and after the closing one is ignored; any other
+# shape marks the parse as failed and the caller falls back to parse_reply().
+class ReplyParser:
+    def __init__(self, stream_field=STREAM_FIELD):
+        self.stream_field = stream_field
+        self.fields = {}
+        self.raw = []  # every chunk fed, for the fall-back
+        self.failed = False
+        self.done = False
+        self._state = "start"
+        self._in_key = False
+        self._key = None
+        self._string = []
+        self._escape = ""
+
+    # Feeds one chunk; returns the text it adds to the streamed field ("" if none)
+    def feed(self, chunk):
+        self.raw.append(chunk)
+        if self.failed or self.done:
+            return ""
+        out = []
+        try:
+            self._feed(chunk, out)
+        except ValueError:
+            self.failed = True
+        return "".join(out)
+
+    # The parsed fields, or None when the object was incomplete or not as expected
+    def result(self):
+        return self.fields if self.done and not self.failed else None
+
+    def _feed(self, chunk, out):
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._state == "string":
+                if self._escape:
+                    self._escape += chunk[i]
+                    i += 1
+                    if self._escape_complete():
+                        self._append(json.loads(f'"{self._escape}"'), out)
+                        self._escape = ""
+                    continue
+                # Copy up to the next quote or backslash in one go
+                match = _STRING_SPECIAL.search(chunk, i)
+                end = match.start() if match else n
+                if end > i:
+                    self._append(chunk[i:end], out)
+                if not match:
+                    return
+                i = end + 1
+                if match.group() == "\\":
+                    self._escape = "\\"
+                else:
+                    self._end_string()
+                continue
+
+            char = chunk[i]
+            i += 1
+            if char.isspace():
+                continue
+            state = self._state
+            if state == "start":
+                if char == "{":
+                    self._state = "key_or_end"
+            elif state in ("key_or_end", "key") and char == '"':
+                self._begin_string(in_key=True)
+            elif state == "key_or_end" and char == "}":
+                self._finish()
+                return
+            elif state == "colon" and char == ":":
+                self._state = "value"
+            elif state == "value" and char == '"':
+                self._begin_string(in_key=False)
+            elif state == "comma" and char == ",":
+                self._state = "key"
+            elif state == "comma" and char == "}":
+                self._finish()
+                return
+            else:
+                raise ValueError(f"unexpected {char!r} in state {state}")
+
+    # \uXXXX needs its four digits, a high surrogate also the \uXXXX of its pair
+    def _escape_complete(self):
+        escape = self._escape
+        if len(escape) < 2 or (escape[1] == "u" and len(escape) < 6):
+            return False
+        if escape[1] == "u" and 0xD800 <= int(escape[2:6], 16) <= 0xDBFF:
+            return len(escape) >= 12
+        return True
+
+    def _begin_string(self, in_key):
+        self._state = "string"
+        self._in_key = in_key
+        self._string = []
+
+    def _append(self, text, out):
+        self._string.append(text)
+        if not self._in_key and self._key == self.stream_field:
+            out.append(text)
+
+    def _end_string(self):
+        value = "".join(self._string)
+        if self._in_key:
+            self._key = value
+            self._state = "colon"
+        else:
+            self.fields[self._key] = value
+            self._state = "comma"
+
+    def _finish(self):
+        self.done = True
+        self._state = "done"
+
+
+# Yields the "response" text of a streamed reply as it arrives. Once the stream ends,
+# `reply` (a dict) gets "response" and "updatedSummary" (`summary` if the reply had none).
+# When the reply was not the expected JSON, the part of the answer not yet shown is
+# yielded at the end.
+def stream_reply(chunks, reply=None, summary=None):
+    parser = ReplyParser()
+    shown = []
+    for chunk in chunks:
+        delta = parser.feed(chunk)
+        if delta:
+            shown.append(delta)
+            yield delta
+    fields = parser.result()
+    if fields is not None and STREAM_FIELD in fields:
+        answer, updated = fields[STREAM_FIELD].strip(), fields.get("updatedSummary", summary)
+    else:
+        answer, updated = parse_reply("".join(parser.raw), summary)
+        shown = "".join(shown).strip()
+        if answer.startswith(shown) and len(answer) > len(shown):
+            yield answer[len(shown):]
+    if reply is not None:
+        reply.update(response=answer, updatedSummary=updated.strip() if isinstance(updated, str) else updated)
+
+
+# === Check and demo: parser on arbitrary chunking, streamed vs blocking reply on the fake ===
+if __name__ == "__main__":
+    import time
+    import random
+    import argparse
+    from fake_servers import start_fake_gemini
+
+    parser = argparse.ArgumentParser(description="Check the incremental reply parser and time the first answer text.")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds between chunks of the fake")
+    parser.add_argument("--trials", type=int, default=2000, help="random chunkings checked")
+    args = parser.parse_args()
+
+    # Chunk boundaries may fall anywhere, including inside escapes and surrogate pairs
+    samples = [
+        {"response": 'Hi, I\'m "Ava".\nWe have offices in Chennai \\ Bengaluru 🚀 and Zürich\t!', "updatedSummary": ""},
+        {"response": "", "updatedSummary": "User said hi."},
+        {"updatedSummary": "Summary first", "response": "Answer é中😀 last"},
+    ]
+    rng = random.Random(0)
+    for trial in range(args.trials):
+        sample = samples[trial % len(samples)]
+        text = json.dumps(sample, ensure_ascii=trial % 2 == 0, indent=2 if trial % 3 == 0 else None)
+        if trial % 5 == 0:
+            text = f"```json\n{text}\n```"
+        cuts = sorted(rng.sample(range(1, len(text)), rng.randint(0, min(20, len(text) - 1))))
+        pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        reply_parser = ReplyParser()
+        streamed = "".join(reply_parser.feed(piece) for piece in pieces)
+        assert reply_parser.result() == sample and streamed == sample["response"], (pieces, reply_parser.fields)
+    print(f"✅ parser: {args.trials} random chunkings decoded exactly")
+
+    from http_client import get_http_client
+    import gemini_stream
+    gemini, gemini_stream.GEMINI_API_BASE = start_fake_gemini(token_delay=args.token_delay)
+    model = "gemini-1.5-flash"
+    payload = with_reply_schema({"contents": [{"parts": [{"text": "Tell me about IQ TechMax products"}]}]})
+
+    started = time.perf_counter()
+    url = f"{gemini_stream.GEMINI_API_BASE}/models/{model}:generateContent?key=fake"
+    text = get_http_client().post(url, json=payload).json()["candidates"][0]["content"]["parts"][0]["text"]
+    blocking = parse_reply(text)
+    blocking_seconds = time.perf_counter() - started
+
+    reply = {}
+    started = time.perf_counter()
+    first = None
+    for delta in stream_reply(gemini_stream.stream_generate_content(model, payload, api_key="fake"), reply):
+        first = first or time.perf_counter() - started
+    streamed_seconds = time.perf_counter() - started
+    gemini.shutdown()
+    print(f"🐢 blocking: answer after {blocking_seconds * 1000:.1f} ms")
+    print(f"⚡ streamed: first answer text after {first * 1000:.1f} ms, summary after {streamed_seconds * 1000:.1f} ms")
+    print(f"✅ same answer and summary: {(reply['response'], reply['updatedSummary']) == blocking}")
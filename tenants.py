@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from local_index import LOCAL_INDEX_DIR, LocalIndex
+from sparse_index import SparseIndex, fuse_sparse, dense_candidates
+
+# Multi-tenant routing: every buyer id gets its own slice of the vector store.
+#   Pinecone:    namespace "buyer-<slug>" in the shared index, and every vector carries a
+#                "buyer_id" metadata field that queries filter on as a second guard
+#   local index: its own index directory LOCAL_INDEX_DIR/tenants/<slug>
+# The slug is a readable form of the id plus a short sha256 of the exact id, so ids that
+# read the same ("Acme_1", "acme-1") still get separate namespaces, dirs and state files.
+# Ingest with `trailvector.py --buyer-id <id>`; retrieval takes buyer_id=... in
+# trailpine.py, trail3.py and trail4.py. No buyer id means the shared default index.
+#
+# Tenant handles (open local/sparse indexes) are created on first use and the least
+# recently used are closed beyond TENANT_CACHE_SIZE, so one process can serve many
+# buyers while keeping only the active ones in memory.
+
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "128"))
+TENANT_NAMESPACE_PREFIX = "buyer-"
+
+
+def tenant_slug(buyer_id):
+    readable = re.sub(r"[^a-z0-9]+", "-", str(buyer_id).lower()).strip("-")[:32]
+    if not readable:
+        raise ValueError(f"buyer id {buyer_id!r} has no letters or digits")
+    return f"{readable}-{hashlib.sha256(str(buyer_id).encode()).hexdigest()[:10]}"
+
+def tenant_namespace(buyer_id):
+    return TENANT_NAMESPACE_PREFIX + tenant_slug(buyer_id) if buyer_id else ""
+
+def tenant_filter(buyer_id):
+    return {"buyer_id": {"$eq": str(buyer_id)}} if buyer_id else None
+
+def tenant_local_dir(buyer_id, base_dir=LOCAL_INDEX_DIR):
+    return os.path.join(base_dir, "tenants", tenant_slug(buyer_id)) if buyer_id else base_dir
+
+# Per-tenant variant of a state file: "x_manifest.json" -> "x_manifest.buyer-42.json"
+def tenant_path(path, buyer_id):
+    if not buyer_id:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{tenant_namespace(buyer_id)}{ext}"
+
+
+class TenantHandle:
+    def __init__(self, buyer_id, sparse_path):
+        self.buyer_id = buyer_id
+        self.namespace = tenant_namespace(buyer_id)
+        self.metadata_filter = tenant_filter(buyer_id)
+        self.local_dir = tenant_local_dir(buyer_id)
+        self.sparse_path = sparse_path
+        self._local = None
+        self._sparse = None
+        self._lock = threading.Lock()
+
+    # Opened on first use and reopened after a re-ingest; None if the tenant has no index
+    def local_index(self):
+        config = os.path.join(self.local_dir, "config.json")
+        with self._lock:
+            if not os.path.exists(config):
+                return None
+            if self._local is None or os.path.getmtime(config) != self._local.config_mtime:
+                self._local = LocalIndex(self.local_dir)
+            return self._local
+
+    def sparse_index(self):
+        with self._lock:
+            if not os.path.exists(self.sparse_path):
+                return None
+            if self._sparse is None or os.path.getmtime(self.sparse_path) != self._sparse.mtime:
+                self._sparse = SparseIndex(self.sparse_path)
+            return self._sparse
+
+    # Dense matches [(score, id, metadata)] fused with this tenant's BM25 matches.
+    # remote_query(vector, top_k, namespace, metadata_filter) serves the Pinecone backends;
+    # without it the tenant's local index is searched.
+    def search(self, vector, top_k, query=None, remote_query=None):
+        depth = dense_candidates(top_k) if query else top_k
+        if remote_query:
+            dense = remote_query(vector, depth, self.namespace, self.metadata_filter)
+        else:
+            index = self.local_index()
+            dense = index.search(vector, depth) if index else []
+        return fuse_sparse(query, dense, top_k, self.sparse_index())
+
+    def close(self):
+        with self._lock:
+            self._local = None  # drops the memmaps
+            self._sparse = None
+
+
+# LRU of open tenant handles
+class TenantRouter:
+    def __init__(self, sparse_path_for, max_open=TENANT_CACHE_SIZE):
+        self.sparse_path_for = sparse_path_for
+        self.max_open = max_open
+        self.handles = OrderedDict()
+        self.opened = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, buyer_id):
+        key = str(buyer_id)
+        with self._lock:
+            handle = self.handles.get(key)
+            if handle is None:
+                handle = self.handles[key] = TenantHandle(buyer_id, self.sparse_path_for(buyer_id))
+                self.opened += 1
+                while len(self.handles) > self.max_open:
+                    _, evicted = self.handles.popitem(last=False)
+                    evicted.close()
+                    self.evictions += 1
+            else:
+                self.handles.move_to_end(key)
+            return handle
+
+    def stats(self):
+        return {"open": len(self.handles), "opened": self.opened, "evictions": self.evictions}
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+# One router per sparse-index layout and process. `sparse_path` is the default-tenant
+# BM25 file of the calling backend (tenants get tenant_path() variants of it, or
+# bm25.json inside their own directory for the local backend).
+def get_tenant(buyer_id, sparse_path, local=False):
+    key = (sparse_path, local)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            if local:
+                sparse_path_for = lambda b: os.path.join(tenant_local_dir(b), "bm25.json")
+            else:
+                sparse_path_for = lambda b: tenant_path(sparse_path, b)
+            router = _routers[key] = TenantRouter(sparse_path_for)
+    return router.get(buyer_id)
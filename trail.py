@@ -1,5 +1,8 @@
 import requests
 import os
+from http_client import get_http_client
+from gemini_stream import stream_generate_content, timed_stream
+from structured_reply import with_reply_schema, parse_reply, stream_reply
 
 def get_gemini_response(user_input):
     api_key = os.getenv("GOOGLE_API_KEY")
@@ -9,7 +12,7 @@ def get_gemini_response(user_input):
         "Content-Type": "application/json"
     }
 
-    data = {
+    data = with_reply_schema({
         "contents": [
             {
                 "parts": [
@@ -19,10 +22,10 @@ def get_gemini_response(user_input):
                 ]
             }
         ]
-    }
+    })
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = get_http_client().post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         return result['candidates'][0]['content']['parts'][0]['text']
@@ -33,7 +36,25 @@ def get_gemini_response(user_input):
         print(f"Other error: {e}")
         return None
 
-def chat(query, source, summary, embedding, role, description):
+# Streaming variant: yields the answer piece by piece (streamGenerateContent), with
+# time-to-first-token recorded by gemini_stream.py. The structured reply is parsed as it
+# arrives (structured_reply.py); `reply` gets the answer and updated summary at the end.
+# On an error it gets the same apology and unchanged summary as the blocking chat().
+def stream_gemini_response(user_input, reply=None, summary=None):
+    data = with_reply_schema({"contents": [{"parts": [{"text": user_input}]}]})
+    try:
+        yield from timed_stream(stream_reply(stream_generate_content("gemini-1.5-flash", data), reply, summary))
+    except Exception as e:
+        print(f"Request error: {e}")
+        answer = "Sorry, something went wrong."
+        if reply is not None:
+            reply.update(response=answer, updatedSummary=summary)
+        yield answer
+
+# Returns (answer, updated summary).
+# stream=True returns a generator of answer pieces instead; pass a dict as `reply` to get
+# the answer and updated summary once it is exhausted.
+def chat(query, source, summary, embedding, role, description, stream=False, reply=None):
   
 #   system_prompt=(
 #     f"You are bot, a {role} built by IQ TechMax. "
@@ -116,8 +137,12 @@ def chat(query, source, summary, embedding, role, description):
     """
 )
 
+    if stream:
+        return stream_gemini_response(system_prompt, reply, summary)
     response = get_gemini_response(system_prompt)
-    return response
+    if not response:
+        return "Sorry, something went wrong.", summary
+    return parse_reply(response, summary)
 
 # Example usage
 if __name__ == "__main__":
@@ -137,5 +162,6 @@ if __name__ == "__main__":
 * User asked if the teacher could hear them (voice chat). Teacher confirmed they could hear the user clearly and asked what the user needed.
 """
     query = input("user:")
-    response = chat(query, 'text_chat',summary, [], 'teacher', 'malar teacher from premam movie')
+    response, summary = chat(query, 'text_chat',summary, [], 'teacher', 'malar teacher from premam movie')
     print("Response:", response)
+    print("Updated summary:", summary)
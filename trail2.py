@@ -1,5 +1,7 @@
 import requests
 import os
+from http_client import get_http_client
+from structured_reply import with_reply_schema, parse_reply
 
 # Function to call Gemini API and get response
 def get_gemini_response(user_input):
@@ -10,7 +12,7 @@ def get_gemini_response(user_input):
         "Content-Type": "application/json"
     }
 
-    data = {
+    data = with_reply_schema({
         "contents": [
             {
                 "parts": [
@@ -20,10 +22,10 @@ def get_gemini_response(user_input):
                 ]
             }
         ]
-    }
+    })
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = get_http_client().post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         return result['candidates'][0]['content']['parts'][0]['text']
@@ -69,22 +71,9 @@ def chat(query, source, summary, embedding, role, description):
 
     response = get_gemini_response(system_prompt)
     if response:
-        try:
-        # Split based on "Updated Summary:" — a reliable delimiter
-            parts = response.split("Updated Summary:")
-        
-            if len(parts) == 2:
-                answer = parts[0].replace("Response:", "").strip()
-                updated_summary = parts[1].strip()
-            else:
-                answer = response.strip()
-                updated_summary = summary  # fallback to previous summary if split fails
-
-            return answer, updated_summary
-
-        except Exception as e:
-            print("Error splitting response and summary:", e)
-            return response, summary
+        # JSON reply (structured_reply.py), with the "Updated Summary:" split as fall-back;
+        # the previous summary is kept if neither works
+        return parse_reply(response, summary)
     else:
         return "Sorry, something went wrong.", summary
 
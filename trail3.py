@@ -154,10 +154,19 @@
 #####################################################
 
 import os
-import requests
-import json
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
+from http_client import get_http_client
+from local_index import RETRIEVAL_BACKEND, search_local_index
+from sparse_index import hybrid_search, dense_candidates
+from tenants import get_tenant, tenant_namespace, tenant_local_dir
+from context_packer import pack_context, PACK_CANDIDATES
+from retrieval_cache import cached_retrieval
+from answer_cache import lookup_answer, store_answer
+from trailpine import get_embedding as get_query_embedding
+from context_cache import generate_content, stream_content, get_context_cache
+from gemini_stream import stream_generate_content, timed_stream
+from structured_reply import reply_config, with_reply_schema, parse_reply, stream_reply
 
 # Load environment variables
 load_dotenv()
@@ -165,19 +174,22 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 INDEX_NAME = "iq-bot-demo1"
+# BM25 side of this index (trailvector.py writes "<index>_bm25.json"); fusion is skipped until it exists
+SPARSE_PATH = f"{INDEX_NAME}_bm25.json"
 CHAT_HISTORY_FILE = "chat_history.txt"
 SUMMARY_FILE = "chat_summary.txt"
 
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=768,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index = pc.Index(INDEX_NAME)
+# Initialize Pinecone (skipped when RETRIEVAL_BACKEND=local uses the in-process index)
+if RETRIEVAL_BACKEND != "local":
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=768,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+    index = pc.Index(INDEX_NAME)
 
 # Helper to append full chat history
 def append_chat_history(user_query, bot_response):
@@ -215,29 +227,51 @@ def update_summary(existing_summary, new_part):
         combined = combined[:500].rsplit(" ", 1)[0] + "..."
     return combined
 
-# Dummy embedding generator (to be replaced with real model)
-def get_embedding(query):
-    return [0.0] * 768
-
-# Search Pinecone for similar contexts
-def query_pinecone(query):
-    vector = get_embedding(query)
-    result = index.query(vector=vector, top_k=5, include_metadata=True)
-    context = []
-    if "matches" in result:
-        for match in result["matches"]:
-            metadata = match.get("metadata", {})
-            if "text" in metadata:
-                context.append(metadata["text"])
-    return "\n".join(context)
-
-# Get Gemini API response
+# Search Pinecone for similar contexts, packed into the token budget (context_packer.py)
+# With a buyer_id only that buyer's namespace and BM25 index are searched (tenants.py).
+# Repeated queries reuse the ranked matches of the last search (retrieval_cache.py).
+# `vector` is the query's Gemini embedding (trailpine.get_embedding).
+def query_pinecone(query, vector, buyer_id=None):
+    candidates = 5 * PACK_CANDIDATES
+    local = RETRIEVAL_BACKEND == "local"
+
+    def retrieve():
+        if not vector:  # the embedding request failed
+            return []
+        if buyer_id:
+            tenant = get_tenant(buyer_id, SPARSE_PATH, local=local)
+            return tenant.search(vector, candidates, query, None if local else query_index)
+        if local:
+            return search_local_index(vector, candidates, query=query)
+        # Fused with BM25 matches for exact terms (sparse_index.py)
+        return hybrid_search(query, query_index(vector, dense_candidates(candidates)), candidates, SPARSE_PATH)
+
+    if local:
+        matches = cached_retrieval("local", tenant_local_dir(buyer_id), query, candidates, retrieve)
+    else:
+        matches = cached_retrieval("pinecone", INDEX_NAME, query, candidates, retrieve,
+                                   namespace=tenant_namespace(buyer_id))
+    return pack_context(matches)
+
+# Raw dense matches [(score, id, metadata)] from one namespace, optionally filtered on metadata
+def query_index(vector, top_k, namespace="", metadata_filter=None):
+    result = index.query(vector=vector, top_k=top_k, include_metadata=True, namespace=namespace,
+                         filter=metadata_filter)
+    if "matches" not in result:
+        return []
+    return [(match.get("score", 0.0), match.get("id"), match.get("metadata", {})) for match in result["matches"]]
+
+CHAT_MODEL = "gemini-2.0-flash"
+# Context caching needs a stable model version
+CACHE_MODEL = "gemini-2.0-flash-001"
+
+# Get Gemini API response: the whole turn as one prompt
 def get_gemini_response(prompt):
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{CHAT_MODEL}:generateContent?key={GOOGLE_API_KEY}"
     headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
+    data = with_reply_schema({"contents": [{"parts": [{"text": prompt}]}]})
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = get_http_client().post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         return result['candidates'][0]['content']['parts'][0]['text']
@@ -245,21 +279,73 @@ def get_gemini_response(prompt):
         print(f"Gemini Error: {e}")
         return None
 
-# Chat function
-def chat(query, source, name, role, description):
-    current_summary = load_summary()
-    context = query_pinecone(query)
+# Same turn with the static persona instructions (`system_text`) served from a Gemini
+# cached context (context_cache.py); only `turn_prompt` is sent
+def get_cached_gemini_response(system_text, turn_prompt):
+    try:
+        return generate_content(CACHE_MODEL, system_text, [{"role": "user", "parts": [{"text": turn_prompt}]}],
+                                api_key=GOOGLE_API_KEY, generation_config=reply_config())
+    except Exception as e:
+        print(f"Gemini Error: {e}")
+        return None
 
-    # System prompt template
-    system_prompt = f"""
-You are {name}, a {role} built by IQ TechMax. You are designed to respond to user questions with helpful and accurate answers strictly based on the provided context. Your character: {description}.
+# Saves the summary and history of a completed reply. A reply that could not be parsed
+# (no updated summary) is kept whole in the history and not cached.
+def finish_turn(query, answer, updated_summary, scope, query_vector):
+    append_chat_history(query, answer)
+    if updated_summary is not None:
+        save_summary(updated_summary)
+        store_answer(scope, query_vector, answer)
+    return answer
+
+# Yields the answer as Gemini generates it (structured_reply.py); the summary and history
+# are saved once the reply is complete. If the stream breaks off, the history keeps the
+# part the user already saw. `cached` = (system_text, turn_prompt) streams the turn against
+# the cached persona instructions instead of sending `prompt`.
+def stream_answer(query, prompt, cached, scope, query_vector):
+    reply = {}
+    pieces = []
+    try:
+        if cached:
+            system_text, turn_prompt = cached
+            chunks = stream_content(CACHE_MODEL, system_text, [{"role": "user", "parts": [{"text": turn_prompt}]}],
+                                    api_key=GOOGLE_API_KEY, generation_config=reply_config())
+        else:
+            chunks = stream_generate_content(CHAT_MODEL, with_reply_schema({"contents": [{"parts": [{"text": prompt}]}]}),
+                                             api_key=GOOGLE_API_KEY)
+        for piece in timed_stream(stream_reply(chunks, reply)):
+            pieces.append(piece)
+            yield piece
+    except Exception as e:
+        print(f"Gemini Error: {e}")
+        if pieces:
+            finish_turn(query, "".join(pieces), None, scope, query_vector)
+        else:
+            append_chat_history(query, "No response")
+            yield "Sorry, no response from Gemini."
+        return
+    finish_turn(query, reply["response"], reply["updatedSummary"], scope, query_vector)
 
-User query: {query}
-Query source: {source}
-Context: {context}
-Chat summary so far: {current_summary if current_summary else "None yet"}
+# Chat function
+# stream=True returns a generator of answer pieces instead of the whole answer
+def chat(query, source, name, role, description, buyer_id=None, stream=False):
+    current_summary = load_summary()
 
-Instructions:
+    # Near-duplicates of earlier questions to the same persona skip retrieval and Gemini
+    # (answer_cache.py), keyed by the same query embedding used for retrieval.
+    scope = (buyer_id, name, role, description, source, bool(current_summary))
+    query_vector = get_query_embedding(query)
+    cached = lookup_answer(scope, query_vector)
+    if cached is not None:
+        append_chat_history(query, cached)
+        return iter([cached]) if stream else cached
+
+    context = query_pinecone(query, query_vector, buyer_id)
+
+    # System prompt template: the persona and instructions are the same on every turn of
+    # this persona, the query, context and summary change
+    persona = f"You are {name}, a {role} built by IQ TechMax. You are designed to respond to user questions with helpful and accurate answers strictly based on the provided context. Your character: {description}."
+    instructions = f"""Instructions:
 1. If this is the first interaction (summary is \"None yet\"), briefly introduce yourself with {name} (e.g., \"Hi, I'm {name}. How can I assist you today?\") and then answer the query.
 2. Always return your output as a valid JSON object with two keys:
    - 'response': the answer to the query.
@@ -273,35 +359,34 @@ Instructions:
    - Rephrase or condense the summary if it exceeds 512 characters.
    - The final summary must always be concise, cumulative, and within the character limit.
 7. If the answer isn't found in the context, respond with: \"I don't have relevant information on that topic based on the current context.\"
-8. If the query involves products or services, attempt to gather the following user details: Name, Contact Number, Email, and Specific Need.
-
-Now, based only on the context provided, answer the following query: {query}
-"""
-
-    # Get Gemini response
-    response_text = get_gemini_response(system_prompt)
-
-    if response_text and "response" in response_text and "updatedSummary" in response_text:
-        try:
-            cleaned_response = response_text.replace("```json", "").replace("```", "").strip()
-            response_json = json.loads(cleaned_response)
-
-            bot_answer = response_json.get("response", "").strip()
-            updated_summary = response_json.get("updatedSummary", "").strip()
-
-            # Merge and save summary
-            #combined_summary = update_summary(current_summary, updated_summary)
-            save_summary(updated_summary)
-
-            append_chat_history(query, bot_answer)
-            return bot_answer
-        except Exception as e:
-            print(f"Parsing Error: {e}")
-            append_chat_history(query, response_text)
-            return response_text
+8. If the query involves products or services, attempt to gather the following user details: Name, Contact Number, Email, and Specific Need."""
+    turn = f"""User query: {query}
+Query source: {source}
+Context: {context}
+Chat summary so far: {current_summary if current_summary else "None yet"}"""
+    question = f"Now, based only on the context provided, answer the following query: {query}"
+    prompt = f"\n{persona}\n\n{turn}\n\n{instructions}\n\n{question}\n"
+
+    # With CONTEXT_CACHE=1 and a persona prompt of at least Gemini's minimum cacheable size,
+    # the persona and instructions become a cached context and only the rest is sent
+    # (context_cache.py); otherwise `prompt` goes to CHAT_MODEL as is
+    system_prompt = f"\n{persona}\n\n{instructions}\n"
+    cached = (system_prompt, f"\n{turn}\n\n{question}\n") if get_context_cache().cacheable(system_prompt) else None
+
+    if stream:
+        return stream_answer(query, prompt, cached, scope, query_vector)
+
+    # Get Gemini response (a JSON reply, see structured_reply.py)
+    response_text = get_cached_gemini_response(*cached) if cached else get_gemini_response(prompt)
+
+    if response_text:
+        bot_answer, updated_summary = parse_reply(response_text)
+        # Merge and save summary
+        #combined_summary = update_summary(current_summary, updated_summary)
+        return finish_turn(query, bot_answer, updated_summary, scope, query_vector)
     else:
-        append_chat_history(query, response_text or "No response")
-        return response_text or "Sorry, no response from Gemini."
+        append_chat_history(query, "No response")
+        return "Sorry, no response from Gemini."
 
 # CLI usage
 if __name__ == "__main__":
@@ -311,11 +396,15 @@ if __name__ == "__main__":
         if user_input.lower() in ["exit", "quit"]:
             print("Chat ended.")
             break
-        answer = chat(
+        pieces = chat(
             query=user_input,
             source="text_chat",
             name="ktm",
             role="AI Assistant",
-            description="A helpful and strict assistant with access only to provided context."
+            description="A helpful and strict assistant with access only to provided context.",
+            stream=True
         )
-        print("Bot:", answer)
+        print("Bot:", end=" ", flush=True)
+        for piece in pieces:
+            print(piece, end="", flush=True)
+        print()
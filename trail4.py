@@ -1,8 +1,15 @@
 import os
-import requests
-import json
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
+from http_client import get_http_client
+from local_index import RETRIEVAL_BACKEND, search_local_index
+from sparse_index import hybrid_search, dense_candidates
+from tenants import get_tenant, tenant_namespace, tenant_local_dir
+from context_packer import pack_context, PACK_CANDIDATES
+from retrieval_cache import cached_retrieval
+from chat_history_index import get_history_index
+from trailpine import get_embedding as get_query_embedding
+from structured_reply import with_reply_schema, parse_reply
 
 # Load environment variables
 load_dotenv()
@@ -10,24 +17,28 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 INDEX_NAME = "iq-bot-demo1"
+# BM25 side of this index (trailvector.py writes "<index>_bm25.json"); fusion is skipped until it exists
+SPARSE_PATH = f"{INDEX_NAME}_bm25.json"
 CHAT_HISTORY_FILE = "chat_history.txt2"
 SUMMARY_FILE = "chat_summary.txt2"
+HISTORY_EMBEDDINGS = os.getenv("HISTORY_EMBEDDINGS") == "1"  # also store a Gemini embedding per history line
+
+# Initialize Pinecone (skipped when RETRIEVAL_BACKEND=local uses the in-process index)
+if RETRIEVAL_BACKEND != "local":
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=768,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+    index = pc.Index(INDEX_NAME)
 
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-if INDEX_NAME not in pc.list_indexes().names():
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=768,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index = pc.Index(INDEX_NAME)
-
-# Helper to append full chat history
+# Helper to append full chat history (indexed as it is written, see chat_history_index.py)
 def append_chat_history(user_query, bot_response):
-    with open(CHAT_HISTORY_FILE, "a", encoding="utf-8") as f:
-        f.write(f"User: {user_query}\nBot: {bot_response}\n\n")
+    get_history_index(CHAT_HISTORY_FILE).append(f"User: {user_query}\nBot: {bot_response}\n\n",
+                                                get_query_embedding if HISTORY_EMBEDDINGS else None)
 
 # Helper to load summary from file
 def load_summary():
@@ -60,42 +71,58 @@ def update_summary(existing_summary, new_part):
         combined = combined[:500].rsplit(" ", 1)[0] + "..."
     return combined
 
-# Search full chat history for relevant context
+# Search full chat history for relevant context: the last 10 lines sharing a term with
+# the query, looked up in the history index instead of re-reading the file
 def search_chat_history(query):
     if not os.path.exists(CHAT_HISTORY_FILE):
         return ""
-    with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
-        history = f.read()
-    # Simple keyword matching (can replace with embedding similarity later)
-    relevant_lines = []
-    for line in history.split("\n"):
-        if any(word.lower() in line.lower() for word in query.split()):
-            relevant_lines.append(line.strip())
-    return "\n".join(relevant_lines[-10:])  # last 10 relevant lines
-
-# Dummy embedding generator (to be replaced with real model)
-def get_embedding(query):
-    return [0.0] * 768
-
-# Search Pinecone for similar contexts
-def query_pinecone(query):
-    vector = get_embedding(query)
-    result = index.query(vector=vector, top_k=5, include_metadata=True)
-    context = []
-    if "matches" in result:
-        for match in result["matches"]:
-            metadata = match.get("metadata", {})
-            if "text" in metadata:
-                context.append(metadata["text"])
-    return "\n".join(context)
+    history_index = get_history_index(CHAT_HISTORY_FILE)
+    relevant_lines = history_index.search(query)
+    if not relevant_lines and HISTORY_EMBEDDINGS:
+        relevant_lines = history_index.similar(get_query_embedding(query))
+    return "\n".join(relevant_lines)
+
+# Search Pinecone for similar contexts, packed into the token budget (context_packer.py)
+# With a buyer_id only that buyer's namespace and BM25 index are searched (tenants.py).
+# Repeated queries reuse the ranked matches of the last search (retrieval_cache.py).
+# `vector` is the query's Gemini embedding (trailpine.get_embedding).
+def query_pinecone(query, vector, buyer_id=None):
+    candidates = 5 * PACK_CANDIDATES
+    local = RETRIEVAL_BACKEND == "local"
+
+    def retrieve():
+        if not vector:  # the embedding request failed
+            return []
+        if buyer_id:
+            tenant = get_tenant(buyer_id, SPARSE_PATH, local=local)
+            return tenant.search(vector, candidates, query, None if local else query_index)
+        if local:
+            return search_local_index(vector, candidates, query=query)
+        # Fused with BM25 matches for exact terms (sparse_index.py)
+        return hybrid_search(query, query_index(vector, dense_candidates(candidates)), candidates, SPARSE_PATH)
+
+    if local:
+        matches = cached_retrieval("local", tenant_local_dir(buyer_id), query, candidates, retrieve)
+    else:
+        matches = cached_retrieval("pinecone", INDEX_NAME, query, candidates, retrieve,
+                                   namespace=tenant_namespace(buyer_id))
+    return pack_context(matches)
+
+# Raw dense matches [(score, id, metadata)] from one namespace, optionally filtered on metadata
+def query_index(vector, top_k, namespace="", metadata_filter=None):
+    result = index.query(vector=vector, top_k=top_k, include_metadata=True, namespace=namespace,
+                         filter=metadata_filter)
+    if "matches" not in result:
+        return []
+    return [(match.get("score", 0.0), match.get("id"), match.get("metadata", {})) for match in result["matches"]]
 
 # Get Gemini API response
 def get_gemini_response(prompt):
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
     headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
+    data = with_reply_schema({"contents": [{"parts": [{"text": prompt}]}]})
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = get_http_client().post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         return result['candidates'][0]['content']['parts'][0]['text']
@@ -104,9 +131,10 @@ def get_gemini_response(prompt):
         return None
 
 # Chat function
-def chat(query, source, name, role, description):
+def chat(query, source, name, role, description, buyer_id=None):
     current_summary = load_summary()
-    context = query_pinecone(query)
+    query_vector = get_query_embedding(query)
+    context = query_pinecone(query, query_vector, buyer_id)
 
     # If the query is not answered by the summary or context
     if not context.strip():
@@ -145,27 +173,20 @@ Instructions:
 Now, based only on the context provided, answer the following query: {query}
 """
 
-    # Get Gemini response
+    # Get Gemini response (a JSON reply, see structured_reply.py)
     response_text = get_gemini_response(system_prompt)
 
-    if response_text and "response" in response_text and "updatedSummary" in response_text:
-        try:
-            cleaned_response = response_text.replace("```json", "").replace("```", "").strip()
-            response_json = json.loads(cleaned_response)
-
-            bot_answer = response_json.get("response", "").strip()
-            updated_summary = response_json.get("updatedSummary", "").strip()
+    if response_text:
+        bot_answer, updated_summary = parse_reply(response_text)
 
-            # Directly save the re-summarized content from Gemini
+        # Directly save the re-summarized content from Gemini; an unparsed reply is
+        # kept whole in the history
+        if updated_summary is not None:
             save_summary(updated_summary)
 
-            # Append the conversation to chat history
-            append_chat_history(query, bot_answer)
-            return bot_answer
-        except Exception as e:
-            print(f"Parsing Error: {e}")
-            append_chat_history(query, response_text)
-            return response_text
+        # Append the conversation to chat history
+        append_chat_history(query, bot_answer)
+        return bot_answer
     else:
         append_chat_history(query, response_text or "No response")
         return response_text or "Sorry, no response from Gemini."
@@ -1,41 +1,88 @@
 import requests
 import os
 from dotenv import load_dotenv
+from http_client import get_http_client
+from embedding_cache import cached_embedding
+from local_index import RETRIEVAL_BACKEND, search_local_index
+from sparse_index import hybrid_search, dense_candidates
+from tenants import get_tenant, tenant_namespace, tenant_local_dir
+from context_packer import pack_context, PACK_CANDIDATES
+from retrieval_cache import cached_retrieval
+from answer_cache import lookup_answer, store_answer
+from gemini_stream import stream_generate_content, timed_stream
+from structured_reply import with_reply_schema, parse_reply, stream_reply
 
 # Load environment variables
 load_dotenv()
 
+INDEX_NAME = "iq-bot-demo"
+# BM25 side of this index (trailvector.py writes "<index>_bm25.json"); fusion is skipped until it exists
+SPARSE_PATH = f"{INDEX_NAME}_bm25.json"
+
 # === Helper: Generate Embedding from Gemini ===
+# Repeated questions are served from the shared embedding cache (embedding_cache.py)
 def get_embedding(text):
+    return cached_embedding("models/embedding-001", "retrieval_query", text, fetch_embedding) or []
+
+def fetch_embedding(text):
     api_key = os.getenv("GOOGLE_API_KEY")
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/embedding-001:embedContent?key={api_key}"
+    api_base = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")  # or fake_servers.py
+    url = f"{api_base}/models/embedding-001:embedContent?key={api_key}"
     headers = {"Content-Type": "application/json"}
     data = {
         "model": "models/embedding-001",
-        "content": text,
-        "task_type": "retrieval_query"
+        "content": {"parts": [{"text": text}]},
+        "task_type": "RETRIEVAL_QUERY"
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = get_http_client().post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
-        return result["embedding"]
+        return result["embedding"]["values"]
     except Exception as e:
         print("Embedding error:", e)
         return []
 
 # === Helper: Query Pinecone using REST API ===
-def get_context_from_pinecone(query, top_k=3):
-    vector = get_embedding(query)
-    if not vector:
+# Dense matches are fused with BM25 matches for exact terms (sparse_index.py), then
+# overlapping chunks are merged and packed into the token budget (context_packer.py).
+# With a buyer_id only that buyer's namespace and BM25 index are searched (tenants.py).
+# Repeated queries reuse the ranked matches of the last search (retrieval_cache.py).
+def get_context_from_pinecone(query, top_k=3, buyer_id=None):
+    candidates = top_k * PACK_CANDIDATES
+    retrieve = lambda: search_pinecone(query, candidates, buyer_id)
+    try:
+        if RETRIEVAL_BACKEND == "local":
+            matches = cached_retrieval("local", tenant_local_dir(buyer_id), query, candidates, retrieve)
+        else:
+            matches = cached_retrieval("pinecone", INDEX_NAME, query, candidates, retrieve,
+                                       namespace=tenant_namespace(buyer_id))
+        return pack_context(matches)
+    except Exception as e:
+        print("Pinecone REST query error:", e)
         return ""
 
+# The ranked matches [(score, id, metadata)] behind it, uncached
+def search_pinecone(query, top_k=3, buyer_id=None):
+    vector = get_embedding(query)
+    if not vector:
+        return []
+    local = RETRIEVAL_BACKEND == "local"
+    if buyer_id:
+        tenant = get_tenant(buyer_id, SPARSE_PATH, local=local)
+        return tenant.search(vector, top_k, query, None if local else query_pinecone)
+    if local:
+        return search_local_index(vector, top_k, query=query)
+    return hybrid_search(query, query_pinecone(vector, dense_candidates(top_k)), top_k, SPARSE_PATH)
+
+# Raw dense matches [(score, id, metadata)] from one namespace, optionally filtered on metadata
+def query_pinecone(vector, top_k, namespace="", metadata_filter=None):
     PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
     PINECONE_ENV = os.getenv("PINECONE_ENV")
-    INDEX_NAME = "iq-bot-demo"
 
-    url = f"https://{INDEX_NAME}-{PINECONE_ENV}.svc.pinecone.io/query"
+    host = os.getenv("PINECONE_HOST", f"https://{INDEX_NAME}-{PINECONE_ENV}.svc.pinecone.io")  # or fake_servers.py
+    url = f"{host}/query"
     headers = {
         "Content-Type": "application/json",
         "Api-Key": PINECONE_API_KEY
@@ -44,18 +91,17 @@ def get_context_from_pinecone(query, top_k=3):
     payload = {
         "vector": vector,
         "topK": top_k,
-        "includeMetadata": True
+        "includeMetadata": True,
+        "namespace": namespace
     }
+    if metadata_filter:
+        payload["filter"] = metadata_filter
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        results = response.json()
-        contexts = [match["metadata"].get("text", "") for match in results.get("matches", [])]
-        return "\n".join(contexts)
-    except Exception as e:
-        print("Pinecone REST query error:", e)
-        return ""
+    response = get_http_client().post(url, headers=headers, json=payload)
+    response.raise_for_status()
+    results = response.json()
+    return [(match.get("score", 0.0), match["id"], match.get("metadata", {}))
+            for match in results.get("matches", [])]
 
 # === Gemini API Request ===
 def get_gemini_response(user_input):
@@ -65,7 +111,7 @@ def get_gemini_response(user_input):
         "Content-Type": "application/json"
     }
 
-    data = {
+    data = with_reply_schema({
         "contents": [
             {
                 "parts": [
@@ -75,10 +121,10 @@ def get_gemini_response(user_input):
                 ]
             }
         ]
-    }
+    })
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = get_http_client().post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         return result['candidates'][0]['content']['parts'][0]['text']
@@ -89,10 +135,37 @@ def get_gemini_response(user_input):
         print(f"Other error: {e}")
         return None
 
+# === Streamed answer ===
+# Yields the answer as Gemini generates it (structured_reply.py); `reply` gets the answer
+# and updated summary at the end, when the answer is also added to the answer cache
+def stream_answer(system_prompt, summary, scope, query_vector, reply):
+    data = with_reply_schema({"contents": [{"parts": [{"text": system_prompt}]}]})
+    try:
+        yield from timed_stream(stream_reply(stream_generate_content("gemini-1.5-flash", data), reply, summary))
+    except Exception as e:  # e.g. a malformed stream line, not only network errors
+        print(f"Request error: {e}")
+        reply.update(response="Sorry, something went wrong.", updatedSummary=summary)
+        yield reply["response"]
+        return
+    store_answer(scope, query_vector, reply["response"])
+
 # === Main Chat Logic ===
-def chat(query, source, summary, role, description):
+# Returns (answer, updated summary). stream=True returns a generator of answer pieces
+# instead; pass a dict as `reply` to get the answer and updated summary once it is exhausted.
+def chat(query, source, summary, role, description, buyer_id=None, stream=False, reply=None):
+    reply = {} if reply is None else reply
+    # Near-duplicates of earlier questions to the same persona are answered from the
+    # semantic answer cache (answer_cache.py); the first turn is cached separately
+    # because it carries the bot's introduction
+    scope = (buyer_id, role, description, source, bool(summary))
+    query_vector = get_embedding(query)
+    cached = lookup_answer(scope, query_vector)
+    if cached is not None:
+        reply.update(response=cached, updatedSummary=summary)
+        return iter([cached]) if stream else (cached, summary)
+
     # Get embedding-based context
-    context = get_context_from_pinecone(query)
+    context = get_context_from_pinecone(query, buyer_id=buyer_id)
 
     # Build the system prompt
     system_prompt = (
@@ -127,20 +200,15 @@ def chat(query, source, summary, role, description):
     """
     )
 
+    if stream:
+        return stream_answer(system_prompt, summary, scope, query_vector, reply)
     response = get_gemini_response(system_prompt)
     if response:
-        try:
-            parts = response.split("Updated Summary:")
-            if len(parts) == 2:
-                answer = parts[0].replace("Response:", "").strip()
-                updated_summary = parts[1].strip()
-            else:
-                answer = response.strip()
-                updated_summary = summary  # fallback
-            return answer, updated_summary
-        except Exception as e:
-            print("Error splitting response and summary:", e)
-            return response, summary
+        # JSON reply, with the "Updated Summary:" split as fall-back (structured_reply.py)
+        answer, updated_summary = parse_reply(response, summary)
+        store_answer(scope, query_vector, answer)
+        reply.update(response=answer, updatedSummary=updated_summary)
+        return answer, updated_summary
     else:
         return "Sorry, something went wrong.", summary
 
@@ -158,8 +226,10 @@ if __name__ == "__main__":
             print("Exiting chat. Goodbye!")
             break
 
-        response, summary = chat(query, source, summary, role, description)
-        response = response.replace("*", "")
-        summary = summary.replace("*", "")
-        print("\nBot:", response)
-        print("Summary:", summary)
+        # The answer is printed as it streams in, the summary once the reply is complete
+        reply = {}
+        print("\nBot:", end=" ", flush=True)
+        for piece in chat(query, source, summary, role, description, stream=True, reply=reply):
+            print(piece.replace("*", ""), end="", flush=True)
+        summary = reply["updatedSummary"].replace("*", "")
+        print("\nSummary:", summary)
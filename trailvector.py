@@ -1,7 +1,20 @@
 import os
+import time
+import argparse
 import requests
 import json
-import pdfplumber
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pdf_stream import iter_pdf_pages, iter_chunks, iter_token_chunks
+from dedup import NearDuplicateFilter
+from sparse_index import SparseIndexStore, SPARSE_INDEX_PATH
+from embedding_cache import get_cache, cached_embedding, cached_embeddings
+from local_index import LocalIndexStore, LOCAL_INDEX_DIR, LOCAL_INDEX_QUANTIZATION
+from tenants import tenant_namespace, tenant_local_dir, tenant_path
+from retrieval_cache import bump_index_version
+from http_client import HttpClient, get_http_client
+from pdf_parallel import parallel_extract, iter_file_results, DEFAULT_WORKERS
+from index_manifest import (load_manifest, save_manifest, file_hash, chunk_hash, file_unchanged,
+                            diff_chunks, removed_files, record_file, forget_file)
 import pinecone
 from dotenv import load_dotenv
 
@@ -13,13 +26,39 @@ PINECONE_ENV = os.getenv("PINECONE_ENV")  # e.g. "us-west2-aws"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 INDEX_NAME = "iq-bot-demo2"
 
+# Embedding settings (GEMINI_API_BASE can point at fake_servers.py for local runs)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+EMBED_MODEL = "models/embedding-001"
+EMBED_BATCH_SIZE = 100  # batchEmbedContents accepts at most 100 requests per call
+EMBED_CONCURRENCY = 4
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF = 0.5  # seconds, doubled on every retry
+
+# Upsert settings: Pinecone caps a request at 1000 vectors / 2 MB
+UPSERT_MAX_VECTORS = 100
+UPSERT_MAX_BYTES = 1_500_000
+UPSERT_CONCURRENCY = 4
+UPSERT_MAX_RETRIES = 5
+
+# Remembers which files/chunks are already in the index (see index_manifest.py)
+MANIFEST_PATH = f"{INDEX_NAME}_manifest.json"
+# Chunks acknowledged by Pinecone for files not yet recorded in the manifest,
+# so an interrupted ingest resumes from the last acknowledged batch
+CHECKPOINT_PATH = f"{INDEX_NAME}_checkpoint.json"
+
 # Debug prints (optional)
 print("PINECONE_API_KEY:", bool(PINECONE_API_KEY))
 print("PINECONE_ENV:", bool(PINECONE_ENV))
 print("GOOGLE_API_KEY:", bool(GOOGLE_API_KEY))
 
-# Safety check
-assert PINECONE_API_KEY and PINECONE_ENV and GOOGLE_API_KEY, "❌ Missing environment variables. Check your .env file."
+# Safety check (Pinecone keys are only needed for the Pinecone backend, see __main__)
+assert GOOGLE_API_KEY, "❌ Missing environment variables. Check your .env file."
+
+PINECONE_HOST = os.getenv("PINECONE_HOST", f"https://{INDEX_NAME}-{PINECONE_ENV}.svc.pinecone.io")
+
+# Chunkers selectable with --chunker; "chars" keeps the original 1000-char windows
+# (and vector ids), "tokens" packs whole sentences up to a token budget (pdf_stream.py)
+CHUNKERS = {"chars": iter_chunks, "tokens": iter_token_chunks}
 
 # === Step 0: Create Pinecone Index if not exists ===
 def create_pinecone_index():
@@ -36,16 +75,12 @@ def create_pinecone_index():
         print(f"ℹ️ Index '{INDEX_NAME}' already exists.")
 
 # === Step 1: Extract PDF text ===
+# Whole-document helper; the ingest itself streams pages (see pdf_stream.py / pdf_parallel.py)
 def extract_text_from_pdf(file_path):
-    full_text = ""
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                full_text += page_text + "\n"
-    return full_text
+    return "".join(page_text + "\n" for _, page_text in iter_pdf_pages(file_path))
 
 # === Step 2: Chunk text ===
+# Whole-text helper; the ingest itself uses pdf_stream.iter_chunks, which yields the same chunks
 def chunk_text(text, chunk_size=1000, overlap=150):
     chunks = []
     start = 0
@@ -57,12 +92,16 @@ def chunk_text(text, chunk_size=1000, overlap=150):
     return chunks
 
 # === Step 3: Get embeddings from Gemini ===
+# Goes through the shared on-disk embedding cache (embedding_cache.py) first
 def get_embedding(text):
+    return cached_embedding(EMBED_MODEL, "", text, fetch_embedding)
+
+def fetch_embedding(text):
     api_key = os.getenv("GOOGLE_API_KEY")
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/embedding-001:embedContent?key={api_key}"
+    url = f"{GEMINI_API_BASE}/{EMBED_MODEL}:embedContent?key={api_key}"
     headers = {"Content-Type": "application/json"}
     payload = {
-        "model": "models/embedding-001",
+        "model": EMBED_MODEL,
         "content": {
             "parts": [
                 {
@@ -73,64 +112,359 @@ def get_embedding(text):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        response = get_http_client().post(url, headers=headers, json=payload)
         result = response.json()
-        return result["embedding"]
+        return result["embedding"]["values"]
     except Exception as e:
         print("❌ Embedding error:", e)
         return None
 
-# === Step 4: Upsert to Pinecone without SDK ===
-def upsert_to_pinecone(vectors):
-    url = f"https://{INDEX_NAME}-{PINECONE_ENV}.svc.pinecone.io/vectors/upsert"
-    headers = {
-        "Content-Type": "application/json",
-        "Api-Key": PINECONE_API_KEY
-    }
+# === Step 3b: Batched, concurrent embeddings ===
+# One pooled client (http_client.py) shared by all worker threads so connections are kept alive
+def create_embedding_session(pool_size=EMBED_CONCURRENCY):
+    return HttpClient(pool_size=pool_size, timeout=60, deadline=600, max_retries=EMBED_MAX_RETRIES,
+                      backoff=EMBED_BACKOFF)
 
+# Embed up to EMBED_BATCH_SIZE texts in one batchEmbedContents call (the client retries 429/5xx)
+def get_embeddings_batch(texts, session):
+    api_key = os.getenv("GOOGLE_API_KEY")
+    url = f"{GEMINI_API_BASE}/{EMBED_MODEL}:batchEmbedContents?key={api_key}"
     payload = {
-        "vectors": vectors,
-        "namespace": ""  # optional
+        "requests": [
+            {"model": EMBED_MODEL, "content": {"parts": [{"text": text}]}}
+            for text in texts
+        ]
     }
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        print(f"✅ Upserted {len(vectors)} vectors.")
-    except Exception as e:
+        response = session.post(url, json=payload)
+        return [item["values"] for item in response.json()["embeddings"]]
+    except requests.exceptions.RequestException as e:
+        print("❌ Batch embedding error:", e)
+        return [None] * len(texts)
+
+# Embed all chunks in batches, running up to `concurrency` batches at once.
+# Cached chunks are not sent again. Returns embeddings in the same order as `chunks`
+# (None where a batch failed).
+def embed_chunks(chunks, session, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY):
+    def embed_uncached(texts):
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        embeddings = []
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for batch_embeddings in executor.map(lambda batch: get_embeddings_batch(batch, session), batches):
+                embeddings.extend(batch_embeddings)
+        return embeddings
+
+    if not chunks:
+        return []
+    return cached_embeddings(EMBED_MODEL, "", chunks, embed_uncached)
+
+# === Step 4: Upsert to Pinecone without SDK ===
+def create_pinecone_session(pool_size=UPSERT_CONCURRENCY):
+    return HttpClient(pool_size=pool_size, timeout=60, deadline=600, max_retries=UPSERT_MAX_RETRIES,
+                      backoff=EMBED_BACKOFF, headers={"Api-Key": PINECONE_API_KEY})
+
+# Split vectors into request bodies of at most UPSERT_MAX_VECTORS vectors and
+# UPSERT_MAX_BYTES bytes. Vectors are serialized once here and the JSON is sent as-is.
+# Yields (ids, body).
+def split_upsert_batches(vectors, namespace=""):
+    head = '{"namespace": ' + json.dumps(namespace) + ', "vectors": ['
+    tail = "]}"
+    ids, parts, size = [], [], len(head) + len(tail)
+    for vector in vectors:
+        part = json.dumps(vector)
+        if parts and (len(parts) >= UPSERT_MAX_VECTORS or size + len(part) + 1 > UPSERT_MAX_BYTES):
+            yield ids, head + ",".join(parts) + tail
+            ids, parts, size = [], [], len(head) + len(tail)
+        ids.append(vector["id"])
+        parts.append(part)
+        size += len(part) + 1
+    if parts:
+        yield ids, head + ",".join(parts) + tail
+
+# POST one upsert body (the client retries 429/5xx and connection errors with backoff)
+def upsert_batch(body, session):
+    url = f"{PINECONE_HOST}/vectors/upsert"
+    try:
+        session.post(url, data=body.encode("utf-8"))
+        return True
+    except requests.exceptions.RequestException as e:
         print("❌ Upsert error:", e)
+        return False
+
+# Upsert in size-bounded batches, UPSERT_CONCURRENCY at a time over one keep-alive session.
+# on_acknowledged(ids) is called from this thread after every batch Pinecone accepted.
+# Returns True only if every batch was accepted.
+def upsert_to_pinecone(vectors, session=None, on_acknowledged=None, namespace=""):
+    session = session or create_pinecone_session()
+    ok = True
+    acknowledged = 0
+
+    with ThreadPoolExecutor(max_workers=UPSERT_CONCURRENCY) as executor:
+        futures = {executor.submit(upsert_batch, body, session): ids
+                   for ids, body in split_upsert_batches(vectors, namespace)}
+        for future in as_completed(futures):
+            if future.result():
+                acknowledged += len(futures[future])
+                if on_acknowledged:
+                    on_acknowledged(futures[future])
+            else:
+                ok = False
+
+    if acknowledged:
+        bump_index_version("pinecone", INDEX_NAME, namespace)  # drops cached retrievals (retrieval_cache.py)
+    print(f"✅ Upserted {acknowledged}/{len(vectors)} vectors.")
+    return ok
+
+# === Step 4b: Delete stale vectors ===
+def delete_from_pinecone(ids, session=None, batch_size=1000, namespace=""):
+    url = f"{PINECONE_HOST}/vectors/delete"
+    session = session or create_pinecone_session()
+
+    try:
+        for start in range(0, len(ids), batch_size):
+            payload = {"ids": ids[start:start + batch_size], "namespace": namespace}
+            session.post(url, json=payload)
+        bump_index_version("pinecone", INDEX_NAME, namespace)
+        print(f"🗑️ Deleted {len(ids)} stale vectors.")
+        return True
+    except Exception as e:
+        print("❌ Delete error:", e)
+        return False
 
 # === Step 5: Main function ===
-def process_pdf_folder(folder_path):
-    for file in os.listdir(folder_path):
-        if not file.lower().endswith(".pdf"):
-            continue
+# Embed and upsert one batch of (vector_id, chunk) pairs. Returns (ok, ids whose embedding failed).
+# `upsert(vectors, on_acknowledged)` writes to the selected backend; `metadata` is added to every vector
+def embed_and_upsert(pending, session, batched, batch_size, concurrency, upsert, on_acknowledged=None,
+                     metadata=None):
+    texts = [chunk["text"] for _, chunk in pending]
+    if batched:
+        embeddings = embed_chunks(texts, session, batch_size, concurrency)
+    else:
+        embeddings = [get_embedding(text) for text in texts]
+
+    vectors = []
+    failed = set()
+    for (vector_id, chunk), embedding in zip(pending, embeddings):
+        if embedding:
+            vectors.append({
+                "id": vector_id,
+                "values": embedding,
+                "metadata": {
+                    "text": chunk["text"][:500],  # Optional metadata
+                    "page": chunk["page"],
+                    "offset": chunk["offset"],
+                    **(metadata or {})
+                }
+            })
+        else:
+            failed.add(vector_id)
+
+    ok = upsert(vectors, on_acknowledged) if vectors else True
+    return ok, failed
+
+# Pages are streamed through extract -> chunk -> embed -> upsert, holding at most
+# `batch_size * concurrency` chunks in memory at once. Page extraction is spread over
+# `workers` processes (pdf_parallel.py); files are still handled in name order.
+# Only new or changed chunks are embedded; unchanged files are skipped without being parsed.
+# Pass incremental=False to ignore the manifest and re-embed everything.
+# backend="local" writes to the in-process index in LOCAL_INDEX_DIR (local_index.py) instead of Pinecone,
+# optionally with quantized codes ("int8" or "pq", see quantize.py).
+# buyer_id ingests into that buyer's namespace / index directory with its own manifest (tenants.py).
+def process_pdf_folder(folder_path, batched=True, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY,
+                       incremental=True, manifest_path=None, workers=DEFAULT_WORKERS,
+                       checkpoint_path=None, backend="pinecone",
+                       quantization=LOCAL_INDEX_QUANTIZATION, chunker="chars", dedup=True, buyer_id=None):
+    session = create_embedding_session(concurrency) if batched else None
+    tenant_metadata = {"buyer_id": str(buyer_id)} if buyer_id else None
+    if backend == "local":
+        # The local index (and its manifest) is written once at the end of the run,
+        # so it needs no checkpoint; an interrupted run is simply redone from the cache
+        index_dir = tenant_local_dir(buyer_id, LOCAL_INDEX_DIR)
+        store = LocalIndexStore(index_dir, quantization=quantization)
+        upsert = store.upsert
+        delete = store.delete
+        manifest_path = manifest_path or os.path.join(index_dir, "manifest.json")
+        sparse_path = os.path.join(index_dir, "bm25.json")
+    else:
+        store = None
+        namespace = tenant_namespace(buyer_id)
+        pinecone_session = create_pinecone_session()
+        upsert = lambda vectors, on_acknowledged: upsert_to_pinecone(vectors, pinecone_session, on_acknowledged,
+                                                                     namespace)
+        delete = lambda ids: delete_from_pinecone(ids, pinecone_session, namespace=namespace)
+        manifest_path = manifest_path or tenant_path(MANIFEST_PATH, buyer_id)
+        checkpoint_path = checkpoint_path or tenant_path(CHECKPOINT_PATH, buyer_id)
+        sparse_path = tenant_path(SPARSE_INDEX_PATH, buyer_id)
+    # BM25 index of the full chunk texts, kept in step with the vectors (sparse_index.py)
+    sparse = SparseIndexStore(sparse_path)
+    delete_vectors = delete
+
+    def delete(ids):
+        sparse.delete(ids)
+        return delete_vectors(ids)
+
+    def sparse_record(vector_id, chunk):
+        return vector_id, chunk["text"], dict(tenant_metadata or {}, page=chunk["page"], offset=chunk["offset"])
+
+    manifest = load_manifest(manifest_path) if incremental else {"files": {}}
+    checkpoint = load_manifest(checkpoint_path) if incremental and store is None else {"files": {}}
+    pdf_files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".pdf"))
+    # Near-duplicate chunks (repeated boilerplate, see dedup.py) are not embedded; the
+    # filter's state lives in the manifest so later runs compare against the whole corpus
+    duplicate_filter = NearDuplicateFilter(manifest.get("minhash"), manifest.get("duplicates")) if dedup else None
+    skipped_duplicates = 0
+    window = batch_size * concurrency if batched else batch_size
+    total_chunks = 0
+    started = time.perf_counter()
+
+    # Chunks that left the index or changed text can no longer stand in for their
+    # duplicates: the files holding those duplicates lose their hash so they are processed
+    # again. Returns those files.
+    def forget_chunks(ids):
+        if duplicate_filter is None:
+            return set()
+        orphans = duplicate_filter.remove(ids) | duplicate_filter.take_orphans()
+        stale_files = {vector_id.rsplit("-", 1)[0] for vector_id in orphans}
+        for stale_file in stale_files:
+            entry = manifest["files"].get(stale_file)
+            if entry:
+                entry["hash"] = None
+        manifest["minhash"], manifest["duplicates"] = duplicate_filter.to_manifest()
+        return stale_files
+
+    # PDFs that were removed from the folder take their vectors with them
+    for file, ids in removed_files(manifest, pdf_files).items():
+        print(f"🗑️ {file} was removed from the folder.")
+        if delete(ids):
+            forget_file(manifest, file)
+            forget_chunks(ids)
+            if store is None:
+                sparse.commit()
+                save_manifest(manifest, manifest_path)
 
+    changed = {}
+    for file in pdf_files:
         file_path = os.path.join(folder_path, file)
+        current_hash = file_hash(file_path)
+        if file_unchanged(manifest, file, current_hash):
+            print(f"⏭️ {file} unchanged, skipping.")
+            continue
+        changed[file_path] = (file, current_hash)
+
+    for file_path, pages in iter_file_results(parallel_extract(list(changed), workers)):
+        file, current_hash = changed[file_path]
         print(f"📄 Processing {file}...")
-        raw_text = extract_text_from_pdf(file_path)
-        chunks = chunk_text(raw_text)
-
-        vectors = []
-        for i, chunk in enumerate(chunks):
-            embedding = get_embedding(chunk)
-            if embedding:
-                vector_id = f"{file}-{i}"
-                vectors.append({
-                    "id": vector_id,
-                    "values": embedding,
-                    "metadata": {
-                        "text": chunk[:500]  # Optional metadata
-                    }
-                })
-
-        if vectors:
-            upsert_to_pinecone(vectors)
+        file_started = time.perf_counter()
+        # Chunks acknowledged before an interruption count as already indexed
+        known = dict(manifest["files"].get(file, {}).get("chunks", {}))
+        known.update(checkpoint["files"].get(file, {}).get("chunks", {}))
+        if file in checkpoint["files"]:
+            print(f"↩️ Resuming {file} from checkpoint.")
+        chunk_hashes = {}
+        pending = []
+        failed = set()
+        embedded = 0
+        ok = True
+
+        def acknowledge(ids):
+            entry = checkpoint["files"].setdefault(file, {"hash": None, "chunks": {}})
+            entry["chunks"].update({vid: chunk_hashes[vid] for vid in ids})
+            save_manifest(checkpoint, checkpoint_path)
+
+        def flush(pending):
+            nonlocal ok, failed, embedded
+            batch_ok, batch_failed = embed_and_upsert(pending, session, batched, batch_size, concurrency,
+                                                      upsert, None if store is not None else acknowledge,
+                                                      tenant_metadata)
+            sparse.upsert(sparse_record(vid, chunk) for vid, chunk in pending if vid not in batch_failed)
+            ok = ok and batch_ok
+            failed |= batch_failed
+            embedded += len(pending)
+
+        duplicates = 0
+
+        for chunk in CHUNKERS[chunker](pages):
+            vector_id = f"{file}-{chunk['index']}"
+            text_hash = chunk_hash(chunk["text"])
+            if known.get(vector_id) != text_hash:
+                if duplicate_filter and duplicate_filter.check(vector_id, chunk["text"]) is not None:
+                    duplicates += 1
+                    continue
+                pending.append((vector_id, chunk))
+            elif vector_id not in sparse.records:  # acknowledged (checkpoint) but not yet committed to bm25
+                sparse.upsert([sparse_record(vector_id, chunk)])
+            chunk_hashes[vector_id] = text_hash
+            if len(pending) >= window:
+                flush(pending)
+                pending = []
+        if pending:
+            flush(pending)
+
+        _, to_delete = diff_chunks(manifest, file, chunk_hashes)
+        if to_delete:
+            ok = delete(to_delete) and ok
+        stale_files = forget_chunks(list(to_delete) + sorted(failed))
+
+        elapsed = time.perf_counter() - file_started
+        total_chunks += embedded
+        skipped_duplicates += duplicates
+        print(f"🧩 {len(chunk_hashes)} chunks, {embedded} new or changed, {len(to_delete)} stale, "
+              f"{duplicates} near-duplicates skipped.")
+        print(f"⏱️ {file} done in {elapsed:.2f}s ({embedded / max(elapsed, 1e-9):.1f} chunks/sec)")
+
+        if ok:
+            # Chunks whose embedding failed stay out of the manifest (and the file hash is
+            # left empty) so the next run picks them up again; so do orphaned duplicates
+            recorded = {vid: h for vid, h in chunk_hashes.items() if vid not in failed}
+            record_file(manifest, file, None if failed or file in stale_files else current_hash, recorded)
+            if store is None:
+                # bm25 changes go to its journal before the manifest records them (sparse_index.py)
+                sparse.commit()
+                save_manifest(manifest, manifest_path)
+                forget_file(checkpoint, file)
+                save_manifest(checkpoint, checkpoint_path)
+        else:
+            # Nothing of this file is recorded, so its new chunks cannot be duplicate targets
+            forget_chunks([vid for vid, h in chunk_hashes.items() if known.get(vid) != h])
+    sparse.save()
+    if store is not None:
+        store.save()
+        save_manifest(manifest, manifest_path)
+
+    elapsed = time.perf_counter() - started
+    print(f"📊 {total_chunks} chunks in {elapsed:.2f}s ({total_chunks / max(elapsed, 1e-9):.1f} chunks/sec overall)")
+    print(f"🗄️ Embedding cache: {get_cache().stats()}")
+    if duplicate_filter:
+        print(f"♻️ {skipped_duplicates} near-duplicate chunks skipped, "
+              f"{len(duplicate_filter.duplicates)} in the corpus.")
+    return total_chunks
 
 # === Entry point ===
 if __name__ == "__main__":
-    create_pinecone_index()  # 👈 Ensure index exists before processing
-    pdf_folder = os.path.join(os.getcwd(), "IQ_TechMax")
-    process_pdf_folder(pdf_folder)
-    print("✅ All PDFs processed and uploaded to Pinecone.")
+    parser = argparse.ArgumentParser(description="Embed the PDFs in a folder and upload them to Pinecone.")
+    parser.add_argument("folder", nargs="?", default=os.path.join(os.getcwd(), "IQ_TechMax"))
+    parser.add_argument("--sequential", action="store_true", help="embed one chunk per request (legacy mode)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-embed every chunk")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="processes used to parse PDFs")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default="pinecone",
+                        help="write to Pinecone or to the in-process index (local_index.py)")
+    parser.add_argument("--quantization", choices=["int8", "pq"], default=LOCAL_INDEX_QUANTIZATION,
+                        help="local backend only: scan int8 or PQ codes in memory, re-score exactly on float32 (quantize.py)")
+    parser.add_argument("--chunker", choices=sorted(CHUNKERS), default="chars",
+                        help="1000-char windows or sentence chunks within a token budget (changes vector ids)")
+    parser.add_argument("--no-dedup", action="store_true", help="embed near-duplicate chunks too")
+    parser.add_argument("--buyer-id", help="ingest into this buyer's namespace instead of the shared one (tenants.py)")
+    args = parser.parse_args()
+
+    if args.backend == "pinecone":
+        assert PINECONE_API_KEY and PINECONE_ENV, "❌ Missing environment variables. Check your .env file."
+        create_pinecone_index()  # 👈 Ensure index exists before processing
+    process_pdf_folder(args.folder, batched=not args.sequential,
+                       batch_size=args.batch_size, concurrency=args.concurrency,
+                       incremental=not args.full, workers=args.workers, backend=args.backend,
+                       quantization=args.quantization, chunker=args.chunker, dedup=not args.no_dedup,
+                       buyer_id=args.buyer_id)
+    print(f"✅ All PDFs processed and uploaded to {args.backend}.")